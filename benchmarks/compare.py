@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide a performance
+regression gate: the scientific functions benchmarks are
+run and compared with a stored baseline, the gate fails
+when any function is slower than the baseline beyond a
+given threshold.
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+from benchmarks.scaling import (BENCHMARKS, run_benchmarks, write_results,
+                                read_results)
+
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baseline.json')
+DEFAULT_OUTPUT = 'benchmark_results.json'
+DEFAULT_SIZES = [10000]
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MIN_DELTA = 0.05
+DEFAULT_METRIC = 'wall_time'
+
+# The gate covers the scientific functions, the whole
+# workflow is dominated by I/O and left to run_benchmarks
+GATE_BENCHMARKS = [benchmark[0] for benchmark in BENCHMARKS
+                   if benchmark[0] != 'Workflow']
+
+STATUS_OK = 'ok'
+STATUS_REGRESSION = 'REGRESSION'
+STATUS_IMPROVEMENT = 'improvement'
+STATUS_BROKEN = 'BROKEN'
+STATUS_ERROR = 'error'
+STATUS_NEW = 'new'
+STATUS_MISSING = 'missing'
+STATUS_SKIPPED = 'skipped'
+
+FAILURE_STATUSES = (STATUS_REGRESSION, STATUS_BROKEN)
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD,
+            min_delta=DEFAULT_MIN_DELTA, metric=DEFAULT_METRIC):
+    """
+    Compare two benchmark runs, measurements are
+    matched by benchmark name and catalogue size.
+    A benchmark regresses when its time grows more
+    than threshold (relative) and more than min_delta
+    seconds (absolute, to ignore timer noise on fast
+    functions), it is broken when it fails in the
+    current run while it succeeded in the baseline.
+    A benchmark failing in both runs doesn't fail the gate.
+    :param baseline: results of the baseline run
+    :type baseline: dict
+    :param current: results of the current run
+    :type current: dict
+    :keyword threshold: relative slowdown tolerated (0.25 is 25%)
+    :type threshold: float
+    :keyword min_delta: absolute slowdown tolerated in seconds
+    :type min_delta: float
+    :keyword metric: measurement compared (wall_time or cpu_time)
+    :type metric: string
+    :returns: one row per benchmark and size: name, events,
+        baseline time, current time, ratio and status
+    :rtype: list of tuples
+    """
+
+    baseline_results = _index(baseline)
+    current_results = _index(current)
+
+    rows = []
+    for key in sorted(set(baseline_results) | set(current_results),
+            key=lambda key: (key[1], key[0])):
+        old = baseline_results.get(key)
+        new = current_results.get(key)
+        old_time = _measure(old, metric)
+        new_time = _measure(new, metric)
+        ratio = None
+        if old_time and new_time is not None:
+            ratio = new_time / old_time
+
+        if new is None:
+            status = STATUS_MISSING
+        elif new['status'] == 'skipped':
+            status = STATUS_SKIPPED
+        elif new['status'] != 'ok':
+            status = STATUS_BROKEN if old_time is not None else STATUS_ERROR
+        elif old_time is None:
+            status = STATUS_NEW
+        elif new_time > old_time * (1. + threshold) and \
+                new_time - old_time > min_delta:
+            status = STATUS_REGRESSION
+        elif new_time < old_time / (1. + threshold) and \
+                old_time - new_time > min_delta:
+            status = STATUS_IMPROVEMENT
+        else:
+            status = STATUS_OK
+        rows.append((key[0], key[1], old_time, new_time, ratio, status))
+
+    return rows
+
+
+def failed(rows):
+    """Return True if any benchmark regressed or broke"""
+
+    return any(row[-1] in FAILURE_STATUSES for row in rows)
+
+
+def report(rows, baseline, current, threshold=DEFAULT_THRESHOLD,
+           metric=DEFAULT_METRIC):
+    """
+    Return a table describing the comparison
+    :param rows: rows returned by compare
+    :rtype: string
+    """
+
+    lines = ['Baseline revision: %s (%s)' % (baseline.get('revision'),
+                baseline.get('timestamp')),
+             'Current revision:  %s (%s)' % (current.get('revision'),
+                current.get('timestamp')),
+             'Metric: %s, threshold: +%d%%' % (metric, threshold * 100),
+             '',
+             '%-28s %9s %12s %12s %8s  %s' % ('benchmark', 'events',
+                'baseline (s)', 'current (s)', 'ratio', 'status')]
+
+    for name, events, old_time, new_time, ratio, status in rows:
+        lines.append('%-28s %9d %12s %12s %8s  %s' % (name, events,
+            _format(old_time, '%12.3f'), _format(new_time, '%12.3f'),
+            _format(ratio, '%7.2fx'), status))
+
+    lines.append('')
+    failures = [row for row in rows if row[-1] in FAILURE_STATUSES]
+    if failures:
+        lines.append('Performance gate FAILED: %s' % ', '.join(
+            '%s (%d events)' % (row[0], row[1]) for row in failures))
+    else:
+        lines.append('Performance gate passed')
+
+    return '\n'.join(lines)
+
+
+def _index(results):
+    """Index results by benchmark name and catalogue size"""
+
+    return dict(((result['benchmark'], result['events']), result)
+                for result in results['results'])
+
+
+def _measure(result, metric):
+    """Return the measurement of a result, None if not available"""
+
+    if result is None or result['status'] != 'ok':
+        return None
+    return result[metric]
+
+
+def _format(value, fmt):
+    """Format a value which can be missing"""
+
+    if value is None:
+        return '-'
+    return (fmt % value).strip()
+
+
+def build_cmd_parser():
+    """
+    Create a simple parser for cmdline
+    """
+
+    parser = argparse.ArgumentParser(prog='run_benchmark_gate')
+    parser.add_argument('--baseline',
+                        default=DEFAULT_BASELINE,
+                        help="""Json file of the baseline run, created
+                        from the current run if it doesn't exist
+                        (default: %s)""" % DEFAULT_BASELINE)
+
+    parser.add_argument('--results',
+                        help="""Compare an existing results file
+                        instead of running the benchmarks""")
+
+    parser.add_argument('-o', '--output',
+                        default=DEFAULT_OUTPUT,
+                        help="""Json file where the current results
+                        are written (default: %s)""" % DEFAULT_OUTPUT)
+
+    parser.add_argument('-t', '--threshold',
+                        type=float,
+                        default=DEFAULT_THRESHOLD,
+                        help="""Relative slowdown tolerated
+                        (default: %s)""" % DEFAULT_THRESHOLD)
+
+    parser.add_argument('--min-delta',
+                        type=float,
+                        default=DEFAULT_MIN_DELTA,
+                        help="""Absolute slowdown tolerated in
+                        seconds (default: %s)""" % DEFAULT_MIN_DELTA)
+
+    parser.add_argument('--metric',
+                        choices=['wall_time', 'cpu_time'],
+                        default=DEFAULT_METRIC,
+                        help="""Measurement compared
+                        (default: %s)""" % DEFAULT_METRIC)
+
+    parser.add_argument('-s', '--sizes',
+                        type=int,
+                        nargs='+',
+                        default=DEFAULT_SIZES,
+                        metavar='N',
+                        help="""Catalogue sizes (default: %s)""" %
+                        ' '.join(str(size) for size in DEFAULT_SIZES))
+
+    parser.add_argument('-r', '--repeat',
+                        type=int,
+                        default=DEFAULT_REPEAT,
+                        help="""Repetitions of every benchmark,
+                        the best time is compared
+                        (default: %s)""" % DEFAULT_REPEAT)
+
+    parser.add_argument('--update-baseline',
+                        action='store_true',
+                        help="""Store the current results
+                        as the new baseline""")
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the performance gate from the cmdline
+    :returns: exit status, 1 if the gate fails
+    :rtype: int
+    """
+
+    args = build_cmd_parser().parse_args(argv)
+    # Jobs log at info level, keep the output readable
+    logging.getLogger('mt_logger').setLevel(logging.WARNING)
+
+    if args.results:
+        current = read_results(args.results)
+    else:
+        current = run_benchmarks(args.sizes, GATE_BENCHMARKS, args.repeat)
+        write_results(args.output, current)
+        print 'Results written in %s' % args.output
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        write_results(args.baseline, current)
+        print 'Baseline written in %s' % args.baseline
+        return 0
+
+    baseline = read_results(args.baseline)
+    rows = compare(baseline, current, args.threshold, args.min_delta,
+        args.metric)
+    print
+    print report(rows, baseline, current, args.threshold, args.metric)
+
+    return 1 if failed(rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
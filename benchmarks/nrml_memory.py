@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide a benchmark
+of the memory used to read large source models: nrml
+files with an increasing number of area sources are
+generated and read in a new interpreter, which reports
+its peak resident memory. A streaming reader uses the
+same memory whatever the number of sources.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import subprocess
+
+from lxml import etree
+
+from benchmarks.scaling import (RESULTS_FORMAT_VERSION, git_revision,
+                                write_results)
+from benchmarks.synthetic import synthetic_area_sources
+
+from nrml import nrml_xml
+from nrml.writer import source_elem
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = [10000, 100000]
+
+# Run in a child interpreter: reads the nrml file without keeping
+# the sources and prints the number of sources, the peak resident
+# memory (kB) before and after reading
+READ_PROBE = """
+import resource
+from nrml.reader import NRMLReader
+from nrml.nrml_xml import get_data_path, SCHEMA_DIR
+reader = NRMLReader(%r, get_data_path('nrml.xsd', SCHEMA_DIR))
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+nsources = 0
+for _ in reader.read():
+    nsources += 1
+print nsources, before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+"""
+
+
+def write_source_model(filename, nsources):
+    """
+    Write a nrml file with a grid of area sources,
+    sources are written one at a time so that
+    files of any size can be generated
+    :param filename: nrml output filename
+    :param nsources: number of area sources
+    :type nsources: int
+    """
+
+    # Sources are generated one grid row at a time
+    nlat = 100
+    nlon = (nsources + nlat - 1) // nlat
+
+    with etree.xmlfile(filename, encoding='utf-8') as nrml_file:
+        nrml_file.write_declaration()
+        with nrml_file.element(nrml_xml.ROOT, {nrml_xml.GML_ID: 'n1'},
+                nsmap=nrml_xml.NSMAP):
+            with nrml_file.element(nrml_xml.SOURCE_MODEL,
+                    {nrml_xml.GML_ID: 'sm1'}):
+                nrml_file.write(etree.Element(nrml_xml.CONFIG))
+                written = 0
+                for row in xrange(nlon):
+                    region = (-180. + row * 360. / nlon, -80.,
+                              -180. + (row + 1) * 360. / nlon, 80.)
+                    for area_source in synthetic_area_sources(1, nlat,
+                            region):
+                        if written == nsources:
+                            break
+                        area_source.area_source_id = 'src%06d' % written
+                        nrml_file.write(source_elem(area_source))
+                        written += 1
+
+
+def measure_read(filename):
+    """
+    Read a nrml file in a new interpreter and
+    return its measurements
+    :param filename: nrml input filename
+    :rtype: dict
+    """
+
+    wall_before = time.time()
+    try:
+        output = subprocess.check_output([sys.executable, '-c',
+            READ_PROBE % filename], cwd=ROOT_DIR)
+    except subprocess.CalledProcessError as error:
+        return {'status': 'error',
+                'error': 'exit status %s' % error.returncode}
+    wall_time = time.time() - wall_before
+
+    nsources, before, peak = [int(value) for value in output.split()]
+    return {'status': 'ok',
+            'wall_time': wall_time,
+            'sources': nsources,
+            'file_size': os.path.getsize(filename),
+            'rss_before_read': before,
+            'peak_rss': peak,
+            'read_rss': peak - before}
+
+
+def run_benchmarks(sizes=None):
+    """
+    Run the source model memory benchmarks
+    :keyword sizes: numbers of area sources
+    :returns: results in the format of the scaling benchmarks
+    :rtype: dict
+    """
+
+    work_dir = tempfile.mkdtemp(prefix='mtk_nrml_memory_')
+    try:
+        results = []
+        for nsources in sizes or DEFAULT_SIZES:
+            filename = os.path.join(work_dir, 'source_model_%d.xml'
+                % nsources)
+            write_source_model(filename, nsources)
+            result = {'benchmark': 'NRMLReader memory', 'events': nsources}
+            result.update(measure_read(filename))
+            results.append(result)
+            os.remove(filename)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {'format': RESULTS_FORMAT_VERSION,
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results}
+
+
+def build_cmd_parser():
+    """
+    Create a simple parser for cmdline
+    """
+
+    parser = argparse.ArgumentParser(prog='nrml_memory')
+    parser.add_argument('-o', '--output',
+                        help="""Json file where results are written""")
+
+    parser.add_argument('-s', '--sizes',
+                        type=int,
+                        nargs='+',
+                        default=DEFAULT_SIZES,
+                        help="""Numbers of area sources of the
+                        generated source models (default: %s)""" %
+                        ' '.join(str(size) for size in DEFAULT_SIZES))
+    return parser
+
+
+def main(argv=None):
+    """Run the source model memory benchmarks from the cmdline"""
+
+    args = build_cmd_parser().parse_args(argv)
+    results = run_benchmarks(args.sizes)
+
+    for result in results['results']:
+        if result['status'] == 'ok':
+            print '%8d sources %8.1f MB file %8.3f s  peak memory %8.1f MB' \
+                '  read %8.1f MB' % (result['sources'],
+                result['file_size'] / 1048576., result['wall_time'],
+                result['peak_rss'] / 1024., result['read_rss'] / 1024.)
+        else:
+            print '%8d sources error (%s)' % (result['events'],
+                result['error'])
+
+    if args.output:
+        write_results(args.output, results)
+        print 'Results written in %s' % args.output
+
+
+if __name__ == '__main__':
+    main()
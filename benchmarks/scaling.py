@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide a benchmark
+suite which times the scientific functions and the
+whole workflow on synthetic catalogues of increasing
+size, results are stored in a json file to be compared
+across commits.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import traceback
+import subprocess
+
+import numpy as np
+
+from benchmarks.synthetic import (synthetic_catalogue, catalogue_matrix,
+    write_catalogue, synthetic_area_sources, write_area_sources)
+
+from mtoolkit.instrumentation import cpu_time, CPU_TIME_SCOPE
+from mtoolkit.catalog_filter import CatalogFilter, SourceModelCatalogFilter
+from mtoolkit.scientific.declustering import (gardner_knopoff_decluster,
+                                               afteran_decluster)
+from mtoolkit.scientific.completeness import stepp_analysis
+from mtoolkit.scientific.recurrence import recurrence_analysis
+from mtoolkit.workflow import (Context, PreprocessingBuilder,
+                                ProcessingBuilder, Workflow)
+
+# Bump when the layout of the results file changes
+RESULTS_FORMAT_VERSION = 1
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_SEED = 42
+DEFAULT_REPEAT = 1
+DEFAULT_SOURCES_GRID = (10, 10)
+
+COMPLETENESS_TABLE = np.array([[1960., 3.0], [1920., 5.0], [1900., 6.5]])
+
+BENCHMARK_CONFIG = {
+    'GardnerKnopoff': {'time_dist_windows': 'GardnerKnopoff',
+                       'foreshock_time_window': 0},
+    'Afteran': {'time_dist_windows': 'GardnerKnopoff', 'time_window': 60.0},
+    'Stepp': {'time_window': 5, 'magnitude_windows': 0.2,
+              'sensitivity': 0.1, 'increment_lock': True},
+    'Recurrence': {'magnitude_window': 0.1,
+                   'recurrence_algorithm': 'Weichert',
+                   'reference_magnitude': 3.0,
+                   'time_window': 1.0},
+    'MaximumMagnitude': {'maxim_mag_algorithm': 'Kijko_Npg',
+                         'iteration_tolerance': 1.0E-5,
+                         'maximum_iterations': 1000,
+                         'neq': 100,
+                         'number_samples': 51,
+                         'number_bootstraps': 100}}
+
+
+def _gardner_knopoff(data):
+    """Decluster the catalogue with gardner knopoff"""
+
+    gardner_knopoff_decluster(data.matrix,
+        BENCHMARK_CONFIG['GardnerKnopoff']['time_dist_windows'],
+        BENCHMARK_CONFIG['GardnerKnopoff']['foreshock_time_window'])
+
+
+def _afteran(data):
+    """Decluster the catalogue with afteran"""
+
+    afteran_decluster(data.matrix,
+        BENCHMARK_CONFIG['Afteran']['time_dist_windows'],
+        BENCHMARK_CONFIG['Afteran']['time_window'])
+
+
+def _stepp(data):
+    """Compute the completeness table of the catalogue"""
+
+    stepp = BENCHMARK_CONFIG['Stepp']
+    stepp_analysis(data.matrix[:, 0], data.matrix[:, 5],
+        stepp['magnitude_windows'], stepp['time_window'],
+        stepp['sensitivity'], stepp['increment_lock'])
+
+
+def _recurrence(data):
+    """Compute the recurrence parameters of the catalogue"""
+
+    recurrence = BENCHMARK_CONFIG['Recurrence']
+    recurrence_analysis(data.matrix[:, 0], data.matrix[:, 5],
+        COMPLETENESS_TABLE, recurrence['magnitude_window'],
+        recurrence['recurrence_algorithm'],
+        recurrence['reference_magnitude'], recurrence['time_window'])
+
+
+def _source_model_filter(data):
+    """Filter the catalogue with every area source"""
+
+    for _ in CatalogFilter(SourceModelCatalogFilter()).filter_eqs(
+            data.area_sources, data.matrix):
+        pass
+
+
+def _workflow(data):
+    """Run the whole workflow reading inputs from files"""
+
+    context = Context()
+    context.config = dict(BENCHMARK_CONFIG,
+        eq_catalog_file=data.catalogue_file,
+        source_model_file=data.source_model_file,
+        pprocessing_result_file=os.path.join(data.work_dir,
+            'preprocessed_catalogue.csv'),
+        completeness_table_file=os.path.join(data.work_dir,
+            'completeness_table.csv'),
+        result_file=os.path.join(data.work_dir, 'output.xml'),
+        apply_processing_jobs=True,
+        preprocessing_jobs=['GardnerKnopoff', 'Stepp'],
+        processing_jobs=['Recurrence', 'MaximumMagnitude'])
+
+    workflow = Workflow(PreprocessingBuilder().build(context.config),
+        ProcessingBuilder().build(context.config))
+    workflow.start(context, CatalogFilter(SourceModelCatalogFilter()))
+
+
+# Benchmarks in execution order: name, callable and the
+# largest catalogue they run on (None means no limit),
+# quadratic algorithms are not run on the largest sizes.
+BENCHMARKS = [
+    ('gardner_knopoff_decluster', _gardner_knopoff, 100000),
+    ('afteran_decluster', _afteran, 10000),
+    ('stepp_analysis', _stepp, None),
+    ('recurrence_analysis', _recurrence, None),
+    ('SourceModelCatalogFilter', _source_model_filter, None),
+    ('Workflow', _workflow, 100000)]
+
+
+class BenchmarkData(object):
+    """
+    BenchmarkData holds the synthetic inputs
+    of a catalogue size, both in memory and
+    written in files.
+    """
+
+    def __init__(self, neq, work_dir, seed=DEFAULT_SEED,
+                 sources_grid=DEFAULT_SOURCES_GRID):
+        self.neq = neq
+        self.work_dir = work_dir
+        columns = synthetic_catalogue(neq, seed=seed)
+        self.matrix = catalogue_matrix(columns)
+        self.area_sources = synthetic_area_sources(*sources_grid)
+
+        self.catalogue_file = os.path.join(work_dir, 'catalogue_%d.csv' % neq)
+        write_catalogue(self.catalogue_file, columns)
+        self.source_model_file = os.path.join(work_dir, 'source_model.xml')
+        if not os.path.exists(self.source_model_file):
+            write_area_sources(self.source_model_file, self.area_sources)
+
+
+def time_benchmark(benchmark, data, repeat=DEFAULT_REPEAT):
+    """
+    Run a benchmark and return its measurements, the
+    best wall time over the repetitions is reported.
+    A failing benchmark is recorded with its error.
+    :param benchmark: callable which receives the benchmark data
+    :param data: synthetic inputs
+    :type data: BenchmarkData
+    :keyword repeat: number of repetitions
+    :type repeat: int
+    :rtype: dict
+    """
+
+    wall_times = []
+    cpu_times = []
+    try:
+        for _ in xrange(repeat):
+            cpu_before = cpu_time()
+            wall_before = time.time()
+            benchmark(data)
+            wall_times.append(time.time() - wall_before)
+            cpu_times.append(cpu_time() - cpu_before)
+    # pylint: disable=W0703
+    except Exception as error:
+        return {'status': 'error',
+                'error': '%s: %s' % (type(error).__name__, error),
+                'traceback': traceback.format_exc()}
+
+    return {'status': 'ok',
+            'wall_time': min(wall_times),
+            'cpu_time': min(cpu_times),
+            'cpu_time_scope': CPU_TIME_SCOPE,
+            'repeat': repeat}
+
+
+def run_benchmarks(sizes=None, names=None, repeat=DEFAULT_REPEAT,
+                   seed=DEFAULT_SEED, no_limits=False, work_dir=None):
+    """
+    Run the benchmark suite on synthetic catalogues
+    :keyword sizes: catalogue sizes (number of events)
+    :type sizes: list of int
+    :keyword names: benchmarks to run, all if not defined
+    :type names: list of strings
+    :keyword repeat: number of repetitions of every benchmark
+    :keyword seed: seed of the synthetic catalogues
+    :keyword no_limits: run every benchmark on every size
+    :keyword work_dir: dir where synthetic inputs are written,
+        a temporary dir is used if not defined
+    :returns: results in the format stored in the json file
+    :rtype: dict
+    """
+
+    sizes = sizes or DEFAULT_SIZES
+    benchmarks = [benchmark for benchmark in BENCHMARKS
+                  if not names or benchmark[0] in names]
+
+    remove_work_dir = work_dir is None
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='mtk_benchmarks_')
+    elif not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+
+    results = []
+    try:
+        for neq in sizes:
+            data = BenchmarkData(neq, work_dir, seed)
+            for name, benchmark, max_events in benchmarks:
+                result = {'benchmark': name, 'events': neq}
+                if max_events is not None and neq > max_events \
+                        and not no_limits:
+                    result['status'] = 'skipped'
+                else:
+                    result.update(time_benchmark(benchmark, data, repeat))
+                results.append(result)
+                _log_result(result)
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {'format': RESULTS_FORMAT_VERSION,
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'seed': seed,
+            'results': results}
+
+
+def write_results(filename, results):
+    """
+    Write benchmark results in a json file
+    :param filename: output filename
+    :type filename: string
+    :param results: results returned by run_benchmarks
+    :type results: dict
+    """
+
+    with open(filename, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def read_results(filename):
+    """
+    Read benchmark results from a json file
+    :param filename: input filename
+    :type filename: string
+    :rtype: dict
+    """
+
+    with open(filename) as results_file:
+        results = json.load(results_file)
+
+    if results.get('format') != RESULTS_FORMAT_VERSION:
+        raise RuntimeError('Unsupported benchmark results format in %s'
+            % filename)
+    return results
+
+
+def git_revision():
+    """
+    Return the git revision of the source
+    tree, None if it can't be determined
+    """
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _log_result(result):
+    """Print the result of a benchmark"""
+
+    line = '%-28s %9d ' % (result['benchmark'], result['events'])
+    if result['status'] == 'ok':
+        line += '%10.3f s wall %10.3f s cpu' % (result['wall_time'],
+            result['cpu_time'])
+    elif result['status'] == 'error':
+        line += 'error (%s)' % result['error']
+    else:
+        line += 'skipped'
+    print line
+    sys.stdout.flush()
+
+
+def build_cmd_parser():
+    """
+    Create a simple parser for cmdline
+    """
+
+    parser = argparse.ArgumentParser(prog='run_benchmarks')
+    parser.add_argument('-o', '--output',
+                        default='benchmark_results.json',
+                        help="""Json file where results are
+                        written (default: benchmark_results.json)""")
+
+    parser.add_argument('-s', '--sizes',
+                        type=int,
+                        nargs='+',
+                        metavar='N',
+                        help="""Catalogue sizes
+                        (default: 10000 100000 1000000)""")
+
+    parser.add_argument('-b', '--benchmarks',
+                        nargs='+',
+                        metavar='NAME',
+                        choices=[benchmark[0] for benchmark in BENCHMARKS],
+                        help="""Benchmarks to run (default: all)""")
+
+    parser.add_argument('-r', '--repeat',
+                        type=int,
+                        default=DEFAULT_REPEAT,
+                        help="""Repetitions of every benchmark,
+                        the best time is reported (default: 1)""")
+
+    parser.add_argument('--seed',
+                        type=int,
+                        default=DEFAULT_SEED,
+                        help="""Seed of the synthetic catalogues""")
+
+    parser.add_argument('--no-limits',
+                        action='store_true',
+                        help="""Run quadratic algorithms
+                        on every catalogue size""")
+
+    parser.add_argument('--work-dir',
+                        help="""Keep synthetic inputs in the
+                        given dir instead of a temporary one""")
+    return parser
+
+
+def main(argv=None):
+    """Run the benchmark suite from the cmdline"""
+
+    args = build_cmd_parser().parse_args(argv)
+    # Jobs log at info level, keep the output readable
+    logging.getLogger('mt_logger').setLevel(logging.WARNING)
+
+    results = run_benchmarks(args.sizes, args.benchmarks, args.repeat,
+        args.seed, args.no_limits, args.work_dir)
+
+    write_results(args.output, results)
+    print 'Results written in %s' % args.output
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide a benchmark
+of the cmdline startup time: main.py is run with
+--version and with a minimal config (declustering of
+a small catalogue), the heavy modules loaded by the
+minimal config are reported.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import subprocess
+
+import yaml
+
+from benchmarks.scaling import (RESULTS_FORMAT_VERSION, git_revision,
+                                write_results)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT_DIR, 'main.py')
+MINIMAL_CATALOGUE = os.path.join(ROOT_DIR, 'tests', 'data',
+    'declustering_input_test.csv')
+
+DEFAULT_REPEAT = 5
+
+# Heavy dependencies, a run should load only those
+# required by the jobs in its config
+HEAVY_MODULES = ['scipy', 'shapely', 'lxml', 'nhlib']
+
+# Run in a child interpreter: executes main.py with the
+# given arguments and prints the heavy modules loaded
+MODULES_PROBE = """
+import sys, runpy
+sys.argv = %r
+try:
+    runpy.run_path(%r, run_name='__main__')
+except SystemExit:
+    pass
+print '\\n'.join(module for module in %r if module in sys.modules)
+"""
+
+
+def minimal_config(work_dir):
+    """
+    Write the config of a minimal run: declustering
+    of a small catalogue, without source model,
+    processing jobs and result file.
+    :param work_dir: dir where the config and outputs are written
+    :returns: path of the config file
+    :rtype: string
+    """
+
+    config = {'eq_catalog_file': MINIMAL_CATALOGUE,
+              'pprocessing_result_file': None,
+              'completeness_table_file': None,
+              'source_model_file': None,
+              'result_file': None,
+              'apply_processing_jobs': False,
+              'preprocessing_jobs': ['Afteran'],
+              'processing_jobs': None,
+              'Afteran': {'time_dist_windows': 'GardnerKnopoff',
+                          'time_window': 60.0}}
+
+    config_filename = os.path.join(work_dir, 'minimal.yml')
+    with open(config_filename, 'w') as config_file:
+        yaml.dump(config, config_file, default_flow_style=False)
+    return config_filename
+
+
+def time_command(args, repeat=DEFAULT_REPEAT):
+    """
+    Run main.py in a new interpreter and return
+    its measurements, the best wall time over the
+    repetitions is reported.
+    :param args: cmdline arguments of main.py
+    :type args: list of strings
+    :keyword repeat: number of repetitions
+    :type repeat: int
+    :rtype: dict
+    """
+
+    wall_times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in xrange(repeat):
+            wall_before = time.time()
+            status = subprocess.call([sys.executable, MAIN] + args,
+                cwd=ROOT_DIR, stdout=devnull, stderr=devnull)
+            wall_times.append(time.time() - wall_before)
+            if status != 0:
+                return {'status': 'error',
+                        'error': 'exit status %s' % status}
+
+    wall_times.sort()
+    return {'status': 'ok',
+            'wall_time': wall_times[0],
+            'median_wall_time': wall_times[len(wall_times) // 2],
+            'repeat': repeat}
+
+
+def loaded_heavy_modules(args):
+    """
+    Return the heavy modules loaded
+    when main.py runs with the given arguments
+    :param args: cmdline arguments of main.py
+    :type args: list of strings
+    :rtype: list of strings
+    """
+
+    probe = MODULES_PROBE % ([MAIN] + args, MAIN, HEAVY_MODULES)
+    with open(os.devnull, 'w') as devnull:
+        output = subprocess.check_output([sys.executable, '-c', probe],
+            cwd=ROOT_DIR, stderr=devnull)
+    return [line for line in output.splitlines() if line in HEAVY_MODULES]
+
+
+def run_benchmarks(repeat=DEFAULT_REPEAT):
+    """
+    Run the startup benchmarks
+    :keyword repeat: number of repetitions of every command
+    :returns: results in the format of the scaling benchmarks
+    :rtype: dict
+    """
+
+    work_dir = tempfile.mkdtemp(prefix='mtk_startup_')
+    try:
+        commands = [('startup --version', ['--version']),
+                    ('startup minimal config',
+                        ['-i', minimal_config(work_dir)])]
+
+        results = []
+        for name, args in commands:
+            result = {'benchmark': name, 'events': 0}
+            result.update(time_command(args, repeat))
+            result['heavy_modules'] = loaded_heavy_modules(args)
+            results.append(result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {'format': RESULTS_FORMAT_VERSION,
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results}
+
+
+def build_cmd_parser():
+    """
+    Create a simple parser for cmdline
+    """
+
+    parser = argparse.ArgumentParser(prog='startup')
+    parser.add_argument('-o', '--output',
+                        help="""Json file where results are written""")
+
+    parser.add_argument('-r', '--repeat',
+                        type=int,
+                        default=DEFAULT_REPEAT,
+                        help="""Repetitions of every command, the
+                        best time is reported (default: %s)""" %
+                        DEFAULT_REPEAT)
+    return parser
+
+
+def main(argv=None):
+    """Run the startup benchmarks from the cmdline"""
+
+    args = build_cmd_parser().parse_args(argv)
+    results = run_benchmarks(args.repeat)
+
+    for result in results['results']:
+        if result['status'] == 'ok':
+            print '%-24s %8.3f s best %8.3f s median  heavy modules: %s' % (
+                result['benchmark'], result['wall_time'],
+                result['median_wall_time'],
+                ', '.join(result['heavy_modules']) or 'none')
+        else:
+            print '%-24s error (%s)' % (result['benchmark'], result['error'])
+
+    if args.output:
+        write_results(args.output, results)
+        print 'Results written in %s' % args.output
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide functions which
+generate synthetic inputs for benchmarks: ETAS-like
+earthquake catalogues and area source models.
+"""
+
+import numpy as np
+
+from mtoolkit.eqcatalog import FIELDNAMES
+from mtoolkit.source_model import (default_area_source, AREA_BOUNDARY,
+                                    POINT, TRUNCATED_GUTEN_RICHTER)
+from nrml.writer import AreaSourceWriter
+
+DAYS_PER_YEAR = 365.25
+SECONDS_PER_DAY = 86400.
+KM_PER_DEGREE = 111.2
+
+DEFAULT_REGION = (10.0, 35.0, 30.0, 45.0)
+
+CATALOG_COLUMNS = ['year', 'month', 'day', 'hour', 'minute', 'second',
+                   'longitude', 'latitude', 'depth', 'Mw', 'sigmaMw']
+
+
+class ETASParameters(object):
+    """
+    Parameters of the epidemic type aftershock sequence
+    model used to generate synthetic catalogues.
+
+    :param b_value: Gutenberg-Richter b-value
+    :param min_mag: minimum magnitude of the catalogue
+    :param max_mag: maximum magnitude of the catalogue
+    :param productivity: expected number of direct aftershocks
+        triggered by an event of magnitude min_mag
+    :param alpha: magnitude scaling of productivity
+    :param omori_c: Omori law c parameter (days)
+    :param omori_p: Omori law p parameter (> 1)
+    """
+
+    def __init__(self, b_value=1.0, min_mag=3.0, max_mag=8.0,
+                 productivity=0.08, alpha=0.8, omori_c=0.01, omori_p=1.2):
+        self.b_value = b_value
+        self.min_mag = min_mag
+        self.max_mag = max_mag
+        self.productivity = productivity
+        self.alpha = alpha
+        self.omori_c = omori_c
+        self.omori_p = omori_p
+
+    @property
+    def branching_ratio(self):
+        """Mean number of direct aftershocks per event"""
+
+        return self.productivity * self.b_value / (self.b_value - self.alpha)
+
+
+def synthetic_catalogue(neq, start_year=1900, end_year=2010,
+                        region=DEFAULT_REGION, params=None, seed=None):
+    """
+    Generate an ETAS-like catalogue: background events are
+    uniformly distributed in space and time, every event
+    triggers aftershocks following the Omori law in time and
+    a gaussian kernel, scaled with magnitude, in space.
+    Magnitudes follow a truncated Gutenberg-Richter law.
+
+    :param neq: number of events
+    :type neq: int
+    :keyword start_year: first year of the catalogue
+    :keyword end_year: last year of the catalogue
+    :keyword region: tuple (min_lon, min_lat, max_lon, max_lat)
+    :keyword params: ETAS model parameters
+    :type params: ETASParameters
+    :keyword seed: seed of the random generator
+    :returns: dict of columns (see CATALOG_COLUMNS) sorted by time
+    :rtype: dict of numpy.ndarray
+    """
+
+    params = params or ETASParameters()
+    rnd = np.random.RandomState(seed)
+    duration = float(end_year - start_year)
+
+    nbackground = max(1, int(neq * (1.0 - params.branching_ratio)))
+    time, lon, lat, mag = _background(rnd, nbackground, duration,
+        region, params)
+    catalogue = [(time, lon, lat, mag)]
+    total = nbackground
+
+    # Aftershocks generation by generation, until the
+    # cascade dies out or enough events are generated
+    while len(time) and total < neq:
+        time, lon, lat, mag = _aftershocks(rnd, time, lon, lat, mag,
+            duration, params)
+        catalogue.append((time, lon, lat, mag))
+        total += len(time)
+
+    time, lon, lat, mag = [np.concatenate(column)
+                            for column in zip(*catalogue)]
+
+    if len(time) > neq:
+        keep = np.sort(rnd.permutation(len(time))[:neq])
+        time, lon, lat, mag = time[keep], lon[keep], lat[keep], mag[keep]
+    elif len(time) < neq:
+        extra = _background(rnd, neq - len(time), duration, region, params)
+        time, lon, lat, mag = [np.concatenate([column, extra_column])
+            for column, extra_column in zip((time, lon, lat, mag), extra)]
+
+    order = np.argsort(time, kind='mergesort')
+
+    columns = _calendar(start_year, time[order])
+    columns['longitude'] = lon[order]
+    columns['latitude'] = np.clip(lat[order], -90., 90.)
+    columns['depth'] = rnd.uniform(1.0, 30.0, neq)
+    columns['Mw'] = np.around(mag[order], 2)
+    columns['sigmaMw'] = np.around(rnd.uniform(0.1, 0.3, neq), 3)
+
+    return columns
+
+
+def _gutenberg_richter(rnd, size, params):
+    """Sample magnitudes from a truncated Gutenberg-Richter law"""
+
+    beta = params.b_value * np.log(10.)
+    mag_range = 1.0 - np.exp(-beta * (params.max_mag - params.min_mag))
+    return params.min_mag - np.log(
+        1.0 - rnd.uniform(0., 1., size) * mag_range) / beta
+
+
+def _background(rnd, size, duration, region, params):
+    """Generate background events"""
+
+    min_lon, min_lat, max_lon, max_lat = region
+    return (rnd.uniform(0., duration, size),
+            rnd.uniform(min_lon, max_lon, size),
+            rnd.uniform(min_lat, max_lat, size),
+            _gutenberg_richter(rnd, size, params))
+
+
+def _aftershocks(rnd, time, lon, lat, mag, duration, params):
+    """Generate the direct aftershocks of a set of events"""
+
+    expected = params.productivity * np.power(10.,
+        params.alpha * (mag - params.min_mag))
+    number = rnd.poisson(expected)
+    parents = np.repeat(np.arange(len(time)), number)
+
+    # Modified Omori law delays, obtained by inversion
+    # of the cumulative distribution (days to years)
+    uniform = rnd.uniform(0., 1., len(parents))
+    delay = params.omori_c * (np.power(1. - uniform,
+        1. / (1. - params.omori_p)) - 1.) / DAYS_PER_YEAR
+
+    # Spatial spread grows with the parent magnitude
+    spread = np.power(10., 0.5 * mag[parents] - 2.) / KM_PER_DEGREE
+    cos_lat = np.maximum(np.cos(np.radians(lat[parents])), 0.01)
+
+    child_time = time[parents] + delay
+    inside = child_time < duration
+
+    child_lon = lon[parents] + rnd.normal(0., 1., len(parents)) * \
+        spread / cos_lat
+    child_lon = (child_lon + 180.) % 360. - 180.
+    child_lat = lat[parents] + rnd.normal(0., 1., len(parents)) * spread
+
+    return (child_time[inside], child_lon[inside], child_lat[inside],
+            _gutenberg_richter(rnd, len(parents), params)[inside])
+
+
+def _calendar(start_year, time):
+    """
+    Convert times (years since the start year)
+    in calendar columns
+    """
+
+    start = np.datetime64('%04d-01-01T00:00:00' % start_year, 's')
+    seconds = np.floor(time * DAYS_PER_YEAR * SECONDS_PER_DAY)
+    date = start + seconds.astype('timedelta64[s]')
+
+    month_start = date.astype('datetime64[M]')
+    day_start = date.astype('datetime64[D]')
+    second_of_day = (date - day_start).astype(int)
+
+    return {'year': date.astype('datetime64[Y]').astype(int) + 1970,
+            'month': month_start.astype(int) % 12 + 1,
+            'day': (day_start - month_start).astype(int) + 1,
+            'hour': second_of_day // 3600,
+            'minute': (second_of_day % 3600) // 60,
+            'second': (second_of_day % 60).astype(float)}
+
+
+def catalogue_matrix(columns):
+    """
+    Return the catalogue in the matrix format used by
+    scientific functions (year, month, day, longitude,
+    latitude, Mw, sigmaMw)
+    """
+
+    return np.column_stack([columns[name] for name in ('year', 'month',
+        'day', 'longitude', 'latitude', 'Mw', 'sigmaMw')]).astype(float)
+
+
+def write_catalogue(filename, columns, chunk_size=100000):
+    """
+    Write a synthetic catalogue in the csv
+    format read by EqEntryReader
+    :param filename: output filename
+    :param columns: catalogue columns
+    :type columns: dict of numpy.ndarray
+    """
+
+    row_format = ('%d,SYN,%d,%d,%d,%d,%d,%d,%.2f,,%.4f,%.4f,'
+                  ',,,%.2f,,%.2f,%.3f,,,,,%.2f,0.1\n')
+    neq = len(columns['year'])
+
+    with open(filename, 'w') as catalogue_file:
+        catalogue_file.write(','.join(FIELDNAMES) + '\n')
+        for start in xrange(0, neq, chunk_size):
+            stop = min(start + chunk_size, neq)
+            event_id = np.arange(start + 1, stop + 1)
+            rows = zip(event_id, event_id,
+                *[columns[name][start:stop] for name in ('year', 'month',
+                    'day', 'hour', 'minute', 'second', 'longitude',
+                    'latitude', 'depth', 'Mw', 'sigmaMw', 'Mw')])
+            catalogue_file.writelines(row_format % row for row in rows)
+
+
+def synthetic_area_sources(nlon, nlat, region=DEFAULT_REGION,
+                           min_mag=3.0, max_mag=8.0):
+    """
+    Create a grid of rectangular area sources covering the region
+    :param nlon: number of sources along longitude
+    :param nlat: number of sources along latitude
+    :keyword region: tuple (min_lon, min_lat, max_lon, max_lat)
+    :returns: area source objects
+    :rtype: list of py:class:: AreaSource
+    """
+
+    min_lon, min_lat, max_lon, max_lat = region
+    lon_edges = np.linspace(min_lon, max_lon, nlon + 1)
+    lat_edges = np.linspace(min_lat, max_lat, nlat + 1)
+
+    area_sources = []
+    for i in xrange(nlon):
+        for j in xrange(nlat):
+            area_source = default_area_source()
+            area_source.nrml_id = 'n1'
+            area_source.source_model_id = 'sm1'
+            area_source.area_source_id = 'src%06d' % len(area_sources)
+            area_source.name = 'zone %d %d' % (i, j)
+            area_source.tectonic_region = 'Active Shallow Crust'
+            area_source.area_boundary = AREA_BOUNDARY(
+                'urn:ogc:def:crs:EPSG::4326',
+                [POINT(lon_edges[i], lat_edges[j]),
+                 POINT(lon_edges[i + 1], lat_edges[j]),
+                 POINT(lon_edges[i + 1], lat_edges[j + 1]),
+                 POINT(lon_edges[i], lat_edges[j + 1])])
+            area_source.rupture_rate_model = \
+                area_source.rupture_rate_model._replace(
+                    truncated_gutenberg_richter=TRUNCATED_GUTEN_RICHTER(
+                        0.0, 1.0, min_mag, max_mag, 'ML'))
+            area_source.rupture_depth_dist = \
+                area_source.rupture_depth_dist._replace(
+                    magnitude=area_source.rupture_depth_dist.magnitude.\
+                        _replace(type_mag='ML'))
+            area_sources.append(area_source)
+
+    return area_sources
+
+
+def write_area_sources(filename, area_sources):
+    """Write area sources in a nrml file"""
+
+    AreaSourceWriter(filename).serialize(area_sources)
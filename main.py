@@ -20,13 +20,6 @@ import logging
 
 from mtoolkit.console import cmd_line, build_logger
 
-from mtoolkit.workflow import (Context, PreprocessingBuilder,
-                                ProcessingBuilder, Workflow)
-
-from nrml.writer import AreaSourceWriter
-
-from mtoolkit.catalog_filter import CatalogFilter, SourceModelCatalogFilter
-
 
 if __name__ == '__main__':
 
@@ -34,6 +27,16 @@ if __name__ == '__main__':
 
     if CMD_LINE_ARGS:
 
+        # Imported after parsing the cmdline, so that
+        # --help and --version don't load numpy and lxml
+        from mtoolkit.workflow import (Context, PreprocessingBuilder,
+                                        ProcessingBuilder, Workflow)
+
+        from mtoolkit.catalog_filter import (CatalogFilter,
+                                             SourceModelCatalogFilter)
+
+        from mtoolkit.profiling import JobProfiler
+
         INPUT_CONFIG_FILENAME = CMD_LINE_ARGS.input_file[0]
 
         LOG_LEVEL = logging.DEBUG if CMD_LINE_ARGS.detailed else logging.INFO
@@ -42,17 +45,50 @@ if __name__ == '__main__':
 
         CONTEXT = Context(INPUT_CONFIG_FILENAME)
 
-        PIPELINE_PREPROCESSING = PreprocessingBuilder().build(CONTEXT.config)
-
-        PIPELINE_PROCESSING = ProcessingBuilder().build(CONTEXT.config)
+        if CMD_LINE_ARGS.sweep:
+            from mtoolkit.sweep import run_sweep
 
-        if CONTEXT.config['source_model_file']:
-            CATALOG_FILTER = CatalogFilter(SourceModelCatalogFilter())
+            run_sweep(CONTEXT)
         else:
-            CATALOG_FILTER = CatalogFilter()
-
-        WORKFLOW = Workflow(PIPELINE_PREPROCESSING, PIPELINE_PROCESSING)
-        WORKFLOW.start(CONTEXT, CATALOG_FILTER)
-
-        WRITER = AreaSourceWriter(CONTEXT.config['result_file'])
-        WRITER.serialize(CONTEXT.sm_definitions)
+            if CONTEXT.config.get('checkpoint_dir'):
+                from mtoolkit.checkpoint import RunCheckpoint
+
+                CONTEXT.checkpoint = RunCheckpoint(
+                    CONTEXT.config['checkpoint_dir'], CONTEXT.config,
+                    CMD_LINE_ARGS.resume)
+            elif CMD_LINE_ARGS.resume:
+                raise RuntimeError('Cannot resume: checkpoint_dir is not '
+                    'defined in the config')
+
+            if CMD_LINE_ARGS.profile_dir:
+                CONTEXT.profiler = JobProfiler(CMD_LINE_ARGS.profile_dir,
+                    CMD_LINE_ARGS.profile_top)
+
+            PIPELINE_PREPROCESSING = PreprocessingBuilder().build(
+                CONTEXT.config)
+
+            PIPELINE_PROCESSING = ProcessingBuilder().build(CONTEXT.config)
+
+            if CONTEXT.config['source_model_file']:
+                CATALOG_FILTER = CatalogFilter(SourceModelCatalogFilter())
+            else:
+                CATALOG_FILTER = CatalogFilter()
+
+            WORKFLOW = Workflow(PIPELINE_PREPROCESSING, PIPELINE_PROCESSING)
+            try:
+                WORKFLOW.start(CONTEXT, CATALOG_FILTER)
+
+                if CONTEXT.config.get('result_file'):
+                    # Imported here, lxml is loaded only
+                    # when the results are written
+                    from nrml.writer import AreaSourceWriter
+
+                    WRITER = AreaSourceWriter(CONTEXT.config['result_file'])
+                    WRITER.serialize(CONTEXT.sm_definitions)
+            finally:
+                # Written for failed and interrupted runs too,
+                # with the jobs profiled up to the failure
+                if CONTEXT.profiler:
+                    logging.getLogger('mt_logger').info(
+                        "Profile report written in %s" %
+                        CONTEXT.profiler.write())
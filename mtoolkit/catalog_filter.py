@@ -22,7 +22,6 @@ which apply different filtering strategies to
 the earthquake catalog.
 """
 
-from shapely.geometry import Point, Polygon
 import numpy as np
 import logging
 
@@ -68,14 +67,27 @@ class SourceModelCatalogFilter(object):
 
         polygon = _extract_polygon(source)
         _check_polygon(polygon)
-        filtered_eq = []
+        filtered_eq = np.array([])
 
-        for eq in eq_catalog:
-            eq_point = Point(eq[self.POINT_LONGITUDE_INDEX],
-                    eq[self.POINT_LATITUDE_INDEX])
+        if len(eq_catalog):
+            longitude = eq_catalog[:, self.POINT_LONGITUDE_INDEX]
+            latitude = eq_catalog[:, self.POINT_LATITUDE_INDEX]
 
-            if polygon.contains(eq_point):
-                filtered_eq.append(eq)
+            # Only events inside the bounding box
+            # need the exact containment test
+            min_lon, min_lat, max_lon, max_lat = source.bounding_box
+            inside = np.logical_and(
+                np.logical_and(longitude > min_lon, longitude < max_lon),
+                np.logical_and(latitude > min_lat, latitude < max_lat))
+
+            from shapely.geometry import Point
+            prepared_polygon = source.prepared_polygon
+            for index in np.nonzero(inside)[0]:
+                inside[index] = prepared_polygon.contains(
+                    Point(longitude[index], latitude[index]))
+
+            if inside.any():
+                filtered_eq = eq_catalog[inside]
 
         LOGGER.info(''.center(80, '-'))
 
@@ -84,7 +96,7 @@ class SourceModelCatalogFilter(object):
         LOGGER.debug("Number of events inside the zone %s: %s" %
             (source.name, len(filtered_eq)))
 
-        return np.array(filtered_eq)
+        return filtered_eq
 
 
 def _check_polygon(polygon):
@@ -102,7 +114,7 @@ def _extract_polygon(source_model):
     defined in the source model area boundary
     """
 
-    return Polygon(source_model.area_boundary.pos_list)
+    return source_model.polygon
 
 
 class NullCatalogFilter(object):
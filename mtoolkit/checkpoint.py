@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide objects
+which store the progress of a workflow run in a run
+directory: the state left by the preprocessing pipeline
+and every source model completed by the processing
+pipeline, so that an interrupted run can be resumed.
+"""
+
+import os
+import glob
+import json
+import shutil
+import hashlib
+import cPickle
+import logging
+
+LOGGER = logging.getLogger('mt_logger')
+
+# Bump when the checkpoint layout changes
+CHECKPOINT_FORMAT_VERSION = 2
+
+MANIFEST_FILENAME = 'manifest.json'
+PREPROCESSING_FILENAME = 'preprocessing.pkl'
+SOURCES_DIR = 'sources'
+
+# Context attributes written by preprocessing jobs and
+# read by processing jobs, the eq catalog entries are
+# needed only to store the preprocessed catalogue
+PREPROCESSING_STATE = ['sm_definitions', 'catalog_matrix', 'working_catalog',
+                       'completeness_table', 'flag_vector', 'vcl',
+                       'selected_eq_vector']
+
+# Config keys of the input files (filenames, glob patterns or
+# lists of them), a run is resumed only if they are unchanged
+INPUT_FILE_KEYS = ['eq_catalog_file', 'source_model_file']
+
+
+class RunCheckpoint(object):
+    """
+    RunCheckpoint stores the progress of a workflow
+    run in a directory. A run is resumed only with
+    the config it was started with and unchanged
+    input files, a run started without resuming
+    discards the previous progress.
+    """
+
+    def __init__(self, run_dir, config, resume=False):
+        """
+        Constructor
+        :param run_dir: directory where progress is stored
+        :type run_dir: string
+        :param config: config of the run
+        :type config: dict
+        :keyword resume: reuse the progress of a previous run
+        :type resume: bool
+        """
+
+        self.run_dir = run_dir
+        self.sources_dir = os.path.join(run_dir, SOURCES_DIR)
+        fingerprint = {'format': CHECKPOINT_FORMAT_VERSION,
+                       'config': config_fingerprint(config),
+                       'inputs': inputs_fingerprint(config)}
+
+        if resume:
+            manifest = self._read_manifest()
+            if manifest is None:
+                raise RuntimeError('Cannot resume: no checkpoint in %s'
+                    % run_dir)
+            if manifest.get('format') != fingerprint['format'] or \
+                    manifest.get('config') != fingerprint['config']:
+                raise RuntimeError('Cannot resume: the checkpoint in %s '
+                    'was created by a different config' % run_dir)
+            if manifest.get('inputs') != fingerprint['inputs']:
+                raise RuntimeError('Cannot resume: the input files of the '
+                    'checkpoint in %s have changed' % run_dir)
+        else:
+            if os.path.exists(self.sources_dir):
+                shutil.rmtree(self.sources_dir)
+            for filename in (MANIFEST_FILENAME, PREPROCESSING_FILENAME):
+                path = os.path.join(run_dir, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            os.makedirs(self.sources_dir)
+            _atomic_write(os.path.join(run_dir, MANIFEST_FILENAME),
+                json.dumps(fingerprint))
+
+    def load_preprocessing(self, context):
+        """
+        Restore the state left by the preprocessing
+        pipeline in the context
+        :returns: True if the state was stored
+        :rtype: bool
+        """
+
+        state = _load(os.path.join(self.run_dir, PREPROCESSING_FILENAME))
+        if state is None:
+            return False
+
+        for name, value in state.items():
+            setattr(context, name, value)
+        return True
+
+    def store_preprocessing(self, context):
+        """Store the state left by the preprocessing pipeline"""
+
+        state = dict((name, getattr(context, name))
+                     for name in PREPROCESSING_STATE if hasattr(context, name))
+        _dump(os.path.join(self.run_dir, PREPROCESSING_FILENAME), state)
+
+    def load_source(self, index):
+        """
+        Return the source model completed by
+        the processing pipeline, None if the
+        source model has not been completed
+        :param index: index of the source model in the definitions
+        :type index: int
+        """
+
+        return _load(self._source_path(index))
+
+    def store_source(self, index, source):
+        """
+        Store a source model completed by the processing pipeline
+        :param index: index of the source model in the definitions
+        :type index: int
+        """
+
+        _dump(self._source_path(index), source)
+
+    def _source_path(self, index):
+        """Return the path where a source model is stored"""
+
+        return os.path.join(self.sources_dir, '%08d.pkl' % index)
+
+    def _read_manifest(self):
+        """Return the manifest of the run, None if not defined"""
+
+        path = os.path.join(self.run_dir, MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as manifest_file:
+            return json.load(manifest_file)
+
+
+def config_fingerprint(config):
+    """
+    Return a digest of the config
+    :param config: config read from the config file
+    :type config: dict
+    :rtype: string
+    """
+
+    return hashlib.sha1(json.dumps(config, sort_keys=True,
+        default=repr)).hexdigest()
+
+
+def inputs_fingerprint(config):
+    """
+    Return a digest of the path, size and modification
+    time of the input files declared in the config, so that
+    a file edited or replaced at the same path is detected
+    without reading its content
+    :param config: config read from the config file
+    :type config: dict
+    :rtype: string
+    """
+
+    stats = []
+    for key in INPUT_FILE_KEYS:
+        patterns = config.get(key) or []
+        if isinstance(patterns, basestring):
+            patterns = [patterns]
+        for pattern in patterns:
+            for filename in sorted(glob.glob(pattern)) or [pattern]:
+                if os.path.exists(filename):
+                    stat = os.stat(filename)
+                    stats.append((filename, stat.st_size,
+                                  repr(stat.st_mtime)))
+                else:
+                    stats.append((filename, None, None))
+
+    return hashlib.sha1(json.dumps(stats)).hexdigest()
+
+
+def _load(path):
+    """
+    Return the object pickled in a file, None if the
+    file doesn't exist or has been truncated
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as pickle_file:
+            return cPickle.load(pickle_file)
+    except (EOFError, cPickle.UnpicklingError):
+        LOGGER.warning("Ignoring truncated checkpoint %s" % path)
+        return None
+
+
+def _dump(path, obj):
+    """Pickle an object in a file"""
+
+    _atomic_write(path, cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL))
+
+
+def _atomic_write(path, data):
+    """
+    Write data in a file, a run interrupted while
+    writing never leaves a partially written file
+    """
+
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as data_file:
+        data_file.write(data)
+        data_file.flush()
+        os.fsync(data_file.fileno())
+    # Rename is atomic
+    os.rename(tmp_path, path)
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+The purpose of this module is to provide objects
+to read compressed input files (gzip, bzip2 or xz)
+as plain files: data is decompressed in a background
+thread while the reader parses it, and is never
+written uncompressed on disk.
+"""
+
+import os
+import bz2
+import gzip
+import threading
+from Queue import Queue, Empty
+
+# Decompressed bytes produced at a time, the queue
+# bounds the memory used when the reader is slower
+CHUNK_SIZE = 1 << 20
+QUEUE_SIZE = 8
+
+
+def _open_xz(filename):
+    """Return a file object decompressing a xz file"""
+
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise RuntimeError('Reading %s requires the backports.lzma '
+                'package' % filename)
+    return lzma.LZMAFile(filename)
+
+
+COMPRESSED_EXTENSIONS = {'.gz': gzip.open,
+                         '.bz2': bz2.BZ2File,
+                         '.xz': _open_xz}
+
+
+def uncompressed_name(filename):
+    """
+    Return the name of a file without its
+    compression extension (e.g. catalogue.csv.gz
+    is catalogue.csv)
+    :param filename: path of the file
+    :type filename: string
+    :rtype: string
+    """
+
+    root, extension = os.path.splitext(filename)
+    if extension.lower() in COMPRESSED_EXTENSIONS:
+        return root
+    return filename
+
+
+def open_input(filename):
+    """
+    Return a file object reading the file, compressed
+    files are decompressed in a background thread.
+    :param filename: path of the file
+    :type filename: string
+    """
+
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in COMPRESSED_EXTENSIONS:
+        return BackgroundReader(filename, COMPRESSED_EXTENSIONS[extension])
+    return open(filename)
+
+
+class BackgroundReader(object):
+    """
+    BackgroundReader is a read only file object whose
+    data is produced by a thread reading from another
+    file object (e.g. a decompressing one), so that
+    producing and parsing the data are overlapped.
+    """
+
+    def __init__(self, filename, opener, chunk_size=CHUNK_SIZE,
+                 queue_size=QUEUE_SIZE):
+        """
+        Constructor
+        :param filename: path of the file
+        :type filename: string
+        :param opener: function returning the file object
+            the data is read from, called with filename
+        :keyword chunk_size: bytes read at a time
+        :keyword queue_size: chunks read in advance
+        """
+
+        self.name = filename
+        self.closed = False
+        self._source = opener(filename)
+        self._chunk_size = chunk_size
+        self._chunks = Queue(queue_size)
+        self._stop = threading.Event()
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+
+        self._thread = threading.Thread(target=self._produce)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _produce(self):
+        """Read the source in chunks, an empty chunk marks the end"""
+
+        try:
+            while not self._stop.is_set():
+                chunk = self._source.read(self._chunk_size)
+                self._chunks.put(chunk)
+                if not chunk:
+                    break
+        except Exception as error:
+            # Raised in the reading thread
+            self._chunks.put(error)
+        finally:
+            self._source.close()
+
+    def _fill(self):
+        """
+        Append the next chunk to the buffer
+        :returns: False at the end of the file
+        :rtype: bool
+        """
+
+        if self._eof:
+            return False
+
+        chunk = self._chunks.get()
+        if isinstance(chunk, Exception):
+            self._eof = True
+            raise chunk
+        if not chunk:
+            self._eof = True
+            return False
+
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def read(self, size=-1):
+        """
+        Return at most size bytes, all the
+        remaining bytes if size is negative
+        """
+
+        while (size < 0 or len(self._buffer) - self._position < size) \
+                and self._fill():
+            pass
+
+        end = len(self._buffer) if size < 0 else self._position + size
+        data = self._buffer[self._position:end]
+        self._position += len(data)
+        return data
+
+    def readline(self):
+        """Return the next line, an empty string at the end"""
+
+        end = self._buffer.find('\n', self._position)
+        while end < 0:
+            searched = len(self._buffer) - self._position
+            if not self._fill():
+                end = len(self._buffer) - 1
+                break
+            end = self._buffer.find('\n', searched)
+
+        line = self._buffer[self._position:end + 1]
+        self._position = end + 1
+        return line
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def close(self):
+        """Stop the reading thread"""
+
+        if self.closed:
+            return
+        self.closed = True
+        self._stop.set()
+        # Unblock the thread waiting for a free slot
+        while self._thread.is_alive():
+            try:
+                self._chunks.get(timeout=0.1)
+            except Empty:
+                pass
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -25,6 +25,8 @@ import sys
 import argparse
 import logging
 
+from mtoolkit.profiling import DEFAULT_TOP_FUNCTIONS
+
 
 def build_cmd_parser():
     """
@@ -44,6 +46,41 @@ def build_cmd_parser():
                         """,
                         action='store_true')
 
+    parser.add_argument('-p', '--profile',
+                        dest='profile_dir',
+                        nargs='?',
+                        const='profile',
+                        metavar='DIR',
+                        help="""Run the workflow under the
+                        profiler, writing a profile for
+                        every job and a report of the
+                        hot functions in DIR
+                        (default: profile)""")
+
+    parser.add_argument('--profile-top',
+                        dest='profile_top',
+                        type=int,
+                        default=DEFAULT_TOP_FUNCTIONS,
+                        metavar='N',
+                        help="""Number of functions listed
+                        in the profile report (default: %s)""" %
+                        DEFAULT_TOP_FUNCTIONS)
+
+    parser.add_argument('-r', '--resume',
+                        action='store_true',
+                        help="""Resume an interrupted run from
+                        the checkpoint stored in the
+                        checkpoint_dir of the config,
+                        skipping completed jobs and
+                        source models""")
+
+    parser.add_argument('-s', '--sweep',
+                        action='store_true',
+                        help="""Evaluate the combinations of
+                        preprocessing parameters declared in
+                        the sweep section of the config,
+                        instead of running the workflow""")
+
     parser.add_argument('-v', '--version',
                         action='version',
                         version="%(prog)s 0.1")
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide objects
+capable of storing a declustered catalogue, so that
+a catalogue growing by appended events is declustered
+again only where the new events are.
+"""
+
+import os
+import zipfile
+
+import numpy as np
+
+from mtoolkit.scientific.catalogue_utilities import catalogue_features
+
+# Bump when the cache layout changes
+CACHE_FORMAT_VERSION = 2
+
+
+class DeclusteringCache(object):
+    """
+    DeclusteringCache stores a catalogue matrix and the
+    decimal time of its events with their cluster numbers
+    and flags in a numpy archive, together with the
+    declustering parameters. The cache is valid for a
+    catalogue whose first events are the cached ones,
+    declustered with the same parameters.
+    """
+
+    def __init__(self, filename):
+        """
+        Constructor
+        :param filename: path of the archive
+        :type filename: string
+        """
+
+        self.filename = filename
+
+    def load(self, catalog_matrix, params):
+        """
+        Return the cluster numbers and flags of the cached
+        events, None if the cache is not valid for the catalogue
+        :param catalog_matrix: catalogue in matrix format
+        :type catalog_matrix: numpy.ndarray
+        :param params: declustering parameters
+        :type params: tuple
+        :returns: tuple (vcl, flag_vector) or None
+        """
+
+        if not os.path.exists(self.filename):
+            return None
+
+        try:
+            archive = np.load(self.filename)
+            cached = dict((name, archive[name]) for name in archive.files)
+        except (IOError, ValueError, KeyError, zipfile.BadZipfile):
+            # A truncated archive is treated as a cache miss
+            return None
+
+        if cached.get('format') != CACHE_FORMAT_VERSION or \
+                cached.get('params').tolist() != _params_repr(params):
+            return None
+
+        # The decimal time takes into account the time of the
+        # events, which is not part of the catalogue matrix
+        nold = len(cached['vcl'])
+        if nold > len(catalog_matrix) or \
+                not np.array_equal(cached['catalog_matrix'],
+                                   catalog_matrix[:nold]) or \
+                not np.array_equal(cached['year_dec'],
+                    catalogue_features(catalog_matrix).year_dec[:nold]):
+            return None
+
+        return cached['vcl'], cached['flag_vector']
+
+    def store(self, catalog_matrix, vcl, flag_vector, params):
+        """
+        Store the declustered catalogue
+        :param catalog_matrix: catalogue in matrix format
+        :type catalog_matrix: numpy.ndarray
+        :param vcl: cluster numbers
+        :type vcl: numpy.ndarray
+        :param flag_vector: cluster flags
+        :type flag_vector: numpy.ndarray
+        :param params: declustering parameters
+        :type params: tuple
+        """
+
+        tmp_filename = '%s.%s.tmp' % (self.filename, os.getpid())
+        with open(tmp_filename, 'wb') as archive:
+            np.savez(archive, format=CACHE_FORMAT_VERSION,
+                params=np.array(_params_repr(params)),
+                catalog_matrix=catalog_matrix,
+                year_dec=catalogue_features(catalog_matrix).year_dec,
+                vcl=vcl,
+                flag_vector=flag_vector)
+        # Rename is atomic, an interrupted run never
+        # leaves a partially written cache
+        os.rename(tmp_filename, self.filename)
+
+
+def _params_repr(params):
+    """Return the parameters as a list of strings"""
+
+    return [repr(param) for param in params]
@@ -24,8 +24,13 @@ create eq entries.
 
 import os
 from datetime import datetime as time
+from itertools import izip, imap
 from csv import DictReader, DictWriter
 
+import numpy as np
+
+from mtoolkit.compressed import uncompressed_name
+
 FIELDNAMES = ['eventID', 'Agency', 'Identifier',
               'year', 'month', 'day',
               'hour', 'minute', 'second',
@@ -36,6 +41,20 @@ FIELDNAMES = ['eventID', 'Agency', 'Identifier',
               'mb', 'sigmamb', 'ML',
               'sigmaML']
 
+# Extension of catalogues stored in binary format
+BINARY_EXTENSION = '.npz'
+
+# Extensions of catalogues in the QuakeML format
+QUAKEML_EXTENSIONS = ('.xml', '.qml', '.quakeml')
+
+# Rows formatted at a time by the columnar writer
+WRITER_CHUNK_SIZE = 65536
+
+# Characters csv.writer quotes strings for, and
+# the line terminator it writes
+CSV_SPECIAL_CHARS = ',"\r\n'
+CSV_LINE_TERMINATOR = '\r\n'
+
 
 class MalformedCatalogError(Exception):
     """
@@ -69,12 +88,14 @@ class EqEntryReader(object):
 
     EMPTY_STRING = ''
 
-    def __init__(self, eq_entries_source):
+    def __init__(self, eq_entries_source, require_mw=True):
         """
         to_int   - fields to be converted in integer
         to_float - fields to be converted in float
         check_map - associates each field with its own check
         current_line - denotes the line in use by the read method
+        require_mw - when False Mw is not compulsory, a missing
+            Mw is left empty (i.e. to be homogenised)
         """
         self.validate_csv_catalog(eq_entries_source)
 
@@ -91,7 +112,9 @@ class EqEntryReader(object):
                 'ML', 'sigmaML']
 
         self.compulsory_fields = self.to_int + [self.to_float[2],
-                self.to_float[3], self.to_float[7], self.to_float[9]]
+                self.to_float[3], self.to_float[7]]
+        if require_mw:
+            self.compulsory_fields.append(self.to_float[9])
 
         self.check_map = {
                 'eventID': self.check_positive_value,
@@ -348,3 +371,237 @@ class EqEntryWriter(object):
             writer = DictWriter(output_file, FIELDNAMES)
             writer.writeheader()
             writer.writerows(entries)
+
+    def write_columns(self, eq_catalog, indexes=None):
+        """
+        Write the rows of a catalogue stored by columns in the
+        csv file, the file is the one written by write_rows
+        with the eq entries of the catalogue. Rows are
+        formatted a chunk at a time, column by column.
+        :param eq_catalog: earthquake catalogue
+        :type eq_catalog: EqCatalogColumns
+        :keyword indexes: indexes of the rows to write,
+            all the rows if None
+        :type indexes: numpy.ndarray
+        """
+
+        if indexes is None:
+            indexes = np.arange(len(eq_catalog))
+
+        with open(self.output_filename, 'w') as output_file:
+            DictWriter(output_file, FIELDNAMES).writeheader()
+            for start in xrange(0, len(indexes), WRITER_CHUNK_SIZE):
+                chunk = indexes[start:start + WRITER_CHUNK_SIZE]
+                fields = [_format_column(eq_catalog.column(field)[chunk],
+                                         field) for field in FIELDNAMES]
+                output_file.write(CSV_LINE_TERMINATOR.join(
+                    imap(','.join, izip(*fields))))
+                output_file.write(CSV_LINE_TERMINATOR)
+
+    def write_binary(self, eq_catalog, indexes=None):
+        """
+        Write the rows of a catalogue stored by columns in a
+        numpy archive, one array for every field, which is
+        read back by EqCatalogColumns.load
+        :param eq_catalog: earthquake catalogue
+        :type eq_catalog: EqCatalogColumns
+        :keyword indexes: indexes of the rows to write,
+            all the rows if None
+        :type indexes: numpy.ndarray
+        """
+
+        if indexes is None:
+            indexes = np.arange(len(eq_catalog))
+
+        columns = dict((field, eq_catalog.column(field)[indexes])
+                       for field in FIELDNAMES)
+        columns['Agency'] = np.array(columns['Agency'].tolist(), dtype=str)
+        with open(self.output_filename, 'wb') as output_file:
+            np.savez(output_file, **columns)
+
+
+class EqCatalogColumns(object):
+    """
+    EqCatalogColumns holds an eq catalogue by columns,
+    one numpy array for every field of the eq entries.
+    Missing values of numeric fields are NaN. Eq entries
+    are built on demand, with an empty string in place
+    of missing values, so that the catalogue can be used
+    like a list of eq entries.
+    """
+
+    INT_FIELDS = ['eventID', 'Identifier', 'year', 'month',
+                  'day', 'hour', 'minute']
+
+    # Rows allocated at a time by from_entries
+    CHUNK_SIZE = 4096
+
+    def __init__(self, columns):
+        """
+        Constructor
+        :param columns: fields of FIELDNAMES mapped to arrays
+            of the same length
+        :type columns: dict
+        """
+
+        self.columns = columns
+
+    @classmethod
+    def from_entries(cls, eq_entries):
+        """
+        Return the catalogue of the eq entries, arrays
+        are filled while entries are consumed, so that
+        entries can be generated one at a time.
+        :param eq_entries: eq entries (e.g. EqEntryReader.read())
+        :rtype: EqCatalogColumns
+        """
+
+        numeric = [field for field in FIELDNAMES if field != 'Agency']
+        columns = dict((field, np.empty(cls.CHUNK_SIZE))
+                       for field in numeric)
+        agencies = []
+        # Agencies are few, each name is stored once
+        names = {}
+
+        size = 0
+        for eq_entry in eq_entries:
+            if size == len(columns['eventID']):
+                for field in numeric:
+                    columns[field] = np.resize(columns[field], 2 * size)
+            for field in numeric:
+                value = eq_entry[field]
+                columns[field][size] = np.nan \
+                    if value == EqEntryReader.EMPTY_STRING else value
+            agency = eq_entry['Agency']
+            if isinstance(agency, unicode):
+                agency = agency.encode('utf-8')
+            agencies.append(names.setdefault(agency, agency))
+            size += 1
+
+        for field in numeric:
+            columns[field] = columns[field][:size].copy()
+        columns['Agency'] = np.array(agencies, dtype=object)
+        return cls(columns)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Return the catalogue stored in a binary
+        file by EqEntryWriter.write_binary
+        :param filename: path of the numpy archive
+        :type filename: string
+        :rtype: EqCatalogColumns
+        """
+
+        archive = np.load(filename)
+        try:
+            columns = dict((field, archive[field]) for field in FIELDNAMES)
+        except KeyError as missing:
+            raise RuntimeError('Invalid binary catalogue %s, missing '
+                'field %s' % (filename, missing))
+        finally:
+            archive.close()
+        columns['Agency'] = columns['Agency'].astype(object)
+        return cls(columns)
+
+    def __len__(self):
+        return len(self.columns['eventID'])
+
+    def __getitem__(self, index):
+        """Return the eq entry at the given index"""
+
+        eq_entry = {'Agency': self.columns['Agency'][index]}
+        for field in FIELDNAMES:
+            if field == 'Agency':
+                continue
+            value = self.columns[field][index]
+            if value != value:
+                eq_entry[field] = EqEntryReader.EMPTY_STRING
+            elif field in self.INT_FIELDS:
+                eq_entry[field] = int(value)
+            else:
+                eq_entry[field] = float(value)
+        return eq_entry
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def column(self, field):
+        """
+        Return the values of a field
+        :param field: one of FIELDNAMES
+        :type field: string
+        :rtype: numpy.ndarray
+        """
+
+        return self.columns[field]
+
+    def select(self, indexes):
+        """
+        Return the catalogue of the events at the given indexes
+        :param indexes: indexes or boolean mask of the events
+        :type indexes: numpy.ndarray
+        :rtype: EqCatalogColumns
+        """
+
+        return EqCatalogColumns(dict((field, values[indexes])
+                                     for field, values in
+                                     self.columns.items()))
+
+
+def is_binary_catalogue(filename):
+    """
+    Return True if the catalogue file is a numpy
+    archive written by EqEntryWriter.write_binary
+    :param filename: path of the catalogue file
+    :type filename: string
+    """
+
+    return filename.lower().endswith(BINARY_EXTENSION)
+
+
+def is_quakeml(filename):
+    """
+    Return True if the catalogue file is a QuakeML document
+    (compressed or not), read by mtoolkit.quakeml
+    :param filename: path of the catalogue file
+    :type filename: string
+    """
+
+    return uncompressed_name(filename).lower().endswith(QUAKEML_EXTENSIONS)
+
+
+def _format_column(values, field):
+    """
+    Return the values of a column as csv fields,
+    formatted like csv.writer formats eq entries.
+    Catalogue columns repeat few values (e.g. years,
+    magnitudes), each distinct value is formatted once.
+    """
+
+    if field == 'Agency':
+        missing = np.zeros(len(values), dtype=bool)
+        format_value = _quote
+    else:
+        missing = np.isnan(values)
+        if field in EqCatalogColumns.INT_FIELDS:
+            format_value = lambda value: str(int(value))
+        else:
+            # csv.writer writes floats with repr
+            format_value = repr
+
+    uniques, inverse = np.unique(values[~missing], return_inverse=True)
+    fields = np.empty(len(values), dtype=object)
+    fields[missing] = EqEntryReader.EMPTY_STRING
+    fields[~missing] = np.array(map(format_value, uniques.tolist()) or [''],
+        dtype=object)[inverse]
+    return fields.tolist()
+
+
+def _quote(value):
+    """Return a string quoted as csv.writer quotes it"""
+
+    if any(char in value for char in CSV_SPECIAL_CHARS):
+        return '"%s"' % value.replace('"', '""')
+    return value
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide objects
+which measure the execution of jobs: wall time,
+cpu time, peak memory and number of processed events.
+"""
+
+import sys
+import time
+import json
+import resource
+
+# ru_maxrss is expressed in kilobytes on linux, in bytes on osx
+RSS_TO_MB = 1024. * 1024. if sys.platform == 'darwin' else 1024.
+
+SUMMARY_HEADER = ('job', 'calls', 'wall (s)', 'cpu (s)',
+                  'peak rss +MB', 'events in', 'events out')
+
+
+def _thread_usage():
+    """
+    Return the getrusage target measuring the calling
+    thread (RUSAGE_THREAD is linux only and missing from
+    the resource module of python 2), None if unsupported
+    """
+
+    who = getattr(resource, 'RUSAGE_THREAD',
+                  1 if sys.platform.startswith('linux') else None)
+    if who is None:
+        return None
+    try:
+        resource.getrusage(who)
+    except (ValueError, resource.error):
+        return None
+    return who
+
+RUSAGE_THREAD = _thread_usage()
+
+# Cpu time is measured on the thread running the job, when
+# supported, so jobs running concurrently aren't counted
+# twice; work of child processes is never counted
+CPU_TIME_SCOPE = 'process' if RUSAGE_THREAD is None else 'thread'
+
+SUMMARY_NOTES = ('cpu time of the %s running the job, without child '
+                 'processes' % CPU_TIME_SCOPE,
+                 'peak rss +MB: growth of the peak memory of the process, '
+                 '0 for jobs below an earlier peak, shared by concurrent jobs')
+
+
+class JobMetrics(object):
+    """
+    JobMetrics runs jobs collecting a record
+    of measurements for every execution,
+    records are available as a json-lines file
+    or as a summary table.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def measure(self, job, context):
+        """
+        Run the job and record its measurements
+        :param job: job to be executed
+        :type job: callable
+        :param context: shared datastore across different jobs
+            in a pipeline
+        """
+
+        events_in = count_events(context)
+        rss_before = _peak_rss()
+        cpu_before = cpu_time()
+        wall_before = time.time()
+
+        job(context)
+
+        record = {'job': job.__name__,
+                  'source': _source_name(context),
+                  'wall_time': time.time() - wall_before,
+                  'cpu_time': cpu_time() - cpu_before,
+                  'cpu_time_scope': CPU_TIME_SCOPE,
+                  'peak_rss_delta_mb': _peak_rss() - rss_before,
+                  'peak_rss_mb': _peak_rss(),
+                  'events_in': events_in,
+                  'events_out': count_events(context)}
+        self.records.append(record)
+
+        return record
+
+    def write(self, filename):
+        """
+        Write records in a json-lines file
+        :param filename: output filename
+        :type filename: string
+        """
+
+        with open(filename, 'w') as metrics_file:
+            for record in self.records:
+                metrics_file.write(json.dumps(record, sort_keys=True))
+                metrics_file.write('\n')
+
+    def summary(self):
+        """
+        Return a table which aggregates records by job,
+        jobs are sorted by decreasing wall time.
+        :rtype: string
+        """
+
+        aggregated = {}
+        for record in self.records:
+            row = aggregated.setdefault(record['job'],
+                [record['job'], 0, 0.0, 0.0, 0.0, 0, 0])
+            row[1] += 1
+            row[2] += record['wall_time']
+            row[3] += record['cpu_time']
+            row[4] = max(row[4], record['peak_rss_delta_mb'])
+            row[5] += record['events_in']
+            row[6] += record['events_out']
+
+        lines = ['%-28s %6s %10s %10s %13s %10s %10s' % SUMMARY_HEADER]
+        for row in sorted(aggregated.values(), key=lambda row: -row[2]):
+            lines.append('%-28s %6d %10.3f %10.3f %13.1f %10d %10d' %
+                tuple(row))
+        lines.extend('* %s' % note for note in SUMMARY_NOTES)
+        return '\n'.join(lines)
+
+
+def count_events(context):
+    """
+    Return the number of events the jobs are working on:
+    the events filtered for the current source during
+    processing, the working catalog during preprocessing.
+    """
+
+    if getattr(context, 'cur_sm', None) is not None:
+        events = getattr(context, 'current_filtered_eq', None)
+    else:
+        events = getattr(context, 'working_catalog', None)
+        if events is None:
+            events = getattr(context, 'eq_catalog', None)
+
+    if events is None:
+        return 0
+    return len(events)
+
+
+def _source_name(context):
+    """
+    Return the name of the source under processing,
+    None during preprocessing
+    """
+
+    source = getattr(context, 'cur_sm', None)
+    if source is None:
+        return None
+    return getattr(source, 'name', None)
+
+
+def cpu_time():
+    """
+    Return user plus system time of the calling thread,
+    of the process where per thread usage is unsupported
+    """
+
+    usage = resource.getrusage(resource.RUSAGE_SELF
+                               if RUSAGE_THREAD is None else RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss():
+    """Return the peak resident set size of the process in MB"""
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / RSS_TO_MB
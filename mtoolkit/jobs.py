@@ -21,11 +21,21 @@ The purpose of this module is to provide functions which tackle specific job,
 some of them wrap scientific functions defined in the scientific module.
 """
 
+import os
+import glob
 import logging
+from functools import wraps
+from multiprocessing import Pool
+
 import numpy as np
 
-from mtoolkit.eqcatalog import EqEntryReader, EqEntryWriter
-from nrml.reader import NRMLReader
+from mtoolkit.eqcatalog import (EqEntryReader, EqEntryWriter,
+                                EqCatalogColumns, is_binary_catalogue,
+                                is_quakeml, BINARY_EXTENSION)
+from mtoolkit.compressed import open_input
+from mtoolkit.declustering_cache import DeclusteringCache
+from mtoolkit.scientific.catalogue_utilities import catalogue_features
+from nrml.cache import SourceModelCache
 from nrml.nrml_xml import get_data_path, SCHEMA_DIR
 from mtoolkit.source_model import default_area_source
 
@@ -35,8 +45,14 @@ CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX = 0
 CATALOG_MATRIX_MW_INDEX = 5
 CATALOG_MATRIX_FIXED_COLOUMNS = ['year', 'month', 'day',
                                 'longitude', 'latitude', 'Mw', 'sigmaMw']
+CATALOG_TIME_COLOUMNS = ['hour', 'minute', 'second']
 COMPLETENESS_TABLE_MW_INDEX = 1
 SIGMA_MW_INDEX = 6
+HOMOGENISATION_KEY = 'Homogenisation'
+DEDUPLICATION_KEY = 'Deduplication'
+SMOOTHED_SEISMICITY_KEY = 'SmoothedSeismicity'
+SMOOTHED_SEISMICITY_FIELDS = ['longitude', 'latitude', 'rate', 'a_value']
+GLOBAL_REGION = (-180.0, -90.0, 180.0, 90.0)
 
 LOGGER = logging.getLogger('mt_logger')
 
@@ -45,14 +61,29 @@ def logged_job(job):
     """
     Decorate a job by adding logging
     statements before and after the execution
-    of the job.
+    of the job, the execution is measured when
+    the context collects metrics and profiled
+    when the context holds a profiler.
     """
 
+    @wraps(job)
     def wrapper(context):
         """Wraps a job, adding logging statements"""
         LOGGER.info(''.center(80, '-'))
         LOGGER.info(" %22s " % job.__name__.upper())
-        job(context)
+
+        run_job = job
+        profiler = getattr(context, 'profiler', None)
+        if profiler is not None:
+            run_job = profiler.profiled(job)
+
+        metrics = getattr(context, 'metrics', None)
+        if metrics is None:
+            run_job(context)
+        else:
+            record = metrics.measure(run_job, context)
+            LOGGER.debug("* Wall time: %.3fs, cpu time: %.3fs" %
+                (record['wall_time'], record['cpu_time']))
 
     return wrapper
 
@@ -60,37 +91,176 @@ def logged_job(job):
 @logged_job
 def read_eq_catalog(context):
     """
-    Create eq entries by reading an e] catalog.
+    Create eq entries by reading an eq catalog, in csv
+    format or, when the file has a QuakeML extension
+    (.xml, .qml, .quakeml), in QuakeML format. Files
+    compressed with gzip, bzip2 or xz (.gz, .bz2, .xz)
+    are decompressed while they are read, a .npz file
+    is a catalogue stored in binary format. The eq
+    entries are stored by columns.
     :param context: shared datastore across different jobs
         in a pipeline
     """
 
-    with open(context.config['eq_catalog_file']) as eq_catalog:
-        reader = EqEntryReader(eq_catalog)
-        context.eq_catalog = reader.read_eq_catalog()
+    eq_catalog_file = context.config['eq_catalog_file']
+    # Events lacking Mw are read when it is homogenised
+    require_mw = not context.config.get(HOMOGENISATION_KEY)
+    if is_binary_catalogue(eq_catalog_file):
+        context.eq_catalog = EqCatalogColumns.load(eq_catalog_file)
+    else:
+        with open_input(eq_catalog_file) as eq_catalog:
+            if is_quakeml(eq_catalog_file):
+                # Imported here, lxml is loaded only
+                # when a QuakeML catalogue is read
+                from mtoolkit.quakeml import QuakeMLReader
+                reader = QuakeMLReader(eq_catalog, require_mw)
+            else:
+                reader = EqEntryReader(eq_catalog, require_mw)
+            context.eq_catalog = EqCatalogColumns.from_entries(reader.read())
+
+    LOGGER.debug("* Eq catalog length: %s" % len(context.eq_catalog))
+
+
+@logged_job
+def homogenisation(context):
+    """
+    Convert to Mw the magnitudes of the events lacking
+    Mw, with the conversions declared in the config.
+    Events still lacking Mw are removed from the eq
+    catalog.
+    :param context: shared datastore across different jobs
+        in a pipeline
+    """
+
+    eq_catalog = context.eq_catalog
+    if not isinstance(eq_catalog, EqCatalogColumns):
+        eq_catalog = EqCatalogColumns.from_entries(eq_catalog)
+
+    mw, sigma_mw, _ = context.map_sc['homogenisation'](eq_catalog.columns,
+        context.config[HOMOGENISATION_KEY].get('conversions') or [])
+    eq_catalog.columns['Mw'] = mw
+    eq_catalog.columns['sigmaMw'] = sigma_mw
+
+    with_mw = ~np.isnan(mw)
+    if not np.all(with_mw):
+        LOGGER.warning("* Removed %d events without Mw after "
+            "homogenisation" % np.sum(~with_mw))
+        eq_catalog = eq_catalog.select(with_mw)
+    context.eq_catalog = eq_catalog
 
     LOGGER.debug("* Eq catalog length: %s" % len(context.eq_catalog))
 
 
+@logged_job
+def deduplication(context):
+    """
+    Remove from the eq catalog the events reported by
+    several agencies, keeping the event of the preferred
+    agency, with the tolerances declared in the config.
+    :param context: shared datastore across different jobs
+        in a pipeline
+    """
+
+    eq_catalog = context.eq_catalog
+    if not isinstance(eq_catalog, EqCatalogColumns):
+        eq_catalog = EqCatalogColumns.from_entries(eq_catalog)
+
+    config = context.config[DEDUPLICATION_KEY]
+    duplicate_of = context.map_sc['deduplication'](eq_catalog.columns,
+        config['time_window'], config['distance_window'],
+        config.get('magnitude_window'), config.get('agencies'))
+
+    duplicates = duplicate_of >= 0
+    context.eq_catalog = eq_catalog.select(~duplicates)
+
+    LOGGER.debug("* Number of duplicate events removed: %s" %
+        np.sum(duplicates))
+
+
 @logged_job
 def read_source_model(context):
     """
     Create source model definitions by reading a source model.
+    The source model could be split across several nrml
+    files, declared as a list of filenames or glob patterns,
+    in this case files are parsed in parallel.
     :param context: shared datastore across different jobs
         in a pipeline
     """
 
-    sm_definitions = []
+    filenames = _source_model_files(context.config['source_model_file'])
+    cache_dir = context.config.get('source_model_cache_dir')
+
+    if len(filenames) > 1:
+        pool = Pool(context.config.get('source_model_workers'))
+        try:
+            sources_per_file = pool.map(_read_source_model_file,
+                [(filename, cache_dir) for filename in filenames])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        sources_per_file = [_read_source_model_file(
+            (filenames[0], cache_dir))]
 
-    reader = NRMLReader(context.config['source_model_file'], NRML_SCHEMA_PATH)
-    for sm in reader.read():
-        sm_definitions.append(sm)
+    # Definitions keep the order of the declared files
+    context.sm_definitions = [sm for sources in sources_per_file
+                                for sm in sources]
 
-        context.sm_definitions = sm_definitions
+    LOGGER.debug("* Number of source model files: %s" % len(filenames))
 
     LOGGER.debug("* Eq number source models: %s" % len(context.sm_definitions))
 
 
+def _source_model_files(source_model_file):
+    """
+    Return the list of nrml files declared in the
+    config, expanding glob patterns in sorted order.
+    :param source_model_file: filename, glob pattern or
+        a list of them
+    """
+
+    if isinstance(source_model_file, basestring):
+        source_model_file = [source_model_file]
+
+    filenames = []
+    for pattern in source_model_file:
+        matching = sorted(glob.glob(pattern))
+        # A non existent filename is kept, the reader
+        # reports the error
+        filenames.extend(matching if matching else [pattern])
+    return filenames
+
+
+def _read_source_model_file(args):
+    """
+    Return the source models defined in a nrml file,
+    using a snapshot when a cache dir is defined.
+    It's defined at module level to be used
+    by worker processes.
+    :param args: tuple (filename, cache_dir)
+    """
+
+    filename, cache_dir = args
+
+    if cache_dir:
+        cache = SourceModelCache(cache_dir)
+        sm_definitions = cache.load(filename)
+        if sm_definitions is not None:
+            LOGGER.debug("* Source model %s loaded from snapshot" % filename)
+            return sm_definitions
+
+    # lxml is loaded only when a nrml file is parsed
+    from nrml.reader import NRMLReader
+
+    reader = NRMLReader(filename, NRML_SCHEMA_PATH)
+    sm_definitions = list(reader.read())
+    if cache_dir:
+        cache.store(filename, sm_definitions)
+
+    return sm_definitions
+
+
 @logged_job
 def create_default_source_model(context):
     """
@@ -112,14 +282,28 @@ def create_catalog_matrix(context):
         in a pipeline
     """
 
-    matrix = []
-    for eq_entry in context.eq_catalog:
-        matrix.append([eq_entry[coloumn] for coloumn in
-                        CATALOG_MATRIX_FIXED_COLOUMNS])
+    if isinstance(context.eq_catalog, EqCatalogColumns):
+        matrix = np.column_stack([context.eq_catalog.column(coloumn)
+            for coloumn in CATALOG_MATRIX_FIXED_COLOUMNS])
+        time_columns = [np.nan_to_num(context.eq_catalog.column(coloumn))
+                        for coloumn in CATALOG_TIME_COLOUMNS]
+    else:
+        matrix = []
+        for eq_entry in context.eq_catalog:
+            matrix.append([eq_entry[coloumn] for coloumn in
+                            CATALOG_MATRIX_FIXED_COLOUMNS])
+        time_columns = [np.array([float(eq_entry[coloumn] or 0.)
+                                  for eq_entry in context.eq_catalog])
+                        for coloumn in CATALOG_TIME_COLOUMNS]
 
     context.catalog_matrix = np.array(matrix)
     context.working_catalog = np.array(matrix)
 
+    # Decimal time used by scientific functions takes
+    # into account the time of the events
+    catalogue_features(context.catalog_matrix, *time_columns)
+    catalogue_features(context.working_catalog, *time_columns)
+
 
 @logged_job
 def create_default_values(context):
@@ -141,14 +325,46 @@ def create_default_values(context):
 def gardner_knopoff(context):
     """
     Apply gardner_knopoff declustering algorithm to the eq catalog.
+    When a declustering cache is defined in the config and the
+    catalogue extends the cached one, only the events affected
+    by the new ones are declustered again. When declustering
+    workers are defined the catalogue is declustered in spatial
+    tiles by a process pool.
     :param context: shared datastore across different jobs
         in a pipeline
     """
 
-    vcl, vmain_shock, flag_vector = context.map_sc['gardner_knopoff'](
-            context.working_catalog,
-            context.config['GardnerKnopoff']['time_dist_windows'],
-            context.config['GardnerKnopoff']['foreshock_time_window'])
+    params = (context.config['GardnerKnopoff']['time_dist_windows'],
+              context.config['GardnerKnopoff']['foreshock_time_window'])
+
+    cache_file = context.config.get('declustering_cache_file')
+    previous = None
+    if cache_file:
+        cache = DeclusteringCache(cache_file)
+        previous = cache.load(context.working_catalog, params)
+
+    workers = context.config.get('declustering_workers')
+    if previous is None and workers:
+        # Without declustering_tile_size the kernel default
+        # applies, the kernel module is loaded only here
+        options = {'workers': workers}
+        if context.config.get('declustering_tile_size'):
+            options['tile_size'] = context.config['declustering_tile_size']
+        vcl, vmain_shock, flag_vector = \
+            context.map_sc['gardner_knopoff_tiled'](
+                context.working_catalog, *params, **options)
+    elif previous is None:
+        vcl, vmain_shock, flag_vector = context.map_sc['gardner_knopoff'](
+                context.working_catalog, *params)
+    else:
+        LOGGER.debug("* Number of new events: %s" %
+            (len(context.working_catalog) - len(previous[0])))
+        vcl, vmain_shock, flag_vector = \
+            context.map_sc['gardner_knopoff_update'](
+                context.working_catalog, previous[0], previous[1], *params)
+
+    if cache_file:
+        cache.store(context.working_catalog, vcl, flag_vector, params)
 
     context.vcl = vcl
     context.working_catalog = vmain_shock
@@ -243,21 +459,25 @@ def store_preprocessed_catalog(context):
     """
     Write in a csv file the earthquake
     catalog after preprocessing jobs (i.e.
-    gardner_knopoff, stepp)
+    gardner_knopoff, stepp), in a numpy archive
+    when the file has the .npz extension
     :param context: shared datastore across different jobs
         in a pipeline
     """
 
-    writer = EqEntryWriter(
-        context.config['pprocessing_result_file'])
+    result_file = context.config['pprocessing_result_file']
+    writer = EqEntryWriter(result_file)
     indexes_entries_to_store = np.where(context.selected_eq_vector == 0)[0]
     number_written_eq = len(indexes_entries_to_store)
 
-    entries = []
-    for index in indexes_entries_to_store:
-        entries.append(context.eq_catalog[index])
+    eq_catalog = context.eq_catalog
+    if not isinstance(eq_catalog, EqCatalogColumns):
+        eq_catalog = EqCatalogColumns.from_entries(eq_catalog)
 
-    writer.write_rows(entries)
+    if is_binary_catalogue(result_file):
+        writer.write_binary(eq_catalog, indexes_entries_to_store)
+    else:
+        writer.write_columns(eq_catalog, indexes_entries_to_store)
 
     LOGGER.debug("* Stored Eq entries: %d" % number_written_eq)
 
@@ -364,3 +584,96 @@ def maximum_magnitude(context):
 
     LOGGER.debug("Max magnitude: %3.3f, Sigma: %3.3f"
         % (max_mag, max_mag_sigma))
+
+
+@logged_job
+def smoothed_seismicity(context):
+    """
+    Distribute the rate of the current source model on a
+    grid of cells, proportionally to the smoothed complete
+    events of the source, and store the rate and the a
+    value of every cell (consistent with the b value of the
+    source), this job should depends on values computed by
+    recurrence.
+    :param context: shared datastore across different jobs
+        in a pipeline
+    """
+
+    config = context.config[SMOOTHED_SEISMICITY_KEY]
+    sm = context.cur_sm
+
+    events = context.current_filtered_eq
+    if len(events):
+        completeness_table = context.completeness_table
+        selected = context.map_sc['select_eq_vector'](
+            events[:, CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX],
+            events[:, CATALOG_MATRIX_MW_INDEX],
+            completeness_table[:, CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX],
+            completeness_table[:, COMPLETENESS_TABLE_MW_INDEX],
+            np.zeros(len(events))) == 0
+        selected &= events[:, CATALOG_MATRIX_MW_INDEX] >= \
+            np.min(completeness_table[:, COMPLETENESS_TABLE_MW_INDEX])
+        longitude = events[selected, CATALOG_MATRIX_FIXED_COLOUMNS.index(
+            'longitude')]
+        latitude = events[selected, CATALOG_MATRIX_FIXED_COLOUMNS.index(
+            'latitude')]
+    else:
+        longitude = latitude = np.array([])
+
+    # A source model without a polygon (i.e. the default
+    # one) covers the whole earth
+    vertices = sm.vertices
+    if vertices is None or len(vertices) < 3:
+        vertices = None
+    region = config.get('region') or (sm.bounding_box
+        if vertices is not None else GLOBAL_REGION)
+
+    options = dict((name, config[name]) for name in ('kernel', 'neighbours')
+                   if config.get(name))
+    cell_longitude, cell_latitude, counts = \
+        context.map_sc['smoothed_seismicity'](longitude, latitude, region,
+            config['cell_size'], config['bandwidth'], vertices=vertices,
+            **options)
+
+    rows, columns = np.nonzero(counts)
+    truncated_gutenberg_richter = \
+        sm.rupture_rate_model.truncated_gutenberg_richter
+    rate = truncated_gutenberg_richter.a_value * counts[rows, columns] / \
+        counts.sum() if len(rows) else np.array([])
+    with np.errstate(divide='ignore'):
+        a_value = np.log10(rate) + truncated_gutenberg_richter.b_value * \
+            truncated_gutenberg_richter.min_magnitude
+
+    context.smoothed_seismicity = np.column_stack([cell_longitude[columns],
+        cell_latitude[rows], rate, a_value])
+    _store_smoothed_seismicity(
+        _source_output_file(config['output_file'], sm.area_source_id),
+        context.smoothed_seismicity)
+
+    LOGGER.debug("* Smoothed events: %d, cells with seismicity: %d" %
+        (len(longitude), len(rate)))
+
+
+def _source_output_file(filename, source_id):
+    """
+    Return the file name with the source id
+    appended before the extension
+    """
+
+    root, extension = os.path.splitext(filename)
+    return '%s_%s%s' % (root, source_id, extension)
+
+
+def _store_smoothed_seismicity(filename, cells):
+    """
+    Store the cells in a csv file, in a numpy
+    archive when the file has the .npz extension
+    """
+
+    if filename.lower().endswith(BINARY_EXTENSION):
+        with open(filename, 'wb') as archive:
+            np.savez(archive, **dict(zip(SMOOTHED_SEISMICITY_FIELDS,
+                                         cells.T)))
+    else:
+        np.savetxt(filename, cells, fmt='%.5f,%.5f,%.6e,%.5f',
+            header=','.join(SMOOTHED_SEISMICITY_FIELDS), comments='')
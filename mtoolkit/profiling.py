@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide objects
+which profile the execution of jobs and create
+reports of the most expensive functions.
+"""
+
+import os
+import pstats
+import cProfile
+from functools import wraps
+from StringIO import StringIO
+
+DEFAULT_TOP_FUNCTIONS = 30
+PROFILE_EXTENSION = '.prof'
+REPORT_FILENAME = 'report.txt'
+
+
+class JobProfiler(object):
+    """
+    JobProfiler runs jobs under cProfile, the profiles
+    of every execution of a job (i.e. once for each
+    source during processing) are merged in a single
+    profile per job.
+    """
+
+    def __init__(self, output_dir, top=DEFAULT_TOP_FUNCTIONS):
+        """
+        Constructor
+        :param output_dir: dir where profiles and report are written
+        :type output_dir: string
+        :keyword top: number of functions listed in the report
+        :type top: int
+        """
+
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.output_dir = output_dir
+        self.top = top
+        self.job_stats = {}
+        self.job_order = []
+
+    def profiled(self, job):
+        """
+        Return a callable which runs the job
+        under the profiler
+        :param job: job to be profiled
+        :type job: callable
+        """
+
+        @wraps(job)
+        def wrapper(context):
+            """Run the job collecting its profile"""
+            profile = cProfile.Profile()
+            try:
+                profile.runcall(job, context)
+            finally:
+                self._add(job.__name__, profile)
+
+        return wrapper
+
+    def _add(self, job_name, profile):
+        """Merge a profile with the previous ones of the job"""
+
+        if job_name in self.job_stats:
+            self.job_stats[job_name].add(profile)
+        else:
+            self.job_stats[job_name] = pstats.Stats(profile)
+            self.job_order.append(job_name)
+
+    def profile_path(self, job_name):
+        """Return the path of the profile of a job"""
+
+        return os.path.join(self.output_dir,
+            '%s%s' % (job_name, PROFILE_EXTENSION))
+
+    def write(self):
+        """
+        Write a profile for every job, readable with pstats
+        or any compatible viewer, and the report of the
+        top functions across all the jobs.
+        :returns: path of the report
+        :rtype: string
+        """
+
+        profile_paths = []
+        for job_name in self.job_order:
+            profile_paths.append(self.profile_path(job_name))
+            self.job_stats[job_name].dump_stats(profile_paths[-1])
+
+        report_path = os.path.join(self.output_dir, REPORT_FILENAME)
+        with open(report_path, 'w') as report_file:
+            report_file.write(self._report(profile_paths))
+        return report_path
+
+    def _report(self, profile_paths):
+        """
+        Return a report listing the time spent in every job
+        and the top functions of the consolidated profile
+        sorted by cumulative and internal time.
+        :param profile_paths: paths of the job profiles
+        :type profile_paths: list of strings
+        :rtype: string
+        """
+
+        stream = StringIO()
+        stream.write('Time spent per job\n\n')
+        for job_name in self.job_order:
+            stream.write('%-40s %10.3f s\n' %
+                (job_name, self.job_stats[job_name].total_tt))
+
+        if profile_paths:
+            consolidated = pstats.Stats(*profile_paths, stream=stream)
+            consolidated.strip_dirs()
+
+            stream.write('\nTop %d functions by cumulative time\n' %
+                self.top)
+            consolidated.sort_stats('cumulative').print_stats(self.top)
+
+            stream.write('\nTop %d functions by internal time\n' % self.top)
+            consolidated.sort_stats('time').print_stats(self.top)
+
+        return stream.getvalue()
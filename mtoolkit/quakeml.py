@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+The purpose of this module is to provide objects
+to read earthquake catalogues in the QuakeML format
+(e.g. ISC exports) in a streaming way: every event
+is parsed and released in turn, so that the memory
+used doesn't depend on the size of the document.
+"""
+
+import re
+import logging
+
+import numpy as np
+from lxml import etree
+
+from mtoolkit.eqcatalog import (FIELDNAMES, EqCatalogColumns, EqEntryReader,
+                                is_quakeml)
+from nrml.reader import release_element
+
+LOGGER = logging.getLogger('mt_logger')
+
+# Elements are matched by local name, so that
+# every version of the QuakeML namespace is read
+EVENT = '{*}event'
+ORIGIN = '{*}origin'
+MAGNITUDE = '{*}magnitude'
+
+# Magnitude types mapped to the fields of the eq
+# entries, a type is matched by its prefix (e.g. Mww)
+MAGNITUDE_FIELDS = [('mw', 'Mw', 'sigmaMw'), ('ms', 'Ms', 'sigmaMs'),
+                    ('mb', 'mb', 'sigmamb'), ('ml', 'ML', 'sigmaML')]
+
+# Fields an event can't be read without
+COMPULSORY_FIELDS = ['year', 'longitude', 'latitude', 'depth', 'Mw']
+
+# QuakeML lengths are given in metres
+METRES_PER_KM = 1000.
+
+ISO_TIME = re.compile(r'\s*(-?\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+(?:\.\d*)?)')
+TRAILING_DIGITS = re.compile(r'(\d+)\D*$')
+
+
+class QuakeMLReader(object):
+    """
+    QuakeMLReader allows to read and create eq entries
+    dictionaries from a QuakeML document in an iterative
+    way. The preferred origin of every event (the first
+    one if not declared) gives time, location and depth,
+    while the magnitudes are taken by type, preferring the
+    preferred magnitude of the event. Events without one
+    of the compulsory fields are skipped.
+    """
+
+    def __init__(self, source, require_mw=True):
+        """
+        Constructor
+        :param source: path or file object of the QuakeML document
+        :keyword require_mw: when False events without Mw are read,
+            their Mw is left empty (i.e. to be homogenised)
+        :type require_mw: bool
+        """
+
+        self.source = source
+        self.skipped = 0
+        self.compulsory_fields = COMPULSORY_FIELDS if require_mw else \
+            [field for field in COMPULSORY_FIELDS if field != 'Mw']
+
+    def read(self):
+        """
+        Return a generator that provides an eq
+        entry in a dictionary for every event
+        with valid values.
+        """
+
+        self.skipped = 0
+        for number, (_, elem) in enumerate(
+                etree.iterparse(self.source, tag=EVENT), start=1):
+            eq_entry = self._parse_event(elem, number)
+            release_element(elem)
+            if eq_entry is None:
+                self.skipped += 1
+            else:
+                yield eq_entry
+
+        if self.skipped:
+            LOGGER.warning("* Skipped %d QuakeML events without %s" %
+                (self.skipped, ', '.join(self.compulsory_fields)))
+
+    def read_eq_catalog(self):
+        """
+        Return the earthquake catalogue stored by columns,
+        arrays are filled while events are parsed.
+        :rtype: EqCatalogColumns
+        """
+
+        return EqCatalogColumns.from_entries(self.read())
+
+    def _parse_event(self, event, number):
+        """
+        Return the eq entry of an event element,
+        None if a compulsory field is missing.
+        """
+
+        eq_entry = dict((field, EqEntryReader.EMPTY_STRING)
+                        for field in FIELDNAMES)
+
+        origin = _preferred(event, ORIGIN, 'preferredOriginID')
+        if origin is not None:
+            _parse_origin(origin, eq_entry)
+        eq_entry['eventID'] = _numeric_id(event, number)
+        eq_entry['Identifier'] = _numeric_id(origin, eq_entry['eventID'])
+        eq_entry['Agency'] = _text(origin, '{*}creationInfo/{*}agencyID') or \
+            _text(event, '{*}creationInfo/{*}agencyID') or \
+            EqEntryReader.EMPTY_STRING
+
+        preferred = event.findtext('{*}preferredMagnitudeID')
+        magnitudes = sorted(event.iterchildren(MAGNITUDE),
+            key=lambda magnitude: magnitude.get('publicID') != preferred)
+        for magnitude in magnitudes:
+            _parse_magnitude(magnitude, eq_entry)
+
+        if any(eq_entry[field] == EqEntryReader.EMPTY_STRING
+               for field in self.compulsory_fields):
+            return None
+
+        # Same default of the csv catalogue
+        if eq_entry['sigmaMw'] == EqEntryReader.EMPTY_STRING:
+            eq_entry['sigmaMw'] = 0.0
+        return eq_entry
+
+
+def _preferred(event, tag, preferred_tag):
+    """
+    Return the child of the event declared as
+    preferred, the first child of the tag if the
+    preferred one is not declared or not found.
+    """
+
+    preferred = event.findtext('{*}%s' % preferred_tag)
+    first = None
+    for child in event.iterchildren(tag):
+        if child.get('publicID') == preferred:
+            return child
+        if first is None:
+            first = child
+    return first
+
+
+def _parse_origin(origin, eq_entry):
+    """Fill the eq entry with the values of an origin element"""
+
+    match = ISO_TIME.match(_text(origin, '{*}time/{*}value') or '')
+    if match is not None:
+        for field, value in zip(['year', 'month', 'day', 'hour', 'minute'],
+                                match.groups()):
+            eq_entry[field] = int(value)
+        eq_entry['second'] = float(match.group(6))
+
+    eq_entry['timeError'] = _float(origin, '{*}time/{*}uncertainty')
+    eq_entry['longitude'] = _float(origin, '{*}longitude/{*}value')
+    eq_entry['latitude'] = _float(origin, '{*}latitude/{*}value')
+    eq_entry['depth'] = _float(origin, '{*}depth/{*}value', METRES_PER_KM)
+    eq_entry['depthError'] = _float(origin, '{*}depth/{*}uncertainty',
+        METRES_PER_KM)
+    eq_entry['SemiMajor90'] = _float(origin,
+        '{*}originUncertainty/{*}maxHorizontalUncertainty', METRES_PER_KM)
+    eq_entry['SemiMinor90'] = _float(origin,
+        '{*}originUncertainty/{*}minHorizontalUncertainty', METRES_PER_KM)
+    eq_entry['ErrorStrike'] = _float(origin,
+        '{*}originUncertainty/{*}azimuthMaxHorizontalUncertainty')
+
+
+def _parse_magnitude(magnitude, eq_entry):
+    """
+    Fill the eq entry with the value of a magnitude
+    element, unless its field has already been filled
+    """
+
+    magnitude_type = (_text(magnitude, '{*}type') or '').lower()
+    for prefix, field, sigma_field in MAGNITUDE_FIELDS:
+        if magnitude_type.startswith(prefix):
+            value = _float(magnitude, '{*}mag/{*}value')
+            if eq_entry[field] == EqEntryReader.EMPTY_STRING and \
+                    value != EqEntryReader.EMPTY_STRING:
+                eq_entry[field] = value
+                eq_entry[sigma_field] = _float(magnitude,
+                    '{*}mag/{*}uncertainty')
+            return
+
+
+def _numeric_id(elem, default):
+    """
+    Return the trailing digits of the publicID
+    of an element, default if it has none.
+    """
+
+    public_id = elem.get('publicID', '') if elem is not None else ''
+    match = TRAILING_DIGITS.search(public_id)
+    return int(match.group(1)) if match is not None else default
+
+
+def _text(elem, path):
+    """Return the stripped text at path, None if not found"""
+
+    text = elem.findtext(path) if elem is not None else None
+    return text.strip() if text is not None else None
+
+
+def _float(elem, path, scale=1.):
+    """
+    Return the float at path divided by scale,
+    an empty string if not found or invalid.
+    """
+
+    try:
+        return float(_text(elem, path)) / scale
+    except (TypeError, ValueError):
+        return EqEntryReader.EMPTY_STRING
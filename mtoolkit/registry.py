@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide the registries
+of jobs and scientific kernels. Every job and kernel is
+declared by a spec (name, reference to the callable,
+inputs, outputs and cost hint), callables are imported
+only when requested, so that heavy dependencies (i.e.
+scipy) are loaded only by the jobs actually scheduled.
+Third party jobs and kernels are discovered through the
+`mtoolkit.jobs` and `mtoolkit.kernels` entry points and
+swapped in by config.
+"""
+
+from collections import MutableMapping
+from importlib import import_module
+
+JOBS_ENTRY_POINT_GROUP = 'mtoolkit.jobs'
+KERNELS_ENTRY_POINT_GROUP = 'mtoolkit.kernels'
+
+
+class LazyCallableMap(MutableMapping):
+    """
+    LazyCallableMap maps names to callables declared
+    either directly or with a 'package.module:attribute'
+    reference, a reference is resolved (and its module
+    imported) the first time the name is looked up.
+    """
+
+    def __init__(self, references=None, fallback=None):
+        """
+        Constructor
+        :keyword references: names mapped to callables
+            or 'package.module:attribute' strings
+        :type references: dict
+        :keyword fallback: called with an unknown name, returns
+            its callable or reference, None if not defined
+        :type fallback: callable
+        """
+
+        self._references = dict(references or {})
+        self._fallback = fallback
+
+    def __getitem__(self, name):
+        if name not in self._references and self._fallback is not None:
+            reference = self._fallback(name)
+            if reference is not None:
+                self._references[name] = reference
+
+        reference = self._references[name]
+        if isinstance(reference, basestring):
+            reference = resolve(reference)
+            self._references[name] = reference
+        return reference
+
+    def __setitem__(self, name, reference):
+        self._references[name] = reference
+
+    def __delitem__(self, name):
+        del self._references[name]
+
+    def __iter__(self):
+        return iter(self._references)
+
+    def __len__(self):
+        return len(self._references)
+
+    def __contains__(self, name):
+        # Membership doesn't resolve the reference
+        # nor looks for plugins
+        return name in self._references
+
+    def is_loaded(self, name):
+        """Return True if the callable of name has been imported"""
+
+        return not isinstance(self._references[name], basestring)
+
+
+class Spec(object):
+    """
+    Spec declares a job or a scientific kernel:
+    the callable implementing it and, for jobs, the
+    context attributes it reads (inputs) and writes
+    (outputs). The cost hint describes how the
+    execution time grows with the number of events
+    (i.e. 'n', 'n log n', 'n^2').
+    """
+
+    def __init__(self, name, reference, inputs=(), outputs=(), cost=None,
+                 description=None):
+        """
+        Constructor
+        :param name: name used in the config
+        :type name: string
+        :param reference: callable or 'package.module:attribute'
+        :keyword inputs: context attributes read
+        :type inputs: sequence of strings
+        :keyword outputs: context attributes written
+        :type outputs: sequence of strings
+        :keyword cost: cost hint
+        :type cost: string
+        :keyword description: short description
+        :type description: string
+        """
+
+        self.name = name
+        self.reference = reference
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.cost = cost
+        self.description = description
+
+    def load(self):
+        """Return the callable, importing its module if needed"""
+
+        if isinstance(self.reference, basestring):
+            self.reference = resolve(self.reference)
+        return self.reference
+
+    def __repr__(self):
+        return '<Spec %s: %s>' % (self.name, self.reference)
+
+
+class Registry(object):
+    """
+    Registry holds the specs of the builtin jobs (or kernels)
+    and looks for plugins registered in an entry point group.
+    An entry point is named after the job and refers either
+    to a Spec or directly to the callable, it is loaded only
+    when its name is requested.
+    """
+
+    def __init__(self, entry_point_group, specs=()):
+        """
+        Constructor
+        :param entry_point_group: entry point group of plugins
+        :type entry_point_group: string
+        :keyword specs: builtin specs
+        :type specs: sequence of Spec
+        """
+
+        self.entry_point_group = entry_point_group
+        self._specs = {}
+        self._order = []
+        for spec in specs:
+            self.register(spec)
+
+    def register(self, spec):
+        """
+        Register a spec, replacing the spec
+        with the same name if already defined
+        :param spec: job or kernel declaration
+        :type spec: Spec
+        """
+
+        if spec.name not in self._specs:
+            self._order.append(spec.name)
+        self._specs[spec.name] = spec
+
+    def names(self, plugins=False):
+        """
+        Return the names of the builtin specs, followed
+        by the names of plugins if requested (plugins
+        are listed without being imported).
+        """
+
+        names = list(self._order)
+        if plugins:
+            names.extend(entry_point.name for entry_point in
+                _entry_points(self.entry_point_group)
+                if entry_point.name not in self._specs)
+        return names
+
+    def spec(self, name):
+        """
+        Return the spec of a builtin or plugin
+        job, None if name is not defined
+        :param name: name of the job (or kernel)
+        :type name: string
+        :rtype: Spec
+        """
+
+        if name not in self._specs:
+            for entry_point in _entry_points(self.entry_point_group):
+                if entry_point.name == name:
+                    self.register(_as_spec(name, entry_point.load()))
+                    break
+            else:
+                return None
+        return self._specs[name]
+
+    def callable_map(self, overrides=None):
+        """
+        Return a map of names to callables, callables are
+        imported on first lookup and unknown names are
+        looked up among plugins.
+        :keyword overrides: names mapped to the implementation
+            replacing the builtin one, either a
+            'package.module:attribute' reference or the name
+            of a registered job (or plugin)
+        :type overrides: dict
+        :rtype: LazyCallableMap
+        """
+
+        references = dict((name, self._specs[name].reference)
+                          for name in self._order)
+        for name, implementation in (overrides or {}).items():
+            references[name] = self.implementation(name, implementation)
+
+        def fallback(name):
+            """Look for the spec among plugins"""
+            spec = self.spec(name)
+            return spec.reference if spec is not None else None
+
+        return LazyCallableMap(references, fallback)
+
+    def implementation(self, name, implementation):
+        """
+        Return the reference of the implementation
+        overriding a job (or kernel) in the config
+        :param name: name of the overridden job
+        :param implementation: 'package.module:attribute'
+            or the name of a registered job (or plugin)
+        """
+
+        if not isinstance(implementation, basestring):
+            raise RuntimeError('Invalid implementation of %s: %s'
+                % (name, implementation))
+        if ':' in implementation:
+            return implementation
+
+        spec = self.spec(implementation)
+        if spec is None:
+            raise RuntimeError('Invalid implementation of %s: %s is not '
+                'a registered name or a package.module:attribute reference'
+                % (name, implementation))
+        return spec.reference
+
+
+def resolve(reference):
+    """
+    Import and return the object declared
+    by a 'package.module:attribute' reference
+    :param reference: reference to the object
+    :type reference: string
+    """
+
+    module_name, _, attribute = reference.partition(':')
+    if not attribute:
+        raise RuntimeError('Invalid reference: %s, expected '
+            'package.module:attribute' % reference)
+
+    try:
+        return getattr(import_module(module_name), attribute)
+    except AttributeError:
+        raise RuntimeError('Invalid reference: %s, %s not defined in %s'
+            % (reference, attribute, module_name))
+
+
+def _entry_points(group):
+    """
+    Return the entry points of a group, pkg_resources
+    is imported only when plugins are looked up.
+    """
+
+    try:
+        import pkg_resources
+    except ImportError:
+        return []
+    return list(pkg_resources.iter_entry_points(group))
+
+
+def _as_spec(name, plugin):
+    """Return the spec declared by a plugin"""
+
+    if isinstance(plugin, Spec):
+        plugin.name = name
+        return plugin
+    return Spec(name, plugin)
+
+
+JOBS = Registry(JOBS_ENTRY_POINT_GROUP, [
+    Spec('Read_eq_catalog', 'mtoolkit.jobs:read_eq_catalog',
+        outputs=['eq_catalog'], cost='n'),
+    Spec('Read_source_model', 'mtoolkit.jobs:read_source_model',
+        outputs=['sm_definitions'], cost='sources'),
+    Spec('Create_default_source_model',
+        'mtoolkit.jobs:create_default_source_model',
+        outputs=['sm_definitions'], cost='1'),
+    Spec('Homogenisation', 'mtoolkit.jobs:homogenisation',
+        inputs=['eq_catalog'], outputs=['eq_catalog'], cost='n'),
+    Spec('Deduplication', 'mtoolkit.jobs:deduplication',
+        inputs=['eq_catalog'], outputs=['eq_catalog'], cost='n'),
+    Spec('Create_catalog_matrix', 'mtoolkit.jobs:create_catalog_matrix',
+        inputs=['eq_catalog'],
+        outputs=['catalog_matrix', 'working_catalog'], cost='n'),
+    Spec('Create_default_values', 'mtoolkit.jobs:create_default_values',
+        inputs=['working_catalog'],
+        outputs=['flag_vector', 'completeness_table'], cost='n'),
+    Spec('GardnerKnopoff', 'mtoolkit.jobs:gardner_knopoff',
+        inputs=['working_catalog'],
+        outputs=['vcl', 'working_catalog', 'flag_vector'], cost='n^2'),
+    Spec('Afteran', 'mtoolkit.jobs:afteran',
+        inputs=['catalog_matrix'],
+        outputs=['vcl', 'working_catalog', 'flag_vector'], cost='n^2'),
+    Spec('Stepp', 'mtoolkit.jobs:stepp',
+        inputs=['working_catalog'],
+        outputs=['completeness_table'], cost='n'),
+    Spec('Create_eq_vector', 'mtoolkit.jobs:create_selected_eq_vector',
+        inputs=['catalog_matrix', 'completeness_table', 'flag_vector'],
+        outputs=['selected_eq_vector'], cost='n'),
+    Spec('Store_eq_catalog', 'mtoolkit.jobs:store_preprocessed_catalog',
+        inputs=['eq_catalog', 'catalog_matrix', 'selected_eq_vector'],
+        cost='n'),
+    Spec('Store_completeness_table', 'mtoolkit.jobs:store_completeness_table',
+        inputs=['completeness_table'], cost='1'),
+    Spec('Retrieve_completeness_table',
+        'mtoolkit.jobs:retrieve_completeness_table',
+        outputs=['completeness_table'], cost='1'),
+    Spec('Recurrence', 'mtoolkit.jobs:recurrence',
+        inputs=['current_filtered_eq', 'completeness_table', 'cur_sm'],
+        outputs=['cur_sm'], cost='n'),
+    Spec('MaximumMagnitude', 'mtoolkit.jobs:maximum_magnitude',
+        inputs=['current_filtered_eq', 'cur_sm'],
+        outputs=['cur_sm'], cost='n'),
+    Spec('SmoothedSeismicity', 'mtoolkit.jobs:smoothed_seismicity',
+        inputs=['current_filtered_eq', 'completeness_table', 'cur_sm'],
+        outputs=['smoothed_seismicity'], cost='cells')])
+
+KERNELS = Registry(KERNELS_ENTRY_POINT_GROUP, [
+    Spec('gardner_knopoff',
+        'mtoolkit.scientific.declustering:gardner_knopoff_decluster',
+        cost='n^2'),
+    Spec('gardner_knopoff_tiled',
+        'mtoolkit.tiled_declustering:gardner_knopoff_tiled',
+        cost='n^2'),
+    Spec('gardner_knopoff_update',
+        'mtoolkit.scientific.declustering:gardner_knopoff_update',
+        cost='n^2'),
+    Spec('homogenisation',
+        'mtoolkit.scientific.homogenisation:homogenise_magnitudes',
+        cost='n'),
+    Spec('deduplication',
+        'mtoolkit.scientific.deduplication:find_duplicates',
+        cost='n'),
+    Spec('afteran', 'mtoolkit.scientific.declustering:afteran_decluster',
+        cost='n^2'),
+    Spec('stepp', 'mtoolkit.scientific.completeness:stepp_analysis',
+        cost='n'),
+    Spec('recurrence', 'mtoolkit.scientific.recurrence:recurrence_analysis',
+        cost='n'),
+    Spec('select_eq_vector',
+        'mtoolkit.scientific.completeness:selected_eq_flag_vector',
+        cost='n'),
+    Spec('maximum_magnitude',
+        'mtoolkit.scientific.maximum_magnitude:maximum_magnitude_analysis',
+        cost='n'),
+    Spec('smoothed_seismicity',
+        'mtoolkit.scientific.smoothed_seismicity:smoothed_seismicity',
+        cost='cells')])
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide a scheduler
+which runs the jobs of a pipeline concurrently, following
+the dependencies derived from the context attributes
+every job reads (inputs) and writes (outputs).
+"""
+
+import sys
+import logging
+from Queue import Queue
+from multiprocessing.pool import ThreadPool
+
+LOGGER = logging.getLogger('mt_logger')
+
+
+def build_dag(dependencies):
+    """
+    Return the predecessors of every job: job j must run
+    before job i (j < i) if i reads an attribute written
+    by j (read after write), writes an attribute read by
+    j (write after read) or writes an attribute written
+    by j (write after write). A job with undeclared
+    dependencies (None) runs after all the previous jobs
+    and before all the following ones.
+    :param dependencies: (inputs, outputs) of every job, in
+        pipeline order, or None if unknown
+    :type dependencies: list of tuples
+    :returns: set of predecessors indexes for every job
+    :rtype: list of sets
+    """
+
+    predecessors = []
+    for i, dependency in enumerate(dependencies):
+        before = set()
+        for j in xrange(i):
+            if dependency is None or dependencies[j] is None or \
+                    _conflict(dependencies[j], dependency):
+                before.add(j)
+        predecessors.append(before)
+    return predecessors
+
+
+def _conflict(first, second):
+    """
+    Return True if the second job depends on the first one
+    """
+
+    first_inputs, first_outputs = [set(attrs) for attrs in first]
+    second_inputs, second_outputs = [set(attrs) for attrs in second]
+    return bool(first_outputs & second_inputs or
+                first_inputs & second_outputs or
+                first_outputs & second_outputs)
+
+
+class DagScheduler(object):
+    """
+    DagScheduler runs the jobs of a pipeline in a pool of
+    threads: a job starts as soon as all the jobs it
+    depends on are completed, independent jobs overlap.
+    Threads share the context, so no data is copied,
+    dependencies guarantee that no attribute is written
+    while another job reads or writes it.
+    """
+
+    def __init__(self, workers):
+        """
+        Constructor
+        :param workers: number of threads
+        :type workers: int
+        """
+
+        self.workers = workers
+        self._pool = None
+
+    def run(self, jobs, dependencies, context):
+        """
+        Run jobs following their dependencies,
+        the first error raised by a job is raised
+        again once the running jobs are completed.
+        :param jobs: jobs in pipeline order
+        :type jobs: list of callables
+        :param dependencies: (inputs, outputs) of every
+            job, None if unknown
+        :type dependencies: list of tuples
+        :param context: shared datastore across different jobs
+            in a pipeline
+        """
+
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers)
+
+        predecessors = build_dag(dependencies)
+        successors = [[] for _ in jobs]
+        for i, before in enumerate(predecessors):
+            for j in before:
+                successors[j].append(i)
+        waiting = [len(before) for before in predecessors]
+
+        completed = Queue()
+        running = 0
+        error = None
+        ready = [i for i, count in enumerate(waiting) if count == 0]
+
+        while ready or running:
+            # Jobs are submitted in pipeline order
+            for i in sorted(ready):
+                self._pool.apply_async(_run_job,
+                    (i, jobs[i], context, completed))
+                running += 1
+            ready = []
+
+            i, exc_info = completed.get()
+            running -= 1
+            if exc_info is not None:
+                if error is None:
+                    error = exc_info
+                continue
+            if error is not None:
+                # Don't start new jobs after a failure
+                continue
+
+            for successor in successors[i]:
+                waiting[successor] -= 1
+                if waiting[successor] == 0:
+                    ready.append(successor)
+
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+    def close(self):
+        """Terminate the threads of the pool"""
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def _run_job(index, job, context, completed):
+    """
+    Run a job in a thread of the pool, signaling
+    its completion (and error) in the queue
+    """
+
+    try:
+        job(context)
+        completed.put((index, None))
+    # pylint: disable=W0702
+    except:
+        completed.put((index, sys.exc_info()))
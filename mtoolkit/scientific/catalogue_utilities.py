@@ -21,11 +21,39 @@ A set of utility functions for performing
 calculations on features in an eq catalogue:
 
 * decimal_year
+* decimal_time
 * haversine
+* haversine_blocks
+* haversine_one_to_many
+* within_distance
+
+a store of the features of a catalogue, computed
+once and shared by the scientific functions, and
+a cube of the counts of events by year and magnitude
+shared by the rate based functions.
 """
 
+import weakref
+
 import numpy as np
 
+CATALOG_MATRIX_YEAR_INDEX = 0
+CATALOG_MATRIX_MONTH_INDEX = 1
+CATALOG_MATRIX_DAY_INDEX = 2
+CATALOG_MATRIX_LONGITUDE_INDEX = 3
+CATALOG_MATRIX_LATITUDE_INDEX = 4
+CATALOG_MATRIX_MW_INDEX = 5
+
+# Mean radius of the earth in km
+EARTH_RADIUS = 6371.227
+
+# Number of distances computed at once by haversine_blocks
+HAVERSINE_BLOCK_SIZE = 1000000
+
+# Day of the year before the first day of every month
+MONTH_MARKER = np.array([0., 31., 59., 90., 120., 151., 181.,
+                         212., 243., 273., 304., 334.])
+
 
 def decimal_year(year, month, day):
     """
@@ -41,16 +69,50 @@ def decimal_year(year, month, day):
     :rtype: numpy.ndarray
     """
 
-    marker = np.array([0., 31., 59., 90., 120., 151., 181.,
-                                 212., 243., 273., 304., 334.])
     tmonth = (month - 1).astype(int)
-    day_count = marker[tmonth] + day - 1.
+    day_count = MONTH_MARKER[tmonth] + day - 1.
     dec_year = year + (day_count / 365.)
 
     return dec_year
 
 
-def haversine(lon1, lat1, lon2, lat2, radians=False, earth_rad=6371.227):
+def decimal_time(year, month, day, hour=None, minute=None, second=None):
+    """
+    Allows to calculate the exact decimal year for a vector
+    of dates and times, taking leap years into account
+
+    :param year: year column from catalogue matrix
+    :type year: numpy.ndarray
+    :param month: month column from catalogue matrix
+    :type month: numpy.ndarray
+    :param day: day column from catalogue matrix
+    :type day: numpy.ndarray
+    :keyword hour: hour of the events, midnight if not given
+    :type hour: numpy.ndarray
+    :keyword minute: minute of the events
+    :type minute: numpy.ndarray
+    :keyword second: second of the events
+    :type second: numpy.ndarray
+    :returns: decimal year column
+    :rtype: numpy.ndarray
+    """
+
+    year = np.asarray(year, dtype=float)
+    leap = np.logical_and(year % 4 == 0,
+        np.logical_or(year % 100 != 0, year % 400 == 0))
+    tmonth = (np.asarray(month) - 1).astype(int)
+    day_count = MONTH_MARKER[tmonth] + np.logical_and(leap, tmonth > 1) + \
+        np.asarray(day, dtype=float) - 1.
+
+    seconds = np.zeros(np.shape(year))
+    for value, factor in ((hour, 3600.), (minute, 60.), (second, 1.)):
+        if value is not None:
+            seconds = seconds + factor * np.asarray(value, dtype=float)
+
+    return year + (day_count + seconds / 86400.) / (365. + leap)
+
+
+def haversine(lon1, lat1, lon2, lat2, radians=False, earth_rad=EARTH_RADIUS):
     """
     Allows to calculate geographical distance
     using the haversine formula.
@@ -71,41 +133,148 @@ def haversine(lon1, lat1, lon2, lat2, radians=False, earth_rad=6371.227):
     :rtype: numpy.ndarray
     """
 
-    if radians == False:
-        cfact = np.pi / 180.
-        lon1 = cfact * lon1
-        lat1 = cfact * lat1
-        lon2 = cfact * lon2
-        lat2 = cfact * lat2
-
-    # Number of locations in each set of points
-    if not np.shape(lon1):
-        nlocs1 = 1
-        lon1 = np.array([lon1])
-        lat1 = np.array([lat1])
-    else:
-        nlocs1 = np.max(np.shape(lon1))
-    if not np.shape(lon2):
-        nlocs2 = 1
-        lon2 = np.array([lon2])
-        lat2 = np.array([lat2])
-    else:
-        nlocs2 = np.max(np.shape(lon2))
-    # Pre-allocate array
-    distance = np.zeros((nlocs1, nlocs2))
-    i = 0
-    while i < nlocs2:
-        # Perform distance calculation
-        dlat = lat1 - lat2[i]
-        dlon = lon1 - lon2[i]
-        aval = (np.sin(dlat / 2.) ** 2.) + (np.cos(lat1) * np.cos(lat2[i]) *
-             (np.sin(dlon / 2.) ** 2.))
-        distance[:, i] = (2. * earth_rad * np.arctan2(np.sqrt(aval),
-                                                    np.sqrt(1 - aval))).T
-        i += 1
+    lon1 = np.atleast_1d(lon1).ravel()
+    lon2 = np.atleast_1d(lon2).ravel()
+
+    distance = np.empty((len(lon1), len(lon2)))
+    for start, block in haversine_blocks(lon1, lat1, lon2, lat2, radians,
+            earth_rad):
+        distance[:, start:start + np.shape(block)[1]] = block
     return distance
 
 
+def haversine_blocks(lon1, lat1, lon2, lat2, radians=False,
+                     earth_rad=EARTH_RADIUS, block_size=HAVERSINE_BLOCK_SIZE):
+    """
+    Allows to calculate the geographical distance between
+    two sets of locations in blocks of columns, every
+    block holds at most about block_size distances, so
+    that distances can be reduced without allocating
+    the whole matrix.
+
+    :param lon1: longitude of the first set of locations
+    :type lon1: numpy.ndarray
+    :param lat1: latitude of the first set of locations
+    :type lat1: numpy.ndarray
+    :param lon2: longitude of the second set of locations
+    :type lon2: numpy.ndarray
+    :param lat2: latitude of the second set of locations
+    :type lat2: numpy.ndarray
+    :keyword radians: states if locations are given in terms of radians
+    :type radians: bool
+    :keyword earth_rad: radius of the earth in km
+    :type earth_rad: float
+    :keyword block_size: number of distances computed at once
+    :type block_size: int
+    :returns: generator of tuples (index of the first column
+              of the block, distances in km of shape
+              (locations of the first set, columns of the block))
+    """
+
+    lon1, lat1, lon2, lat2 = [np.atleast_1d(np.asarray(value,
+        dtype=float)).ravel() for value in (lon1, lat1, lon2, lat2)]
+    if not radians:
+        lon1, lat1, lon2, lat2 = [np.radians(value)
+                                  for value in (lon1, lat1, lon2, lat2)]
+
+    cos_lat1 = np.cos(lat1)[:, np.newaxis]
+    cos_lat2 = np.cos(lat2)
+    lon1 = lon1[:, np.newaxis]
+    lat1 = lat1[:, np.newaxis]
+
+    step = max(1, block_size // max(1, np.shape(lon1)[0]))
+    for start in xrange(0, len(lon2), step):
+        block = slice(start, start + step)
+        aval = _haversine_term(lon1, lat1, cos_lat1, lon2[block],
+            lat2[block], cos_lat2[block])
+        yield start, _central_angle(aval) * earth_rad
+
+
+def haversine_one_to_many(lon1, lat1, cos_lat1, lon2, lat2, cos_lat2,
+                          earth_rad=EARTH_RADIUS):
+    """
+    Allows to calculate the geographical distance between
+    a set of locations and a single location given in
+    radians, reusing the cosines of their latitudes
+    (see CatalogueFeatures).
+
+    :param lon1: longitude of the set of locations in radians
+    :type lon1: numpy.ndarray
+    :param lat1: latitude of the set of locations in radians
+    :type lat1: numpy.ndarray
+    :param cos_lat1: cosine of lat1
+    :type cos_lat1: numpy.ndarray
+    :param lon2: longitude of the location in radians
+    :type lon2: float
+    :param lat2: latitude of the location in radians
+    :type lat2: float
+    :param cos_lat2: cosine of lat2
+    :type cos_lat2: float
+    :keyword earth_rad: radius of the earth in km
+    :type earth_rad: float
+    :returns: geographical distance in km
+    :rtype: 1-D numpy.ndarray
+    """
+
+    return _central_angle(_haversine_term(lon1, lat1, cos_lat1,
+        lon2, lat2, cos_lat2)) * earth_rad
+
+
+def within_distance(lon1, lat1, cos_lat1, lon2, lat2, cos_lat2, distance,
+                    earth_rad=EARTH_RADIUS):
+    """
+    Allows to select the locations of a set within
+    a distance from a single location given in radians.
+    The haversine term (a quarter of the squared chord
+    on the unit sphere) grows with the distance, so it
+    is compared with the term of the distance without
+    computing any distance.
+
+    :param lon1: longitude of the set of locations in radians
+    :type lon1: numpy.ndarray
+    :param lat1: latitude of the set of locations in radians
+    :type lat1: numpy.ndarray
+    :param cos_lat1: cosine of lat1
+    :type cos_lat1: numpy.ndarray
+    :param lon2: longitude of the location in radians
+    :type lon2: float
+    :param lat2: latitude of the location in radians
+    :type lat2: float
+    :param cos_lat2: cosine of lat2
+    :type cos_lat2: float
+    :param distance: distance in km
+    :type distance: float
+    :keyword earth_rad: radius of the earth in km
+    :type earth_rad: float
+    :returns: True for the locations whose distance is <= distance
+    :rtype: 1-D numpy.ndarray of bool
+    """
+
+    # Distances beyond half the circumference include every location
+    threshold = np.sin(np.minimum(distance / (2. * earth_rad),
+                                  np.pi / 2.)) ** 2.
+    return _haversine_term(lon1, lat1, cos_lat1, lon2, lat2,
+        cos_lat2) <= threshold
+
+
+def _haversine_term(lon1, lat1, cos_lat1, lon2, lat2, cos_lat2):
+    """
+    Return the haversine of the central angle
+    between locations given in radians
+    """
+
+    return np.sin((lat1 - lat2) / 2.) ** 2. + \
+        cos_lat1 * cos_lat2 * np.sin((lon1 - lon2) / 2.) ** 2.
+
+
+def _central_angle(aval):
+    """Return the central angle of a haversine term"""
+
+    # Rounding may leave the term slightly above one
+    aval = np.minimum(aval, 1.)
+    return 2. * np.arctan2(np.sqrt(aval), np.sqrt(1. - aval))
+
+
 def greg2julian(year, month, day, hour, minute, second):
     """ Function to convert a date from Gregorian to Julian format"""
     timeut = hour + (minute / 60.0) + (second / 3600.0)
@@ -115,3 +284,273 @@ def greg2julian(year, month, day, hour, minute, second):
              4.0) + np.floor((275.0 * month) / 9.0) + day +\
              1721028.5 + (timeut / 24.0)
     return jd
+
+
+class CatalogueFeatures(object):
+    """
+    CatalogueFeatures computes the features of a catalogue
+    used by the scientific functions (decimal time, radians
+    of coordinates, cosine of latitudes, magnitude ordering)
+    the first time they are requested and keeps them, so
+    that they are computed once per catalogue. Features
+    derived by the scientific functions (i.e. time and
+    distance windows) are kept with memoize. Features are
+    shared: they must not be modified in place.
+    """
+
+    def __init__(self, catalog_matrix, hour=None, minute=None, second=None):
+        """
+        Constructor
+        :param catalog_matrix: eq catalog in a matrix format with these
+                               columns in order: `year`, `month`, `day`,
+                               `longitude`, `latitude`, `Mw`
+        :type catalog_matrix: numpy.ndarray
+        :keyword hour: hour of the events, if not given decimal
+                       time refers to the start of the day
+        :keyword minute: minute of the events
+        :keyword second: second of the events
+        """
+
+        self._catalog_matrix = lambda: catalog_matrix
+        self._time_columns = (hour, minute, second)
+        self._features = {}
+
+    @property
+    def catalog_matrix(self):
+        """Catalogue matrix the features are computed from"""
+
+        return self._catalog_matrix()
+
+    def memoize(self, key, function):
+        """
+        Return the feature identified by key,
+        computing it with function the first time
+        :param key: hashable identifier of the feature
+        :param function: callable without arguments
+        """
+
+        try:
+            return self._features[key]
+        except KeyError:
+            value = function()
+            self._features[key] = value
+            return value
+
+    @property
+    def year_dec(self):
+        """Exact decimal time of the events"""
+
+        return self.memoize('year_dec', lambda: decimal_time(
+            self.catalog_matrix[:, CATALOG_MATRIX_YEAR_INDEX],
+            self.catalog_matrix[:, CATALOG_MATRIX_MONTH_INDEX],
+            self.catalog_matrix[:, CATALOG_MATRIX_DAY_INDEX],
+            *self._time_columns))
+
+    @property
+    def longitude(self):
+        """Longitude of the events in degrees"""
+
+        return self.catalog_matrix[:, CATALOG_MATRIX_LONGITUDE_INDEX]
+
+    @property
+    def latitude(self):
+        """Latitude of the events in degrees"""
+
+        return self.catalog_matrix[:, CATALOG_MATRIX_LATITUDE_INDEX]
+
+    @property
+    def magnitude(self):
+        """Magnitude of the events"""
+
+        return self.catalog_matrix[:, CATALOG_MATRIX_MW_INDEX]
+
+    @property
+    def longitude_rad(self):
+        """Longitude of the events in radians"""
+
+        return self.memoize('longitude_rad',
+            lambda: np.radians(self.longitude))
+
+    @property
+    def latitude_rad(self):
+        """Latitude of the events in radians"""
+
+        return self.memoize('latitude_rad',
+            lambda: np.radians(self.latitude))
+
+    @property
+    def cos_latitude(self):
+        """Cosine of the latitude of the events"""
+
+        return self.memoize('cos_latitude',
+            lambda: np.cos(self.latitude_rad))
+
+    @property
+    def magnitude_order(self):
+        """
+        Permutation sorting the events by descending
+        magnitude, events of equal magnitude are sorted
+        by descending position in the catalogue
+        """
+
+        return self.memoize('magnitude_order', lambda: np.flipud(
+            np.argsort(self.magnitude, kind='mergesort')))
+
+    @property
+    def time_order(self):
+        """Permutation sorting the events by time"""
+
+        return self.memoize('time_order',
+            lambda: np.argsort(self.year_dec, kind='mergesort'))
+
+
+# Features of the catalogues in use, keyed by
+# the identity of the catalogue matrix
+_FEATURES = {}
+
+
+def catalogue_features(catalog_matrix, hour=None, minute=None, second=None):
+    """
+    Return the features of a catalogue, the features
+    computed for the same catalogue matrix object are
+    returned until the matrix is garbage collected.
+    Time columns are taken into account only the
+    first time features of a catalogue are requested.
+
+    :param catalog_matrix: eq catalog in a matrix format
+    :type catalog_matrix: numpy.ndarray
+    :keyword hour: hour of the events
+    :keyword minute: minute of the events
+    :keyword second: second of the events
+    :rtype: CatalogueFeatures
+    """
+
+    key = id(catalog_matrix)
+    entry = _FEATURES.get(key)
+    if entry is not None and entry[0]() is catalog_matrix:
+        return entry[1]
+
+    features = CatalogueFeatures(catalog_matrix, hour, minute, second)
+
+    def forget(reference):
+        """Drop the features of a garbage collected catalogue"""
+        if key in _FEATURES and _FEATURES[key][0] is reference:
+            del _FEATURES[key]
+
+    try:
+        reference = weakref.ref(catalog_matrix, forget)
+    except TypeError:
+        # Not an array, features are not kept
+        return features
+
+    # Kept features don't keep the catalogue alive
+    features._catalog_matrix = reference
+    _FEATURES[key] = (reference, features)
+    return features
+
+
+class CountCube(object):
+    """
+    CountCube bins the events of a catalogue (or of a zone)
+    by year and magnitude once, with a single bincount, and
+    keeps the cumulative counts: the number of events inside
+    any range of years and magnitudes is then read in
+    constant time, so that completeness and recurrence
+    functions answer all their queries without binning
+    the catalogue again.
+
+    The axes of the cube are the distinct years and
+    magnitudes of the events, so that ranges bounded by
+    any value select exactly the events a comparison of
+    the columns with that value would select.
+    """
+
+    def __init__(self, year, magnitude):
+        """
+        Constructor
+        :param year: catalog matrix year column
+        :type year: numpy.ndarray
+        :param magnitude: catalog matrix magnitude column
+        :type magnitude: numpy.ndarray
+        """
+
+        self.years, year_index = np.unique(
+            np.asarray(year, dtype=float).ravel(), return_inverse=True)
+        self.magnitudes, magnitude_index = np.unique(
+            np.asarray(magnitude, dtype=float).ravel(), return_inverse=True)
+
+        nyears = len(self.years)
+        nmagnitudes = len(self.magnitudes)
+        counts = np.bincount(year_index * nmagnitudes + magnitude_index,
+            minlength=nyears * nmagnitudes).reshape((nyears, nmagnitudes))
+
+        # cumulative[i, j] is the number of events
+        # before year i and magnitude j
+        self.cumulative = np.zeros((nyears + 1, nmagnitudes + 1), dtype=int)
+        self.cumulative[1:, 1:] = counts.cumsum(axis=0).cumsum(axis=1)
+
+    @property
+    def shape(self):
+        """Number of distinct years and magnitudes"""
+
+        return len(self.years), len(self.magnitudes)
+
+    def year_index(self, year, side='left'):
+        """
+        Return the index of the first year of the cube
+        >= year (> year with side 'right')
+        """
+
+        return np.searchsorted(self.years, year, side)
+
+    def magnitude_index(self, magnitude, side='left', rounding=None):
+        """
+        Return the index of the first magnitude of the cube
+        >= magnitude (> magnitude with side 'right')
+        :keyword rounding: non decreasing function applied to the
+                           magnitudes of the cube before comparing them
+        """
+
+        magnitudes = self.magnitudes
+        if rounding is not None:
+            magnitudes = rounding(magnitudes)
+        return np.searchsorted(magnitudes, magnitude, side)
+
+    def count(self, year_start, year_stop, magnitude_start, magnitude_stop):
+        """
+        Return the number of events inside ranges of year
+        and magnitude indexes, indexes can be arrays
+        and are broadcast against each other
+        """
+
+        cumulative = self.cumulative
+        return cumulative[year_stop, magnitude_stop] - \
+            cumulative[year_start, magnitude_stop] - \
+            cumulative[year_stop, magnitude_start] + \
+            cumulative[year_start, magnitude_start]
+
+    def extent(self, year_start=0, magnitude_start=0):
+        """
+        Return the minimum and maximum year and magnitude
+        of the events from year and magnitude indexes on
+        :rtype: tuple (min year, max year, min magnitude, max magnitude)
+        """
+
+        nyears, nmagnitudes = self.shape
+        if not self.count(year_start, nyears, magnitude_start, nmagnitudes):
+            raise ValueError('No events in the selected ranges')
+
+        # Events before every year, and before every magnitude
+        by_year = self.count(0, np.arange(nyears + 1), magnitude_start,
+            nmagnitudes)
+        by_magnitude = self.count(year_start, nyears, 0,
+            np.arange(nmagnitudes + 1))
+
+        first_year = np.searchsorted(by_year, by_year[year_start], 'right')
+        last_year = np.searchsorted(by_year, by_year[-1], 'left')
+        first_mag = np.searchsorted(by_magnitude,
+            by_magnitude[magnitude_start], 'right')
+        last_mag = np.searchsorted(by_magnitude, by_magnitude[-1], 'left')
+
+        return (self.years[first_year - 1], self.years[last_year - 1],
+                self.magnitudes[first_mag - 1], self.magnitudes[last_mag - 1])
@@ -28,10 +28,12 @@ algorithms are:
 import numpy as np
 import logging
 
+from mtoolkit.scientific.catalogue_utilities import CountCube
+
 LOGGER = logging.getLogger('mt_logger')
 
 
-def stepp_analysis(year, mw, dm=0.1, dt=1, ttol=0.2, iloc=True):
+def stepp_analysis(year, mw, dm=0.1, dt=1, ttol=0.2, iloc=True, cube=None):
     """
     Stepp algorithm
 
@@ -50,47 +52,97 @@ def stepp_analysis(year, mw, dm=0.1, dt=1, ttol=0.2, iloc=True):
                    (i.e. completess cannot increase for more recent
                    catalogues)
     :type iloc: bool
+    :keyword cube: counts of the events by year and magnitude,
+                   built from year and mw if not given
+    :type cube: CountCube
     :returns: two-column completeness table representing the earliest
               year at which the catalogue is complete above a
               given magnitude
     :rtype: numpy.ndarray
     """
 
-    # Round off the magnitudes to 2 d.p
-    mw = np.around(100.0 * mw) / 100.0
-    lowm = np.floor(10. * np.min(mw)) / 10.
-    highm = np.ceil(10. * np.max(mw)) / 10.
+    return stepp_table(stepp_counts(year, mw, dm, dt, cube), ttol, iloc)
+
+
+def stepp_counts(year, mw, dm=0.1, dt=1, cube=None):
+    """
+    Count the events of the Stepp algorithm time and
+    magnitude windows. The counts don't depend on the
+    tolerance, so they can be shared by analyses with
+    different tolerance thresholds.
+
+    :param year: catalog matrix year column
+    :type year: numpy.ndarray
+    :param mw: catalog matrix magnitude column
+    :type mw: numpy.ndarray
+    :keyword dm: magnitude interval/window
+    :type dm: positive float
+    :keyword dt: time interval
+    :type dt: int
+    :keyword cube: counts of the events by year and magnitude,
+                   built from year and mw if not given
+    :type cube: CountCube
+    :returns: dict with the magnitude bins (`mbin`), the time
+              ranges (`time_range`), the last year (`end_time`)
+              and the number of events in every window
+              (`number_obs`)
+    :rtype: dict
+    """
+
+    if cube is None:
+        cube = CountCube(year, mw)
+    nyears, nmagnitudes = cube.shape
+
+    # Magnitudes are rounded off to 2 d.p
+    rounding = lambda mw: np.around(100.0 * mw) / 100.0
+    lowm = np.floor(10. * rounding(cube.magnitudes[0])) / 10.
+    highm = np.ceil(10. * rounding(cube.magnitudes[-1])) / 10.
     # Determine magnitude bins
     mbin = np.arange(lowm, highm + dm, dm)
-    ntb = np.max(np.shape(mbin))
     # Determine time bins
-    end_time = np.max(year)
-    start_time = np.min(year)
+    end_time = cube.years[-1]
+    start_time = cube.years[0]
     time_range = np.arange(dt, end_time - start_time + 2, dt)
+    t_lower_bound = end_time - time_range
+
+    # Count earthquakes later than or in every lower bound,
+    # in every magnitude bin, the last bin is unbounded
+    year_start = cube.year_index(t_lower_bound)[:, np.newaxis]
+    mag_edges = np.append(cube.magnitude_index(mbin[:-1],
+        rounding=rounding), nmagnitudes)
+    number_obs = cube.count(year_start, nyears, mag_edges[:-1],
+        mag_edges[1:]).astype(float)
+
+    return {'mbin': mbin, 'time_range': time_range, 'end_time': end_time,
+            'number_obs': number_obs}
+
+
+def stepp_table(counts, ttol=0.2, iloc=True):
+    """
+    Compute the Stepp completeness table from
+    the counts of events in time and magnitude windows
+
+    :param counts: counts returned by stepp_counts
+    :type counts: dict
+    :keyword ttol: tolerance threshold
+    :type ttol: positive float
+    :keyword iloc: Fix analysis such that completeness magnitude
+                   can only increase with catalogue duration
+    :type iloc: bool
+    :returns: two-column completeness table
+    :rtype: numpy.ndarray
+    """
+
+    mbin = counts['mbin']
+    time_range = counts['time_range']
+    end_time = counts['end_time']
+    number_obs = counts['number_obs']
     nt = np.max(np.shape(time_range))
-    t_upper_bound = end_time * np.ones(nt)
-    t_lower_bound = t_upper_bound - time_range
+    ntb = np.max(np.shape(mbin))
     t_rate = 1. / np.sqrt(time_range)  # Poisson rate
 
-    number_obs = np.zeros((nt, ntb - 1))
     lamda = np.zeros((nt, ntb - 1))
     siglam = np.zeros((nt, ntb - 1))
-    ii = 0
-    # count number of events catalogue and magnitude windows
-    while ii <= (nt - 1):
-    # Select earthquakes later than or in Year[ii]
-        yrchk = year >= t_lower_bound[ii]
-        mtmp = mw[yrchk]
-        jj = 0
-        while jj <= (ntb - 2):
-            #Count earthquakes in magnitude bin
-            if jj == (ntb - 2):
-                number_obs[ii, jj] = np.sum(mtmp >= np.sum(mbin[jj]))
-            else:
-                number_obs[ii, jj] = np.sum(np.logical_and(mtmp >= mbin[jj],
-                                           mtmp < mbin[jj + 1]))
-            jj = jj + 1
-        ii = ii + 1
 
     time_diff = (np.log10(t_rate[1:]) - np.log10(t_rate[:-1]))
     time_diff = time_diff / (
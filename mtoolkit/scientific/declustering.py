@@ -29,8 +29,9 @@ import abc
 import numpy as np
 import logging
 
-from mtoolkit.scientific.catalogue_utilities import (decimal_year,
-                                                        haversine)
+from mtoolkit.scientific.catalogue_utilities import (catalogue_features,
+                                                        haversine_one_to_many,
+                                                        within_distance)
 
 
 LOGGER = logging.getLogger('mt_logger')
@@ -171,42 +172,160 @@ def gardner_knopoff_decluster(
     :rtype: numpy.ndarray
     """
 
-    # Get relevent parameters
-    m = catalog_matrix[:, 5]
-    neq = np.shape(catalog_matrix)[0]  # Number of earthquakes
-    # Get decimal year (needed for time windows)
-    year_dec = decimal_year(
-        catalog_matrix[:, 0], catalog_matrix[:, 1], catalog_matrix[:, 2])
+    sorted_catalog = sort_by_magnitude(catalog_matrix, window_opt)
+    vcl, flagvector = gardner_knopoff_sorted(sorted_catalog, fs_time_prop)
+
+    # Now to produce a catalogue with aftershocks purged
+    vmain_shock = catalog_matrix[np.nonzero(flagvector == 0)[0], :]
+
+    return vcl, vmain_shock, flagvector
+
+
+def sort_by_magnitude(catalog_matrix, window_opt=TDW_GARDNERKNOPOFF,
+                      indexes=None):
+    """
+    Compute the arrays used by gardner knopoff
+    declustering, sorted by descending magnitude.
+    They depend only on the catalogue and on the
+    window method, so they can be shared by runs
+    with different foreshock time windows.
+
+    :param catalog_matrix: eq catalog in a matrix format with these columns in
+                            order: `year`, `month`, `day`, `longitude`,
+                            `latitude`, `Mw`
+    :type catalog_matrix: numpy.ndarray
+    :keyword window_opt: method used in calculating distance and time windows
+    :type window_opt: string
+    :keyword indexes: declusters only these events of the catalogue
+    :type indexes: numpy.ndarray
+    :returns: dict with the sort permutation (`order`) and the sorted
+              `year_dec`, `longitude_rad`, `latitude_rad`, `cos_latitude`,
+              `sw_space`, `sw_time`
+    :rtype: dict
+    """
+
+    features = catalogue_features(catalog_matrix)
     # Get space and time windows corresponding to each event
-    sw_space, sw_time = time_dist_windows[window_opt].calc(m)
-    eqid = np.arange(0, neq, 1)  # Initial Position Identifier
+    sw_space, sw_time = event_windows(features, window_opt)
+
+    if indexes is None:
+        order = features.magnitude_order
+        selected = order
+    else:
+        # Sort magnitudes into descending order, a stable sort
+        # keeps events of equal magnitude in catalogue order, so
+        # that a part of the catalogue is declustered as in the
+        # whole catalogue (see gardner_knopoff_update)
+        order = np.flipud(np.argsort(features.magnitude[indexes],
+            kind='mergesort'))
+        selected = indexes[order]
+
+    return {'order': order,
+            'year_dec': features.year_dec[selected],
+            'longitude_rad': features.longitude_rad[selected],
+            'latitude_rad': features.latitude_rad[selected],
+            'cos_latitude': features.cos_latitude[selected],
+            'sw_space': sw_space[selected],
+            'sw_time': sw_time[selected]}
+
+
+def event_windows(features, window_opt):
+    """
+    Return the space and time windows of the events
+    of a catalogue, computed once per window method
+
+    :param features: features of the catalogue
+    :type features: CatalogueFeatures
+    :param window_opt: method used in calculating distance and time windows
+    :type window_opt: string
+    :returns: distance and time windows
+    :rtype: numpy.ndarray
+    """
+
+    return features.memoize(('windows', window_opt),
+        lambda: time_dist_windows[window_opt].calc(features.magnitude))
+
+
+def gardner_knopoff_sorted(sorted_catalog, fs_time_prop=0,
+                           process_last=False):
+    """
+    Gardner Knopoff cluster identification on
+    a catalogue sorted by descending magnitude.
+
+    :param sorted_catalog: arrays returned by sort_by_magnitude
+    :type sorted_catalog: dict
+    :keyword fs_time_prop: foreshock time window as a proportion of
+                           aftershock time window
+    :type fs_time_prop: positive float
+    :keyword process_last: look for the cluster of the last (smallest)
+                           event too, the algorithm skips it unless the
+                           sorted events are part of a larger catalogue
+    :type process_last: bool
+    :returns: **vcl vector** indicating cluster number, **flagvector**
+              indicating which eq events belong to a cluster, both
+              in the original catalogue order
+    :rtype: numpy.ndarray
+    """
+
+    vcl, flagvector, _ = gardner_knopoff_clusters(sorted_catalog,
+        fs_time_prop, process_last)
+
+    # Re-sort into original order
+    order = sorted_catalog['order']
+    original_vcl = np.empty_like(vcl)
+    original_vcl[order] = vcl
+    original_flagvector = np.empty_like(flagvector)
+    original_flagvector[order] = flagvector
+
+    return original_vcl, original_flagvector
+
+
+def gardner_knopoff_clusters(sorted_catalog, fs_time_prop=0,
+                             process_last=False):
+    """
+    Gardner Knopoff cluster identification on a catalogue
+    sorted by descending magnitude, results are in the
+    sorted order (see gardner_knopoff_sorted).
+
+    :param sorted_catalog: arrays returned by sort_by_magnitude
+    :type sorted_catalog: dict
+    :keyword fs_time_prop: foreshock time window as a proportion of
+                           aftershock time window
+    :type fs_time_prop: positive float
+    :keyword process_last: look for the cluster of the last event too
+    :type process_last: bool
+    :returns: **vcl vector** indicating cluster number, **flagvector**
+              indicating which eq events belong to a cluster and the
+              positions of the events each cluster was identified from,
+              in cluster number order
+    :rtype: numpy.ndarray
+    """
+
+    year_dec = sorted_catalog['year_dec']
+    longitude = sorted_catalog['longitude_rad']
+    latitude = sorted_catalog['latitude_rad']
+    cos_latitude = sorted_catalog['cos_latitude']
+    sw_space = sorted_catalog['sw_space']
+    sw_time = sorted_catalog['sw_time']
+    neq = len(year_dec)
 
     # Pre-allocate cluster index vectors
     vcl = np.zeros(neq, dtype=int)
-
-    # Sort magnitudes into descending order
-    id0 = np.flipud(np.argsort(m, kind='heapsort'))
-    m = m[id0]
-    catalog_matrix = catalog_matrix[id0, :]
-    sw_space = sw_space[id0]
-    sw_time = sw_time[id0]
-    year_dec = year_dec[id0]
-    eqid = eqid[id0]
     flagvector = np.zeros(neq, dtype=int)
+    mains = []
     #Begin cluster identification
     clust_index = 0
-    for i in range(0, neq - 1):
+    for i in range(0, neq if process_last else neq - 1):
         if vcl[i] == 0:
             # Find Events inside both fore- and aftershock time windows
             dt = year_dec - year_dec[i]
             vsel = np.logical_and(dt >= (-sw_time[i] * fs_time_prop),
-                                              dt <= sw_time[i],
-                                              flagvector == 0)
+                                  dt <= sw_time[i])
             # Of those events inside time window, find those inside distance
             # window
-            vsel1 = haversine(
-                catalog_matrix[vsel, 3], catalog_matrix[vsel, 4],
-                catalog_matrix[i, 3], catalog_matrix[i, 4]) <= sw_space[i]
+            vsel1 = within_distance(longitude[vsel], latitude[vsel],
+                cos_latitude[vsel], longitude[i], latitude[i],
+                cos_latitude[i], sw_space[i])
             vsel[vsel] = vsel1
             temp_vsel = np.copy(vsel)
             temp_vsel[i] = False
@@ -220,17 +339,126 @@ def gardner_knopoff_decluster(
                 flagvector[temp_vsel] = -1
                 flagvector[i] = 0
                 clust_index += 1
+                mains.append(i)
 
-    # Re-sort the catalog_matrix into original order
-    id1 = np.argsort(eqid, kind='heapsort')
-    eqid = eqid[id1]
-    catalog_matrix = catalog_matrix[id1, :]
-    vcl = vcl[id1]
-    flagvector = flagvector[id1]
-    # Now to produce a catalogue with aftershocks purged
-    vmain_shock = catalog_matrix[np.nonzero(flagvector == 0)[0], :]
+    return vcl, flagvector, np.array(mains, dtype=int)
 
-    return vcl, vmain_shock, flagvector
+
+def gardner_knopoff_update(catalog_matrix, vcl, flagvector,
+    window_opt=TDW_GARDNERKNOPOFF, fs_time_prop=0):
+    """
+    Update the Gardner Knopoff declustering of a catalogue
+    after new events are appended. Two events interact when
+    one of them is inside the space and time windows of the
+    other, only the events linked to the new ones by a chain
+    of interactions are declustered again: the others are
+    declustered as in the previous catalogue, so they keep
+    their cluster and flag. Candidates for an interaction
+    are looked up within the longest time window of the
+    catalogue.
+
+    :param catalog_matrix: eq catalog in a matrix format (see
+                           gardner_knopoff_decluster), previously
+                           declustered events followed by the new ones
+    :type catalog_matrix: numpy.ndarray
+    :param vcl: cluster number of the previously declustered events
+    :type vcl: numpy.ndarray
+    :param flagvector: flags of the previously declustered events
+    :type flagvector: numpy.ndarray
+    :keyword window_opt: method used in calculating distance and time windows
+    :type window_opt: string
+    :keyword fs_time_prop: foreshock time window as a proportion of
+                           aftershock time window
+    :type fs_time_prop: positive float
+    :returns: **vcl vector** indicating cluster number,
+              **vmain_shock catalog** containing non-clustered
+              events, **flagvector** indicating which eq events
+              belong to a cluster, for the whole catalogue
+    :rtype: numpy.ndarray
+    """
+
+    neq = np.shape(catalog_matrix)[0]
+    nold = len(vcl)
+
+    updated_vcl = np.zeros(neq, dtype=int)
+    updated_vcl[:nold] = vcl
+    updated_flagvector = np.zeros(neq, dtype=int)
+    updated_flagvector[:nold] = flagvector
+
+    if neq > nold:
+        affected = _interacting_events(catalog_matrix,
+            np.arange(nold, neq), window_opt, fs_time_prop)
+        LOGGER.debug("* Events declustered again: %d" % len(affected))
+
+        # The whole catalogue skips its last event, the events
+        # declustered again skip it only if they include it
+        magnitude = catalog_matrix[:, 5]
+        last = np.nonzero(magnitude == np.min(magnitude))[0][0]
+        region_vcl, region_flagvector = gardner_knopoff_sorted(
+            sort_by_magnitude(catalog_matrix, window_opt, affected),
+            fs_time_prop, process_last=last not in affected)
+
+        # Clusters declustered again are numbered after those kept
+        kept = np.ones(neq, dtype=bool)
+        kept[affected] = False
+        offset = np.max(updated_vcl[kept]) if kept.any() else 0
+        region_vcl[region_vcl != 0] += offset
+        updated_vcl[affected] = region_vcl
+        updated_flagvector[affected] = region_flagvector
+
+    vmain_shock = catalog_matrix[np.nonzero(updated_flagvector == 0)[0], :]
+
+    return updated_vcl, vmain_shock, updated_flagvector
+
+
+def _interacting_events(catalog_matrix, seeds, window_opt, fs_time_prop):
+    """
+    Return, in catalogue order, the indexes of the events
+    linked to the seed events by a chain of events inside
+    each other's space and time windows
+    """
+
+    features = catalogue_features(catalog_matrix)
+    year_dec = features.year_dec
+    longitude = features.longitude_rad
+    latitude = features.latitude_rad
+    cos_latitude = features.cos_latitude
+    sw_space, sw_time = event_windows(features, window_opt)
+    reach = np.max(sw_time) * max(1., fs_time_prop)
+
+    by_time = features.time_order
+    sorted_year = year_dec[by_time]
+
+    linked = np.zeros(len(year_dec), dtype=bool)
+    linked[seeds] = True
+    frontier = list(seeds)
+    while frontier:
+        i = frontier.pop()
+        lower = np.searchsorted(sorted_year, year_dec[i] - reach, 'left')
+        upper = np.searchsorted(sorted_year, year_dec[i] + reach, 'right')
+        candidates = by_time[lower:upper]
+        candidates = candidates[~linked[candidates]]
+        if not len(candidates):
+            continue
+
+        dt = year_dec[candidates] - year_dec[i]
+        distance = haversine_one_to_many(longitude[candidates],
+            latitude[candidates], cos_latitude[candidates], longitude[i],
+            latitude[i], cos_latitude[i])
+        # Candidate inside the window of i, or i inside
+        # the window of the candidate
+        inside = np.logical_or(
+            np.logical_and.reduce([dt >= -sw_time[i] * fs_time_prop,
+                                   dt <= sw_time[i],
+                                   distance <= sw_space[i]]),
+            np.logical_and.reduce([-dt >= -sw_time[candidates] * fs_time_prop,
+                                   -dt <= sw_time[candidates],
+                                   distance <= sw_space[candidates]]))
+        new_linked = candidates[inside]
+        linked[new_linked] = True
+        frontier.extend(new_linked)
+
+    return np.nonzero(linked)[0]
 
 
 def _find_aftershocks(dtime, nval, time_window):
@@ -323,15 +551,18 @@ def afteran_decluster(
 
     # Pre-processing steps are the same as for Gardner & Knopoff
     # Get relevent parameters
-    mag = catalogue_matrix[:, 5]
+    features = catalogue_features(catalogue_matrix)
+    mag = features.magnitude
 
     neq = np.shape(catalogue_matrix)[0]  # Number of earthquakes
     # Get decimal year (needed for time windows)
-    year_dec = decimal_year(catalogue_matrix[:, 0], catalogue_matrix[:, 1],
-                            catalogue_matrix[:, 2])
+    year_dec = features.year_dec
 
     # Get space windows corresponding to each event
-    sw_space = time_dist_windows[window_opt].calc(mag)[0]
+    sw_space = event_windows(features, window_opt)[0]
+    longitude = features.longitude_rad
+    latitude = features.latitude_rad
+    cos_latitude = features.cos_latitude
 
     eqid = np.arange(0, neq, 1)  # Initial Position Identifier
 
@@ -339,11 +570,14 @@ def afteran_decluster(
     vcl = np.zeros((neq, 1), dtype=int)
     flagvector = np.zeros((neq, 1), dtype=int)
     # Sort magnitudes into descending order
-    id0 = np.flipud(np.argsort(mag, kind='heapsort'))
+    id0 = features.magnitude_order
     mag = mag[id0]
     catalogue_matrix = catalogue_matrix[id0, :]
     sw_space = sw_space[id0]
     year_dec = year_dec[id0]
+    longitude = longitude[id0]
+    latitude = latitude[id0]
+    cos_latitude = cos_latitude[id0]
     eqid = eqid[id0]
 
     i = 0
@@ -352,11 +586,11 @@ def afteran_decluster(
         if vcl[i] == 0:
             # Earthquake not allocated to cluster - perform calculation
             # Perform distance calculation
-            mdist = haversine(catalogue_matrix[:, 3], catalogue_matrix[:, 4],
-                          catalogue_matrix[i, 3], catalogue_matrix[i, 4])
+            within = within_distance(longitude, latitude, cos_latitude,
+                longitude[i], latitude[i], cos_latitude[i], sw_space[i])
 
             # Select earthquakes inside distance window and not in cluster
-            vsel = np.logical_and(mdist <= sw_space[i], vcl == 0).flatten()
+            vsel = np.logical_and(within, vcl[:, 0] == 0)
             dtime = year_dec[vsel] - year_dec[i]
 
             nval = np.shape(dtime)[0]  # Number of events inside valid window
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide functions
+which find the events of a merged catalogue reported
+by several agencies, so that every earthquake is
+kept once, as reported by the preferred agency.
+"""
+
+import itertools
+import logging
+
+import numpy as np
+
+from mtoolkit.scientific.catalogue_utilities import (greg2julian,
+                                                     within_distance,
+                                                     EARTH_RADIUS)
+
+LOGGER = logging.getLogger('mt_logger')
+
+SECONDS_PER_DAY = 86400.
+
+# Offsets of the neighbouring buckets (time, x, y, z), each
+# pair of buckets is looked at once: the bucket itself and
+# the offsets following it in lexicographic order
+NEIGHBOUR_OFFSETS = [offset for offset in
+                     itertools.product((-1, 0, 1), repeat=4)
+                     if offset > (0, 0, 0, 0)]
+
+
+def find_duplicates(columns, time_window, distance_window,
+                    magnitude_window=None, agencies=None):
+    """
+    Find the events reported by several agencies: two events
+    of different agencies are the same earthquake when their
+    origin times differ by at most time_window, their
+    epicentres by at most distance_window and, if declared,
+    their Mw by at most magnitude_window. Of two such events
+    the one of the agency coming first in agencies (agencies
+    not listed come after, all equal) is kept, the first in
+    the catalogue between equal agencies.
+
+    Events are hashed in buckets of time_window seconds and
+    of distance_window km of the earth centred coordinates
+    (a chord is never longer than its arc), so every event
+    is compared only with the events of the same and of the
+    neighbouring buckets.
+
+    :param columns: catalogue fields (Agency, year, month,
+        day, hour, minute, second, longitude, latitude, Mw)
+        mapped to arrays, missing values are NaN
+    :type columns: dict
+    :param time_window: time tolerance in seconds
+    :type time_window: positive float
+    :param distance_window: distance tolerance in km
+    :type distance_window: positive float
+    :keyword magnitude_window: Mw tolerance, magnitudes are not
+        compared if not given
+    :type magnitude_window: float
+    :keyword agencies: agencies in order of preference
+    :type agencies: list of strings
+    :returns: for every event the index of the preferred event it
+        duplicates, -1 for events which are kept
+    :rtype: numpy.ndarray
+    """
+
+    if not time_window > 0 or not distance_window > 0:
+        raise RuntimeError('Deduplication requires positive time and '
+            'distance windows, found %s and %s' % (time_window,
+                                                  distance_window))
+
+    neq = len(columns['year'])
+    if not neq:
+        return np.zeros(0, dtype=int)
+    seconds = SECONDS_PER_DAY * greg2julian(columns['year'],
+        columns['month'], columns['day'], np.nan_to_num(columns['hour']),
+        np.nan_to_num(columns['minute']), np.nan_to_num(columns['second']))
+    longitude = np.radians(columns['longitude'])
+    latitude = np.radians(columns['latitude'])
+    cos_latitude = np.cos(latitude)
+
+    first, second = _candidate_pairs(seconds, longitude, latitude,
+        cos_latitude, time_window, distance_window)
+
+    agency_names, agency_codes = np.unique(
+        np.asarray(columns['Agency'], dtype=str), return_inverse=True)
+    same = np.abs(seconds[first] - seconds[second]) <= time_window
+    same &= agency_codes[first] != agency_codes[second]
+    same &= within_distance(longitude[first], latitude[first],
+        cos_latitude[first], longitude[second], latitude[second],
+        cos_latitude[second], distance_window)
+    if magnitude_window is not None:
+        same &= np.abs(columns['Mw'][first] - columns['Mw'][second]) <= \
+            magnitude_window
+    first, second = first[same], second[same]
+
+    # Preference of every event, the lowest is kept
+    agencies = [str(agency) for agency in agencies or []]
+    agency_rank = np.array([agencies.index(name) if name in agencies
+                            else len(agencies) for name in agency_names],
+                           dtype=np.int64)
+    preference = agency_rank[agency_codes] * neq + np.arange(neq)
+
+    kept = np.where(preference[first] < preference[second], first, second)
+    removed = first + second - kept
+    best = np.repeat(np.iinfo(np.int64).max, neq)
+    np.minimum.at(best, removed, preference[kept])
+
+    duplicate_of = np.repeat(-1, neq)
+    found = best < np.iinfo(np.int64).max
+    duplicate_of[found] = best[found] % neq
+    LOGGER.debug("* Duplicate events: %d, candidate pairs: %d" %
+        (np.sum(found), np.sum(same)))
+    return duplicate_of
+
+
+def _candidate_pairs(seconds, longitude, latitude, cos_latitude,
+                     time_window, distance_window):
+    """
+    Return the pairs of events (first < second) in the same
+    or in neighbouring buckets of time and earth centred
+    coordinates, each pair once.
+    """
+
+    coordinates = EARTH_RADIUS * np.column_stack([
+        cos_latitude * np.cos(longitude), cos_latitude * np.sin(longitude),
+        np.sin(latitude)])
+    cells = np.column_stack([np.floor(seconds / time_window),
+        np.floor(coordinates / distance_window)]).astype(np.int64)
+
+    # Buckets are numbered by rank on every axis, the number of
+    # a neighbouring bucket is looked up by binary search
+    axes = [np.unique(cells[:, axis]) for axis in xrange(cells.shape[1])]
+    ranks = np.column_stack([np.searchsorted(values, cells[:, axis])
+                             for axis, values in enumerate(axes)])
+    sizes = [len(values) for values in axes]
+    buckets = np.ravel_multi_index(ranks.T, sizes)
+    order = np.argsort(buckets, kind='mergesort')
+    sorted_buckets = buckets[order]
+
+    # Pairs in the same bucket, by position in the bucket
+    start = np.searchsorted(sorted_buckets, sorted_buckets, 'left')
+    stop = np.searchsorted(sorted_buckets, sorted_buckets, 'right')
+    positions = np.arange(len(order))
+    pairs = [_expand(positions, positions + 1, stop)]
+
+    # Ranks of the neighbouring cells on every axis, with a
+    # flag telling if any event is in the neighbouring cell
+    sorted_cells = cells[order]
+    neighbours = []
+    for axis, values in enumerate(axes):
+        by_step = {}
+        for step in (-1, 1):
+            cell = sorted_cells[:, axis] + step
+            rank = np.minimum(np.searchsorted(values, cell), len(values) - 1)
+            by_step[step] = (rank, values[rank] == cell)
+        by_step[0] = (ranks[order, axis], None)
+        neighbours.append(by_step)
+
+    for offset in NEIGHBOUR_OFFSETS:
+        present = np.ones(len(order), dtype=bool)
+        for axis, step in enumerate(offset):
+            if step:
+                present &= neighbours[axis][step][1]
+        events = np.nonzero(present)[0]
+        if not len(events):
+            continue
+        neighbour = np.ravel_multi_index([neighbours[axis][step][0][events]
+                                          for axis, step in
+                                          enumerate(offset)], sizes)
+        pairs.append(_expand(events,
+            np.searchsorted(sorted_buckets, neighbour, 'left'),
+            np.searchsorted(sorted_buckets, neighbour, 'right')))
+
+    first = order[np.concatenate([pair[0] for pair in pairs])]
+    second = order[np.concatenate([pair[1] for pair in pairs])]
+    return np.minimum(first, second), np.maximum(first, second)
+
+
+def _expand(events, start, stop):
+    """
+    Return the pairs of every event with the
+    events of its range [start, stop)
+    """
+
+    counts = stop - start
+    first = np.repeat(events, counts)
+    offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) -
+                                                    counts, counts)
+    return first, np.repeat(start, counts) + offsets
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide functions
+which convert magnitudes of different types (Ms, mb,
+ML) to moment magnitude, by piecewise linear
+regressions, so that events lacking Mw can be used.
+"""
+
+import logging
+
+import numpy as np
+
+LOGGER = logging.getLogger('mt_logger')
+
+# Magnitude types which can be converted, the sigma
+# of each one is stored in the field sigma<type>
+CONVERTIBLE_MAGNITUDES = ['Ms', 'mb', 'ML']
+
+
+def homogenise_magnitudes(columns, conversions):
+    """
+    Convert to Mw the magnitudes of the events lacking Mw.
+    Every conversion declares the magnitude type it converts,
+    the agencies it's valid for (all if not declared) and its
+    segments: linear regressions Mw = intercept + slope * M
+    valid in a range of M (min_magnitude <= M < max_magnitude,
+    open when a bound is not declared). Conversions are in
+    order of preference, an event takes the Mw of the first
+    conversion valid for its agency and magnitudes. The sigma
+    of the converted Mw propagates the sigma of the regression
+    and the one of the magnitude:
+    sqrt(sigma ** 2 + (slope * sigmaM) ** 2).
+
+    :param columns: catalogue fields (Agency, Mw, sigmaMw,
+        Ms, sigmaMs, mb, sigmamb, ML, sigmaML) mapped to
+        arrays, missing values are NaN
+    :type columns: dict
+    :param conversions: conversions as read from the config
+    :type conversions: list of dicts
+    :returns: Mw, sigmaMw (NaN for events without Mw after the
+        conversion) and the number of the conversion giving the
+        Mw of every event (-1 for events not converted)
+    :rtype: tuple of numpy.ndarray
+    """
+
+    mw = np.array(columns['Mw'], dtype=float)
+    sigma_mw = np.array(columns['sigmaMw'], dtype=float)
+    conversion_number = np.repeat(-1, len(mw))
+
+    for number, conversion in enumerate(conversions):
+        if conversion.get('magnitude') not in CONVERTIBLE_MAGNITUDES:
+            raise RuntimeError('Invalid magnitude in conversion %d: %s, '
+                'expected one of %s' % (number, conversion.get('magnitude'),
+                                        ', '.join(CONVERTIBLE_MAGNITUDES)))
+
+    # Only events lacking Mw are looked at, their agencies
+    # are coded once so that every conversion selects its
+    # agencies by a lookup on the codes
+    candidates = np.nonzero(np.isnan(mw))[0]
+    agency_names, agency_codes = np.unique(
+        np.asarray(columns['Agency'][candidates], dtype=str),
+        return_inverse=True)
+    pending = np.ones(len(candidates), dtype=bool)
+
+    for number, conversion in enumerate(conversions):
+        magnitude_type = conversion['magnitude']
+        selected = pending & ~np.isnan(columns[magnitude_type][candidates])
+        if conversion.get('agencies'):
+            valid_agency = np.in1d(agency_names,
+                [str(agency) for agency in conversion['agencies']])
+            selected &= valid_agency[agency_codes]
+
+        indexes = candidates[selected]
+        magnitude = columns[magnitude_type][indexes]
+        sigma = np.nan_to_num(columns['sigma' + magnitude_type][indexes])
+        unconverted = np.ones(len(indexes), dtype=bool)
+        for segment in conversion.get('segments') or []:
+            # Events of overlapping segments take the first one
+            inside = unconverted.copy()
+            if segment.get('min_magnitude') is not None:
+                inside &= magnitude >= segment['min_magnitude']
+            if segment.get('max_magnitude') is not None:
+                inside &= magnitude < segment['max_magnitude']
+
+            converted = indexes[inside]
+            slope = segment['slope']
+            mw[converted] = segment['intercept'] + slope * magnitude[inside]
+            sigma_mw[converted] = np.sqrt(segment.get('sigma', 0.) ** 2 +
+                (slope * sigma[inside]) ** 2)
+            conversion_number[converted] = number
+            unconverted &= ~inside
+
+        pending[np.nonzero(selected)[0][~unconverted]] = False
+        LOGGER.debug("* Events converted from %s by conversion %d: %d" %
+            (magnitude_type, number, np.sum(~unconverted)))
+
+    return mw, sigma_mw, conversion_number
@@ -28,6 +28,8 @@ algorithms are:
 import numpy as np
 import logging
 
+from mtoolkit.scientific.catalogue_utilities import CountCube
+
 LOGGER = logging.getLogger('mt_logger')
 
 
@@ -63,6 +65,9 @@ def recurrence_analysis(year_col, magnitude_col,
     :rtype: numpy.float64
     """
 
+    # Events are binned once for all the queries of the algorithm
+    cube = CountCube(year_col, magnitude_col)
+
     if recurrence_algorithm == 'Weichert':
         cent_mag, t_per, n_obs = weichert_prep(
             year_col,
@@ -70,7 +75,8 @@ def recurrence_analysis(year_col, magnitude_col,
             completeness_table[:, 0],
             completeness_table[:, 1],
             magnitude_window,
-            time_window)
+            time_window,
+            cube)
 
         bval, sigb, a_m, siga_m = weichert(
             t_per,
@@ -85,11 +91,12 @@ def recurrence_analysis(year_col, magnitude_col,
                 completeness_table[:, 0],
                 completeness_table[:, 1],
                 magnitude_window,
-                reference_magnitude)
+                reference_magnitude,
+                cube)
     return bval, sigb, a_m, siga_m
 
 
-def recurrence_table(mag, dmag, year):
+def recurrence_table(mag, dmag, year, cube=None):
     """
     Table of recurrence statistics for each magnitude
     [Magnitude, Number of Observations, Cumulative Number
@@ -105,25 +112,43 @@ def recurrence_table(mag, dmag, year):
     :type dmag: numpy.ndarray
     :param year: catalog matrix year column
     :type year: numpy.ndarray
+    :keyword cube: counts of the events by year and magnitude,
+                   built from year and mag if not given
+    :type cube: CountCube
     :returns: recurrence table
     :rtype: numpy.ndarray
     """
 
+    if cube is None:
+        cube = CountCube(year, mag)
+    return _recurrence_table(cube, dmag)
+
+
+def _recurrence_table(cube, dmag, year_start=0, magnitude_start=0):
+    """
+    Table of recurrence statistics (see recurrence_table)
+    of the events of a cube from year and magnitude indexes on
+    """
+
+    nyears, nmagnitudes = cube.shape
+    min_year, max_year, min_mag, max_mag = cube.extent(year_start,
+        magnitude_start)
+
     # Define magnitude vectors
-    num_year = np.max(year) - np.min(year) + 1.
-    upper_m = np.max(np.ceil(10.0 * mag) / 10.0)
-    lower_m = np.min(np.floor(10.0 * mag) / 10.0)
+    num_year = max_year - min_year + 1.
+    upper_m = np.ceil(10.0 * max_mag) / 10.0
+    lower_m = np.floor(10.0 * min_mag) / 10.0
     mag_range = np.arange(lower_m, upper_m + (2 * dmag), dmag)
     mval = mag_range[:-1] + (dmag / 2.0)
-    # Find number of earthquakes inside range
-    number_obs = np.histogram(mag, mag_range)[0]
-    number_rows = np.shape(number_obs)[0]
+    # Find number of earthquakes inside range, as a
+    # histogram the last bin includes its upper edge
+    mag_edges = np.append(cube.magnitude_index(mag_range[:-1]),
+        cube.magnitude_index(mag_range[-1], 'right'))
+    mag_edges = np.maximum(mag_edges, magnitude_start)
+    number_obs = cube.count(year_start, nyears, mag_edges[:-1],
+        mag_edges[1:])
     # Cumulative number of events
-    n_c = np.zeros((number_rows, 1))
-    i = 0
-    while i < number_rows:
-        n_c[i] = np.sum(number_obs[i:], axis=0)
-        i += 1
+    n_c = np.cumsum(number_obs[::-1])[::-1].astype(float)
 
     # Normalise to Annual Rate
     number_obs_annual = number_obs / num_year
@@ -171,7 +196,7 @@ def b_max_likelihood(mval, number_obs, dmag=0.1, m_c=0.0):
     return bval, sigma_b
 
 
-def b_maxlike_time(year, mag, ctime, cmag, dmag, ref_mag=0.0):
+def b_maxlike_time(year, mag, ctime, cmag, dmag, ref_mag=0.0, cube=None):
     """
     Allows to get a profile of bvalue varying with time
     for calculation of the bvalue of the catalogue from MLE.
@@ -190,10 +215,17 @@ def b_maxlike_time(year, mag, ctime, cmag, dmag, ref_mag=0.0):
     :type dmag: positive float
     :keyword ref_mag: reference magnitude
     :type ref_mag: float
+    :keyword cube: counts of the events by year and magnitude,
+                   built from year and mag if not given
+    :type cube: CountCube
     :returns: b-value, sigma_b, a-value, sigma_a
     :rtype: float
     """
 
+    if cube is None:
+        cube = CountCube(year, mag)
+    nyears, nmagnitudes = cube.shape
+
     ival = 0
     mag_eq_tolerance = 1E-5
     while ival < np.shape(ctime)[0]:
@@ -203,17 +235,20 @@ def b_maxlike_time(year, mag, ctime, cmag, dmag, ref_mag=0.0):
         # greater than or equal to the corresponding completeness magnitude.
         # m_c - mag_eq_tolerance is required to correct floating point
         # differences.
-        id1 = np.logical_and(year >= ctime[ival],
-                    mag >= (m_c - mag_eq_tolerance))
-        nyr = np.float(np.max(year[id1]) - np.min(year[id1]) + 1)
+        year_start = cube.year_index(ctime[ival])
+        magnitude_start = cube.magnitude_index(m_c - mag_eq_tolerance)
+        nsel = cube.count(year_start, nyears, magnitude_start, nmagnitudes)
+        min_year, max_year = cube.extent(year_start, magnitude_start)[:2]
+        nyr = np.float(max_year - min_year + 1)
 
         # Get a- and b- value for the selected events
-        temp_rec_table = recurrence_table(mag[id1], dmag, year[id1])
+        temp_rec_table = _recurrence_table(cube, dmag, year_start,
+            magnitude_start)
         bval, sigma_b = b_max_likelihood(temp_rec_table[:, 0],
                                          temp_rec_table[:, 1], dmag, m_c)
 
-        aval = np.log10(np.float(np.sum(id1)) / nyr) + bval * m_c
-        sigma_a = np.abs(np.log10(np.float(np.sum(id1)) / nyr) +
+        aval = np.log10(np.float(nsel) / nyr) + bval * m_c
+        sigma_a = np.abs(np.log10(np.float(nsel) / nyr) +
             (bval + sigma_b) * ref_mag - aval)
 
         # Calculate reference rate
@@ -223,11 +258,11 @@ def b_maxlike_time(year, mag, ctime, cmag, dmag, ref_mag=0.0):
 
         if ival == 0:
             gr_pars = np.array([np.hstack([bval, sigma_b, rate, sigrate])])
-            neq = np.sum(id1)  # Number of events
+            neq = nsel  # Number of events
         else:
             gr_pars = np.vstack([gr_pars, np.hstack([bval, sigma_b, rate,
                                                      sigrate])])
-            neq = np.hstack([neq, np.sum(id1)])
+            neq = np.hstack([neq, nsel])
         ival = ival + np.sum(id0)
 
     # The nextapproach is to work out the average values of the G-R parameters
@@ -246,7 +281,7 @@ def b_maxlike_time(year, mag, ctime, cmag, dmag, ref_mag=0.0):
     return bval, sigma_b, aval, sigma_a
 
 
-def weichert_prep(year, fmag, ctime, cmag, d_m, d_t):
+def weichert_prep(year, fmag, ctime, cmag, d_m, d_t, cube=None):
     """
     Allows to prepare table input for Weichert algorithm
 
@@ -262,6 +297,9 @@ def weichert_prep(year, fmag, ctime, cmag, d_m, d_t):
     :type d_m: positive float
     :param d_t: time bin size (from config file)
     :type d_t: float
+    :keyword cube: counts of the events by year and magnitude,
+                   built from year and fmag if not given
+    :type cube: CountCube
     :returns: central magnitude, tper length of observation period,
               n_obs number of events in magnitude increment
     """
@@ -271,39 +309,51 @@ def weichert_prep(year, fmag, ctime, cmag, d_m, d_t):
         raise Exception(
         'Completeness time and magnitude intervals not compatible')
 
-    # Use 2d histogram to get overall density.
-    time_int = np.arange(np.min(year), np.max(year) + 1.5 * d_t, d_t)
-    fmag = np.around(fmag, decimals=1)
-    mag_int = np.arange(np.min(fmag), np.max(fmag) + 1.5 * d_m, d_m)
-    fullcount1 = np.histogram2d(year, fmag,
-                                bins=[time_int, mag_int])[0]
-    # Now remove events below the completeness intervals
-    n_y = np.shape(fullcount1)[1]
+    if cube is None:
+        cube = CountCube(year, fmag)
+    max_year = cube.years[-1]
+
+    # Time and magnitude bins of a 2d histogram, with
+    # magnitudes rounded off to 1 d.p.
+    rounding = lambda fmag: np.around(fmag, decimals=1)
+    time_int = np.arange(cube.years[0], max_year + 1.5 * d_t, d_t)
+    mag_int = np.arange(rounding(cube.magnitudes[0]),
+        rounding(cube.magnitudes[-1]) + 1.5 * d_m, d_m)
     cent_mag = (mag_int[:-1] + mag_int[1:]) / 2.
-    n_int = np.shape(ctime)[0]
-    i = 0
+    n_x = np.shape(time_int)[0] - 1
+    n_y = np.shape(mag_int)[0] - 1
+
+    # The last bins include their upper edge
+    time_edges = np.append(cube.year_index(time_int[:-1]),
+        cube.year_index(time_int[-1], 'right'))
+    mag_edges = np.append(
+        cube.magnitude_index(mag_int[:-1], rounding=rounding),
+        cube.magnitude_index(mag_int[-1], 'right', rounding))
+
+    # Events below the completeness intervals are removed: every
+    # interval removes the time bins before its year from the
+    # magnitude bins below its magnitude
+    removed_bins = np.zeros(n_y, dtype=int)
+    for year_bins, mag_bins in zip(
+            np.minimum(np.searchsorted(time_int, ctime, 'left'), n_x),
+            np.minimum(np.searchsorted(mag_int, cmag, 'left'), n_y)):
+        removed_bins[:mag_bins] = np.maximum(removed_bins[:mag_bins],
+            year_bins)
+
+    # Count number of events in each magnitude bin
+    n_obs = cube.count(time_edges[removed_bins], time_edges[-1],
+        mag_edges[:-1], mag_edges[1:]).astype(float)
 
-    while i < n_int:
-        idx = np.nonzero(time_int < ctime[i])[0]
-        idy = np.nonzero(mag_int < cmag[i])[0]
-        if np.logical_or(np.shape(idx)[0] == 0, np.shape(idy)[0] == 0):
-            i += 1
-        else:
-            fullcount1[:idx[-1] + 1, :idy[-1] + 1] = 0
-            i += 1
-    n_obs = np.zeros(n_y)
     t_per = np.zeros(n_y)
     i = 0
     while i < n_y:
-        # Count number of events in each magnitude bin
-        n_obs[i] = np.sum(fullcount1[:, i])
         # corresponding year of completeness
         dummy1 = np.nonzero((cmag - mag_int[i]) < 1.E-3)[0]
 
         if np.shape(dummy1)[0] == 0:
-            t_per[i] = np.max(year) - ctime[-1] + 1
+            t_per[i] = max_year - ctime[-1] + 1
         else:
-            t_per[i] = np.max(year) - ctime[dummy1[-1]] + 1
+            t_per[i] = max_year - ctime[dummy1[-1]] + 1
         i += 1
 
     LOGGER.debug("Weichert preparation:")
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide functions
+which smooth the seismicity on a longitude and
+latitude grid. Implemented kernels are:
+
+* Gaussian, with a fixed bandwidth
+* Adaptive, a gaussian whose bandwidth is the distance
+  of every event from its n-th nearest neighbour
+"""
+
+import math
+import logging
+
+import numpy as np
+from scipy.fftpack import next_fast_len
+from scipy.spatial import cKDTree
+
+from mtoolkit.scientific.catalogue_utilities import EARTH_RADIUS
+
+LOGGER = logging.getLogger('mt_logger')
+
+GAUSSIAN_KERNEL = 'Gaussian'
+ADAPTIVE_KERNEL = 'Adaptive'
+
+DEFAULT_NEIGHBOURS = 2
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS / 180.
+
+# Grids are extended beyond the events by this
+# number of standard deviations of the kernel
+PADDING_SIGMAS = 4.
+
+# Rows closer to the poles are smoothed along the
+# longitude as if they were at this cosine
+MIN_COS_LATITUDE = 1e-3
+
+# Events of the adaptive kernel are smoothed in classes
+# of bandwidths, the bandwidth of an event is rounded to
+# the closest power of this ratio times the minimum one
+BANDWIDTH_CLASS_RATIO = 2 ** 0.5
+
+# Cells smoothed by a FFT at a time
+FFT_BLOCK_SIZE = 1 << 22
+
+# Smoothed values below this fraction of the largest
+# one are rounding errors of the FFT
+FFT_TOLERANCE = 1e-12
+
+
+def smoothed_seismicity(longitude, latitude, region, cell_size, bandwidth,
+                        kernel=GAUSSIAN_KERNEL, neighbours=DEFAULT_NEIGHBOURS,
+                        vertices=None):
+    """
+    Smooth the events on a grid of cells, the gaussian
+    kernel of every event is separated in a smoothing
+    along the latitude and one along the longitude, whose
+    width in cells grows with the latitude, both applied
+    by FFT. Events outside the region contribute to the
+    cells of the region within the kernel reach, a grid
+    covering all the longitudes wraps at the dateline.
+
+    :param longitude: longitude of the events in degrees
+    :type longitude: numpy.ndarray
+    :param latitude: latitude of the events in degrees
+    :type latitude: numpy.ndarray
+    :param region: (min_lon, min_lat, max_lon, max_lat), extended
+        to the closest multiples of the cell size
+    :type region: tuple
+    :param cell_size: side of the cells in degrees
+    :type cell_size: float
+    :param bandwidth: standard deviation of the gaussian kernel in
+        km, the minimum one for the adaptive kernel
+    :type bandwidth: float
+    :keyword kernel: Gaussian or Adaptive
+    :type kernel: string
+    :keyword neighbours: number of the nearest neighbour giving the
+        bandwidth of the adaptive kernel
+    :type neighbours: int
+    :keyword vertices: polygon (n, 2) of longitude and latitude,
+        cells whose centre is outside it are zeroed
+    :type vertices: numpy.ndarray
+    :returns: longitudes and latitudes of the cell centres and the
+        smoothed number of events of every cell (a row for every
+        latitude)
+    :rtype: tuple of numpy.ndarray
+    """
+
+    longitude = np.asarray(longitude, dtype=float)
+    latitude = np.asarray(latitude, dtype=float)
+    if not cell_size > 0 or not bandwidth > 0:
+        raise RuntimeError('Smoothing requires positive cell size and '
+            'bandwidth, found %s and %s' % (cell_size, bandwidth))
+
+    if kernel == GAUSSIAN_KERNEL:
+        bandwidths = np.repeat(float(bandwidth), len(longitude))
+    elif kernel == ADAPTIVE_KERNEL:
+        bandwidths = np.maximum(adaptive_bandwidths(longitude, latitude,
+            neighbours), bandwidth)
+    else:
+        raise RuntimeError('Invalid smoothing kernel: %s, expected %s or %s'
+            % (kernel, GAUSSIAN_KERNEL, ADAPTIVE_KERNEL))
+
+    grid = _Grid(region, cell_size)
+    counts = np.zeros((grid.nrows, grid.ncols))
+
+    classes = np.round(np.log(bandwidths / bandwidth) /
+                       np.log(BANDWIDTH_CLASS_RATIO)).astype(int)
+    for bandwidth_class in np.unique(classes):
+        selected = classes == bandwidth_class
+        grid.smooth(counts, longitude[selected], latitude[selected],
+            bandwidth * BANDWIDTH_CLASS_RATIO ** bandwidth_class)
+    LOGGER.debug("* Smoothed %d events on %d x %d cells, bandwidth "
+        "classes: %d" % (len(longitude), grid.nrows, grid.ncols,
+                         len(np.unique(classes))))
+
+    counts[counts < FFT_TOLERANCE * counts.max()] = 0.
+    if vertices is not None:
+        cell_longitude, cell_latitude = np.meshgrid(grid.longitude,
+                                                    grid.latitude)
+        counts[~inside_polygon(cell_longitude, cell_latitude,
+                               vertices)] = 0.
+
+    return grid.longitude, grid.latitude, counts
+
+
+def adaptive_bandwidths(longitude, latitude, neighbours=DEFAULT_NEIGHBOURS):
+    """
+    Return the distance in km of every event from its
+    n-th nearest neighbour, looked up in a KD-tree of
+    earth centred coordinates.
+
+    :param longitude: longitude of the events in degrees
+    :type longitude: numpy.ndarray
+    :param latitude: latitude of the events in degrees
+    :type latitude: numpy.ndarray
+    :keyword neighbours: number of the nearest neighbour
+    :type neighbours: int
+    :rtype: numpy.ndarray
+    """
+
+    if len(longitude) <= neighbours:
+        # Too few events: the kernel covers the whole earth
+        return np.repeat(math.pi * EARTH_RADIUS, len(longitude))
+
+    longitude, latitude = np.radians(longitude), np.radians(latitude)
+    coordinates = np.column_stack([np.cos(latitude) * np.cos(longitude),
+        np.cos(latitude) * np.sin(longitude), np.sin(latitude)])
+    chords = cKDTree(coordinates).query(coordinates, neighbours + 1)[0]
+    return 2. * EARTH_RADIUS * np.arcsin(np.minimum(chords[:, -1] / 2., 1.))
+
+
+def inside_polygon(longitude, latitude, vertices):
+    """
+    Return True for the locations inside the polygon,
+    by the even-odd rule on the polygon edges.
+
+    :param longitude: longitude of the locations
+    :type longitude: numpy.ndarray
+    :param latitude: latitude of the locations
+    :type latitude: numpy.ndarray
+    :param vertices: polygon (n, 2) of longitude and latitude
+    :type vertices: numpy.ndarray
+    :rtype: numpy.ndarray of bool
+    """
+
+    inside = np.zeros(np.shape(longitude), dtype=bool)
+    vertices = np.asarray(vertices, dtype=float)
+    for (lon1, lat1), (lon2, lat2) in zip(vertices,
+                                          np.roll(vertices, -1, axis=0)):
+        if lat1 == lat2:
+            continue
+        crossing = (latitude >= min(lat1, lat2)) & \
+            (latitude < max(lat1, lat2))
+        crossing &= longitude < lon1 + (latitude - lat1) * \
+            (lon2 - lon1) / (lat2 - lat1)
+        inside ^= crossing
+    return inside
+
+
+class _Grid(object):
+    """
+    Grid of cells aligned to the multiples of the cell
+    size, with rows from south to north and columns
+    from west to east
+    """
+
+    def __init__(self, region, cell_size):
+        min_lon, min_lat, max_lon, max_lat = region
+        # Rounding of the region must not add a cell
+        margin = 1e-9
+        self.cell_size = cell_size
+        self.min_lon = math.floor(min_lon / cell_size + margin) * cell_size
+        self.min_lat = math.floor(min_lat / cell_size + margin) * cell_size
+        self.ncols = max(1, int(math.ceil(max_lon / cell_size - margin) -
+                                round(self.min_lon / cell_size)))
+        self.nrows = max(1, int(math.ceil(max_lat / cell_size - margin) -
+                                round(self.min_lat / cell_size)))
+        self.periodic = self.ncols * cell_size >= 360. - margin
+        if self.periodic:
+            # Columns must wrap exactly at the dateline
+            self.ncols = int(round(360. / cell_size))
+            if abs(self.ncols * cell_size - 360.) > margin * 360.:
+                raise RuntimeError('A grid covering every longitude '
+                    'requires a cell size dividing 360, found %s' %
+                    cell_size)
+
+        self.longitude = self.min_lon + (np.arange(self.ncols) + 0.5) * \
+            cell_size
+        self.latitude = self.min_lat + (np.arange(self.nrows) + 0.5) * \
+            cell_size
+
+    def smooth(self, counts, longitude, latitude, bandwidth):
+        """
+        Add to counts the events smoothed by a gaussian,
+        in the window of cells within the reach of the
+        kernel of the events
+        """
+
+        sigma_rows = bandwidth / (KM_PER_DEGREE * self.cell_size)
+        pad_rows = int(math.ceil(PADDING_SIGMAS * sigma_rows))
+        rows = np.floor((latitude - self.min_lat) /
+                        self.cell_size).astype(int)
+        columns = np.floor((longitude - self.min_lon) /
+                           self.cell_size).astype(int)
+        selected = (rows >= -pad_rows) & (rows < self.nrows + pad_rows)
+        if not np.any(selected):
+            return
+
+        first_row = max(rows[selected].min() - pad_rows, -pad_rows)
+        last_row = min(rows[selected].max() + pad_rows + 1,
+                       self.nrows + pad_rows)
+        window_latitude = self.min_lat + (np.arange(first_row, last_row) +
+                                          0.5) * self.cell_size
+        # Width in cells of the kernel along the longitude
+        sigma_columns = sigma_rows / np.maximum(
+            np.abs(np.cos(np.radians(window_latitude))), MIN_COS_LATITUDE)
+
+        if self.periodic:
+            columns %= self.ncols
+            first_column, last_column = 0, self.ncols
+        else:
+            pad_columns = int(math.ceil(min(PADDING_SIGMAS *
+                np.max(sigma_columns), self.ncols)))
+            selected &= (columns >= -pad_columns) & \
+                (columns < self.ncols + pad_columns)
+            if not np.any(selected):
+                return
+            first_column = max(columns[selected].min() - pad_columns,
+                               -pad_columns)
+            last_column = min(columns[selected].max() + pad_columns + 1,
+                              self.ncols + pad_columns)
+
+        shape = (last_row - first_row, last_column - first_column)
+        window = np.bincount(np.ravel_multi_index((rows[selected] -
+            first_row, columns[selected] - first_column), shape),
+            minlength=shape[0] * shape[1]).reshape(shape).astype(float)
+
+        window = _gaussian_filter(window, np.repeat(sigma_rows, shape[1]),
+            axis=0)
+        window = _gaussian_filter(window, sigma_columns, axis=1,
+            periodic=self.periodic)
+
+        # Cells of the window inside the grid
+        row_slice = slice(max(first_row, 0), min(last_row, self.nrows))
+        column_slice = slice(max(first_column, 0),
+                             min(last_column, self.ncols))
+        counts[row_slice, column_slice] += window[
+            row_slice.start - first_row:row_slice.stop - first_row,
+            column_slice.start - first_column:
+            column_slice.stop - first_column]
+
+
+def _gaussian_filter(values, sigmas, axis, periodic=False):
+    """
+    Return the values convolved along an axis with discrete
+    gaussians, one standard deviation (in cells) for every line
+    along the axis. The convolution is circular, the values are expected
+    to be padded unless periodic: the FFT length is then the
+    length of the axis, so that the values wrap exactly.
+    """
+
+    length = values.shape[axis]
+    size = length if periodic else next_fast_len(length)
+    # Transfer function of the discrete gaussian kernel, positive
+    # and conserving the values for every standard deviation,
+    # even narrower than a cell
+    cosines = np.cos(2. * math.pi * np.fft.rfftfreq(size)) - 1.
+    other_axis = 1 - axis
+    block = max(1, FFT_BLOCK_SIZE // size)
+
+    result = np.empty_like(values)
+    for start in xrange(0, values.shape[other_axis], block):
+        lines = slice(start, start + block)
+        if axis == 0:
+            transfer = np.exp(np.outer(cosines, sigmas[lines] ** 2))
+            result[:, lines] = np.fft.irfft(transfer * np.fft.rfft(
+                values[:, lines], size, axis=0), size, axis=0)[:length]
+        else:
+            transfer = np.exp(np.outer(sigmas[lines] ** 2, cosines))
+            result[lines] = np.fft.irfft(transfer * np.fft.rfft(
+                values[lines], size, axis=1), size, axis=1)[:, :length]
+    return result
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+The purpose of this module is to provide objects
+to share a catalogue with worker processes without
+copying it: arrays are stored in a segment of memory
+mapped files (in /dev/shm when available), that workers
+attach to by name and read as numpy views.
+"""
+
+import os
+import json
+import errno
+import atexit
+import shutil
+import logging
+import tempfile
+
+import numpy as np
+
+from mtoolkit.scientific.catalogue_utilities import catalogue_features
+
+LOGGER = logging.getLogger('mt_logger')
+
+SEGMENT_PREFIX = 'mtoolkit-shm-'
+MANIFEST_FILENAME = 'manifest.json'
+CATALOG_MATRIX = 'catalog_matrix'
+
+# Features of the catalogue computed once by the
+# owner and shared with the attached processes
+SHARED_FEATURES = ['year_dec', 'magnitude_order']
+
+# Shared memory filesystem, tempfile dir when missing
+SHM_DIR = '/dev/shm'
+
+# Segments created by this process, removed at exit
+_OWNED = {}
+
+
+def segments_dir():
+    """Return the directory where segments are created"""
+
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return SHM_DIR
+    return tempfile.gettempdir()
+
+
+class SharedCatalogue(object):
+    """
+    SharedCatalogue stores a catalogue matrix, its shared
+    features and other named arrays in a segment. The
+    process creating the segment owns it and removes it
+    when closed, at exit or, if it crashes, when a later
+    segment is created. Arrays of an attached segment are
+    read only views of the files.
+    """
+
+    def __init__(self, name, owner=False):
+        """
+        Attach to an existing segment, use create
+        to create a new one.
+        :param name: name of the segment (its path)
+        :type name: string
+        :keyword owner: the segment is removed when closed
+        :type owner: bool
+        """
+
+        with open(os.path.join(name, MANIFEST_FILENAME)) as manifest:
+            self._files = json.load(manifest)['arrays']
+
+        self.name = name
+        self.owner = owner
+        self.closed = False
+        self.arrays = dict(
+            (array_name, np.load(os.path.join(name, filename),
+                                 mmap_mode='r'))
+            for array_name, filename in self._files.items())
+
+    @classmethod
+    def create(cls, catalog_matrix, arrays=None, directory=None):
+        """
+        Return a new segment holding the catalogue
+        :param catalog_matrix: catalogue in matrix format
+        :type catalog_matrix: numpy.ndarray
+        :keyword arrays: other arrays to be shared
+        :type arrays: dict of names and numpy.ndarray
+        :keyword directory: where the segment is created,
+            see segments_dir if None
+        :rtype: SharedCatalogue
+        """
+
+        directory = directory or segments_dir()
+        remove_stale_segments(directory)
+
+        features = catalogue_features(catalog_matrix)
+        shared = dict(arrays or {})
+        shared[CATALOG_MATRIX] = catalog_matrix
+        for feature in SHARED_FEATURES:
+            shared[feature] = getattr(features, feature)
+
+        name = tempfile.mkdtemp(prefix='%s%d-' % (SEGMENT_PREFIX,
+            os.getpid()), dir=directory)
+        _OWNED[name] = os.getpid()
+        try:
+            files = {}
+            for number, (array_name, array) in enumerate(shared.items()):
+                files[array_name] = '%d.npy' % number
+                np.save(os.path.join(name, files[array_name]), array)
+            with open(os.path.join(name, MANIFEST_FILENAME), 'w') as manifest:
+                json.dump({'arrays': files}, manifest)
+        except:
+            _remove(name)
+            raise
+
+        return cls(name, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Return the segment with the given name
+        :param name: name of the segment
+        :type name: string
+        :rtype: SharedCatalogue
+        """
+
+        return cls(name)
+
+    @property
+    def catalog_matrix(self):
+        """
+        Catalogue matrix of the segment, its features
+        are the ones computed by the owner
+        """
+
+        catalog_matrix = self.arrays[CATALOG_MATRIX]
+        features = catalogue_features(catalog_matrix)
+        for feature in SHARED_FEATURES:
+            features.memoize(feature,
+                lambda feature=feature: self.arrays[feature])
+        return catalog_matrix
+
+    def __getitem__(self, array_name):
+        return self.arrays[array_name]
+
+    def close(self):
+        """
+        Release the arrays, the owner removes the segment.
+        Views of the arrays remain valid while referenced.
+        """
+
+        if self.closed:
+            return
+        self.closed = True
+        self.arrays = {}
+        if self.owner:
+            _remove(self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def owned_segments():
+    """
+    Return the names of the segments created by
+    this process (and not by a parent process)
+    and not removed yet
+    :rtype: set of strings
+    """
+
+    return set(name for name, pid in _OWNED.items() if pid == os.getpid())
+
+
+def close_segments(names=None):
+    """
+    Remove the segments created by this
+    process (and not by a parent process)
+    :keyword names: remove only these segments, all if None
+    :type names: iterable of strings
+    """
+
+    owned = owned_segments()
+    for name in owned if names is None else owned.intersection(names):
+        _remove(name)
+
+
+atexit.register(close_segments)
+
+
+def remove_stale_segments(directory):
+    """
+    Remove the segments left in a directory by
+    processes which are not running any more
+    :param directory: directory of the segments
+    :type directory: string
+    """
+
+    for filename in os.listdir(directory):
+        if not filename.startswith(SEGMENT_PREFIX):
+            continue
+        try:
+            pid = int(filename[len(SEGMENT_PREFIX):].split('-')[0])
+        except ValueError:
+            continue
+        if not _running(pid):
+            LOGGER.warning("Removing shared catalogue %s left by process %d"
+                % (filename, pid))
+            shutil.rmtree(os.path.join(directory, filename),
+                ignore_errors=True)
+
+
+def _running(pid):
+    """Return True if a process with the given pid is running"""
+
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno != errno.ESRCH
+    return True
+
+
+def _remove(name):
+    """Remove a segment"""
+
+    _OWNED.pop(name, None)
+    shutil.rmtree(name, ignore_errors=True)
@@ -24,6 +24,8 @@ NRML data format.
 
 from collections import namedtuple
 
+import numpy as np
+
 
 POINT = namedtuple('Point', 'lon, lat')
 
@@ -41,12 +43,30 @@ MAGNITUDE = namedtuple('Magnitude', 'type_mag, values')
 RUPTURE_DEPTH_DISTRIB = namedtuple(
     'RuptureDepthDistrib', 'magnitude, depth')
 
+EVENLY_DISCRETIZED_MFD = namedtuple(
+    'EvenlyDiscretizedIncrementalMFD', 'bin_size, min_val, values, type_mfd')
+
+SIMPLE_FAULT_GEOMETRY = namedtuple(
+    'SimpleFaultGeometry',
+    'geometry_id, srs_name, fault_trace, dip, upper_seismogenic_depth, '
+    'lower_seismogenic_depth')
+
 
 class AreaSource(object):
     """
     AreaSource value object
+
+    Polygon vertices are stored in a (n, 2) float array, the
+    area_boundary attribute still provides them as a list
+    of Point named tuples.
     """
 
+    __slots__ = ('nrml_id source_model_id area_source_id name '
+                 'tectonic_region rupture_rate_model rupture_depth_dist '
+                 'hypocentral_depth recurrence_sigb recurrence_siga_m '
+                 'max_mag_sigma _srs_name _vertices _polygon '
+                 '_prepared_polygon _bounding_box').split()
+
     def __init__(self):
         self.nrml_id = None
         self.source_model_id = None
@@ -57,6 +77,114 @@ class AreaSource(object):
         self.rupture_rate_model = None
         self.rupture_depth_dist = None
         self.hypocentral_depth = None
+        self.recurrence_sigb = None
+        self.recurrence_siga_m = None
+        self.max_mag_sigma = None
+
+    @property
+    def area_boundary(self):
+        """
+        Area boundary named tuple, built
+        from the stored vertices
+        """
+
+        if self._vertices is None:
+            return None
+        return AREA_BOUNDARY(self._srs_name,
+            [POINT(lon, lat) for lon, lat in self._vertices.tolist()])
+
+    @area_boundary.setter
+    def area_boundary(self, area_boundary):
+        """
+        Store the area boundary, pos_list could
+        be a sequence of points or a (n, 2) array
+        """
+
+        self._polygon = None
+        self._prepared_polygon = None
+        self._bounding_box = None
+        if area_boundary is None:
+            self._srs_name = None
+            self._vertices = None
+        else:
+            self._srs_name = area_boundary.srs_name
+            self._vertices = np.asarray(area_boundary.pos_list,
+                dtype=np.float64).reshape((-1, 2))
+
+    @property
+    def vertices(self):
+        """Polygon vertices as a (n, 2) array of lon, lat"""
+
+        return self._vertices
+
+    @property
+    def bounding_box(self):
+        """
+        Polygon bounding box as a tuple
+        (min_lon, min_lat, max_lon, max_lat)
+        """
+
+        if self._bounding_box is None:
+            min_lon, min_lat = self._vertices.min(axis=0)
+            max_lon, max_lat = self._vertices.max(axis=0)
+            self._bounding_box = (min_lon, min_lat, max_lon, max_lat)
+        return self._bounding_box
+
+    @property
+    def polygon(self):
+        """Shapely polygon built from the vertices"""
+
+        if self._polygon is None:
+            from shapely.geometry import Polygon
+            self._polygon = Polygon(self._vertices)
+        return self._polygon
+
+    @property
+    def prepared_polygon(self):
+        """
+        Prepared shapely polygon, which speeds
+        up repeated containment tests
+        """
+
+        if self._prepared_polygon is None:
+            from shapely.prepared import prep
+            self._prepared_polygon = prep(self.polygon)
+        return self._prepared_polygon
+
+    def __getstate__(self):
+        # Named tuples defined in this module can't be pickled
+        # (their class name differs from the module attribute),
+        # geometry caches are rebuilt on demand
+        rrm = self.rupture_rate_model
+        if rrm is not None:
+            rrm = (tuple(rrm.truncated_gutenberg_richter), ) + \
+                tuple(rrm[1:])
+        rdd = self.rupture_depth_dist
+        if rdd is not None:
+            rdd = (tuple(rdd.magnitude), rdd.depth)
+
+        return (self.nrml_id, self.source_model_id, self.area_source_id,
+            self.name, self.tectonic_region, self._srs_name, self._vertices,
+            rrm, rdd, self.hypocentral_depth, self.recurrence_sigb,
+            self.recurrence_siga_m, self.max_mag_sigma)
+
+    def __setstate__(self, state):
+        (self.nrml_id, self.source_model_id, self.area_source_id,
+            self.name, self.tectonic_region, self._srs_name, self._vertices,
+            rrm, rdd, self.hypocentral_depth, self.recurrence_sigb,
+            self.recurrence_siga_m, self.max_mag_sigma) = state
+
+        self._polygon = None
+        self._prepared_polygon = None
+        self._bounding_box = None
+        self.rupture_rate_model = None
+        if rrm is not None:
+            self.rupture_rate_model = RUPTURE_RATE_MODEL(
+                TRUNCATED_GUTEN_RICHTER(*rrm[0]), *rrm[1:])
+        self.rupture_depth_dist = None
+        if rdd is not None:
+            self.rupture_depth_dist = RUPTURE_DEPTH_DISTRIB(
+                MAGNITUDE(*rdd[0]), rdd[1])
 
     def __str__(self):
 
@@ -80,7 +208,7 @@ class AreaSource(object):
                 and self.area_source_id == oth.area_source_id
                 and self.name == oth.name
                 and self.tectonic_region == oth.tectonic_region
-                and self.area_boundary == oth.area_boundary
+                and self._same_boundary(oth)
                 and self.rupture_rate_model == oth.rupture_rate_model
                 and self.rupture_depth_dist == oth.rupture_depth_dist
                 and self.hypocentral_depth == oth.hypocentral_depth)
@@ -88,6 +216,109 @@ class AreaSource(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def _same_boundary(self, oth):
+        """
+        Compare area boundaries without
+        building the named tuples
+        """
+
+        if self._vertices is None or oth._vertices is None:
+            return self._vertices is None and oth._vertices is None
+        return (self._srs_name == oth._srs_name
+                and np.array_equal(self._vertices, oth._vertices))
+
+
+class PointSource(object):
+    """
+    PointSource value object
+    """
+
+    __slots__ = ('nrml_id source_model_id point_source_id name '
+                 'tectonic_region srs_name location rupture_rate_model '
+                 'rupture_depth_dist hypocentral_depth').split()
+
+    def __init__(self):
+        self.nrml_id = None
+        self.source_model_id = None
+        self.point_source_id = None
+        self.name = None
+        self.tectonic_region = None
+        self.srs_name = None
+        self.location = None
+        self.rupture_rate_model = None
+        self.rupture_depth_dist = None
+        self.hypocentral_depth = None
+
+    def __str__(self):
+
+        point_source = ['Point Source Object',
+                    'nrml id: %s' % (self.nrml_id),
+                    'source model id: %s' % (self.source_model_id),
+                    'point source id: %s' % (self.point_source_id),
+                    'name: %s' % (self.name),
+                    'tectonic region: %s' % (self.tectonic_region),
+                    'location: %s %s' % (self.srs_name, self.location),
+                    '%s' % self.rupture_rate_model.__str__(),
+                    '%s' % self.rupture_depth_dist.__str__(),
+                    'hypocentral depth: %s' % self.hypocentral_depth]
+
+        return  '\n'.join(point_source)
+
+    def __eq__(self, oth):
+
+        return  (isinstance(oth, PointSource)
+                and all(getattr(self, name) == getattr(oth, name)
+                        for name in self.__slots__))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class SimpleFaultSource(object):
+    """
+    SimpleFaultSource value object
+
+    The fault trace is stored as a tuple
+    of coordinate tuples (lon, lat[, depth]).
+    """
+
+    __slots__ = ('nrml_id source_model_id simple_fault_source_id name '
+                 'tectonic_region rake mfd geometry').split()
+
+    def __init__(self):
+        self.nrml_id = None
+        self.source_model_id = None
+        self.simple_fault_source_id = None
+        self.name = None
+        self.tectonic_region = None
+        self.rake = None
+        self.mfd = None
+        self.geometry = None
+
+    def __str__(self):
+
+        simple_fault_source = ['Simple Fault Source Object',
+                    'nrml id: %s' % (self.nrml_id),
+                    'source model id: %s' % (self.source_model_id),
+                    'simple fault source id: %s' %
+                        (self.simple_fault_source_id),
+                    'name: %s' % (self.name),
+                    'tectonic region: %s' % (self.tectonic_region),
+                    'rake: %s' % (self.rake),
+                    '%s' % self.mfd.__str__(),
+                    '%s' % self.geometry.__str__()]
+
+        return  '\n'.join(simple_fault_source)
+
+    def __eq__(self, oth):
+
+        return  (isinstance(oth, SimpleFaultSource)
+                and all(getattr(self, name) == getattr(oth, name)
+                        for name in self.__slots__))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
 
 def default_area_source():
     """Create a default area source object"""
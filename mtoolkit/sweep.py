@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide a parameter
+sweep of the preprocessing jobs: the catalogue is read
+once and every combination of the declustering and
+completeness parameters declared in the sweep section
+of the config is evaluated, in parallel, writing a
+single table of results.
+"""
+
+import csv
+import logging
+import itertools
+from multiprocessing import Pool
+
+import numpy as np
+
+from mtoolkit.jobs import (read_eq_catalog, homogenisation, deduplication,
+                           create_catalog_matrix, HOMOGENISATION_KEY,
+                           DEDUPLICATION_KEY,
+                           CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX,
+                           CATALOG_MATRIX_MW_INDEX)
+from mtoolkit.scientific.declustering import (sort_by_magnitude,
+                                              gardner_knopoff_sorted,
+                                              afteran_decluster)
+from mtoolkit.scientific.completeness import stepp_counts, stepp_table
+from mtoolkit.scientific.catalogue_utilities import (catalogue_features,
+                                                     CountCube)
+from mtoolkit.shared_catalogue import SharedCatalogue
+
+LOGGER = logging.getLogger('mt_logger')
+
+SWEEP_KEY = 'sweep'
+DECLUSTERING_JOBS = ['GardnerKnopoff', 'Afteran']
+STEPP_JOB = 'Stepp'
+
+# Stepp parameters which determine the counts of
+# events in windows, shared by the other parameters
+STEPP_COUNTS_PARAMS = ['magnitude_windows', 'time_window']
+
+RESULT_FIELDS = ['events', 'mainshocks', 'clusters', 'completeness_year',
+                 'completeness_magnitude']
+
+# Data used by the tasks, worker processes attach
+# to a SharedCatalogue to fill it
+_SHARED = {}
+
+# Name of the arrays of sorted catalogues in the
+# SharedCatalogue, by window method and key
+SORTED_PREFIX = 'sorted/'
+SORTED_ARRAY = SORTED_PREFIX + '%s/%s'
+
+
+def parameter_grid(grid, defaults=None):
+    """
+    Return every combination of the parameters of a
+    grid, a list declares the values of a parameter, a
+    single value is kept fixed. Parameters not in the
+    grid take the value defined in defaults.
+    :param grid: parameters mapped to a value or a list of values
+    :type grid: dict
+    :keyword defaults: parameters values used outside the grid
+    :type defaults: dict
+    :returns: combinations without duplicates, in a stable order
+    :rtype: list of dicts
+    """
+
+    params = dict(defaults or {})
+    params.update(grid or {})
+    names = sorted(params)
+    values = [params[name] if isinstance(params[name], list)
+              else [params[name]] for name in names]
+
+    combinations = []
+    for combination in itertools.product(*values):
+        combination = dict(zip(names, combination))
+        if combination not in combinations:
+            combinations.append(combination)
+    return combinations
+
+
+def sweep_tasks(config):
+    """
+    Return the declustering combinations declared in the
+    sweep section, every combination is a tuple (job, params).
+    Jobs missing from the sweep section are not evaluated,
+    if no declustering job is declared the catalogue is
+    analysed as it is (job None).
+    :param config: config read from the config file
+    :type config: dict
+    :rtype: list of tuples
+    """
+
+    sweep = config.get(SWEEP_KEY) or {}
+
+    tasks = []
+    for job in DECLUSTERING_JOBS:
+        if job in sweep:
+            tasks.extend((job, params) for params in
+                         parameter_grid(sweep[job], config.get(job)))
+    if not tasks:
+        tasks.append((None, {}))
+    return tasks
+
+
+def stepp_grid(config):
+    """
+    Return the Stepp combinations declared in the
+    sweep section, grouped by the parameters which
+    determine the counts of events in windows.
+    :param config: config read from the config file
+    :type config: dict
+    :returns: tuples (counts params, list of params), empty
+        if the sweep section doesn't declare Stepp
+    :rtype: list of tuples
+    """
+
+    sweep = config.get(SWEEP_KEY) or {}
+    if STEPP_JOB not in sweep:
+        return []
+
+    groups = []
+    for params in parameter_grid(sweep[STEPP_JOB], config.get(STEPP_JOB)):
+        counts_params = tuple(params[name] for name in STEPP_COUNTS_PARAMS)
+        for group_params, combinations in groups:
+            if group_params == counts_params:
+                combinations.append(params)
+                break
+        else:
+            groups.append((counts_params, [params]))
+    return groups
+
+
+def run_sweep(context):
+    """
+    Run the parameter sweep declared in the config
+    of the context and write its results
+    :param context: context holding the config
+    :returns: rows of results
+    :rtype: list of dicts
+    """
+
+    sweep = context.config.get(SWEEP_KEY) or {}
+    if not sweep.get('output_file'):
+        raise RuntimeError('Sweep mode requires sweep: output_file')
+
+    read_eq_catalog(context)
+    if context.config.get(HOMOGENISATION_KEY):
+        homogenisation(context)
+    if context.config.get(DEDUPLICATION_KEY):
+        deduplication(context)
+    create_catalog_matrix(context)
+
+    tasks = sweep_tasks(context.config)
+    stepp_combinations = stepp_grid(context.config)
+    LOGGER.info("* Sweep combinations: %d declustering, %d completeness" %
+        (len(tasks), sum(len(combinations)
+                         for _, combinations in stepp_combinations)))
+
+    rows = evaluate(context.catalog_matrix, tasks, stepp_combinations,
+        sweep.get('workers'))
+    write_rows(sweep['output_file'], rows)
+
+    LOGGER.info("* Sweep results written in %s" % sweep['output_file'])
+    return rows
+
+
+def evaluate(catalog_matrix, tasks, stepp_combinations, workers=None):
+    """
+    Evaluate the declustering tasks, every declustered
+    catalogue is analysed with all the Stepp combinations.
+    The arrays of Gardner Knopoff sorted by magnitude
+    are computed once for each window method.
+    :param catalog_matrix: catalogue in matrix format
+    :type catalog_matrix: numpy.ndarray
+    :param tasks: declustering combinations (see sweep_tasks)
+    :param stepp_combinations: Stepp combinations (see stepp_grid)
+    :keyword workers: number of processes, 1 runs the tasks in
+        this process, None uses all the available cores
+    :returns: rows of results in the order of tasks
+    :rtype: list of dicts
+    """
+
+    # Features shared by the declustering of every task,
+    # computed before worker processes are forked
+    features = catalogue_features(catalog_matrix)
+    for name in ('year_dec', 'magnitude_order'):
+        getattr(features, name)
+
+    sorted_catalogs = {}
+    for job, params in tasks:
+        window_opt = params.get('time_dist_windows')
+        if job == 'GardnerKnopoff' and window_opt not in sorted_catalogs:
+            sorted_catalogs[window_opt] = sort_by_magnitude(catalog_matrix,
+                window_opt)
+
+    try:
+        if workers == 1 or len(tasks) == 1:
+            _SHARED.update(catalog_matrix=catalog_matrix,
+                           sorted_catalogs=sorted_catalogs,
+                           stepp_combinations=stepp_combinations)
+            results = [_evaluate_task(task) for task in tasks]
+        else:
+            # Workers attach to the arrays instead of copying them
+            arrays = dict((SORTED_ARRAY % (window_opt, key), array)
+                          for window_opt, sorted_catalog in
+                          sorted_catalogs.items()
+                          for key, array in sorted_catalog.items())
+            with SharedCatalogue.create(catalog_matrix, arrays) as shared:
+                pool = Pool(workers, _attach_shared,
+                            (shared.name, stepp_combinations))
+                try:
+                    results = pool.map(_evaluate_task, tasks)
+                finally:
+                    pool.close()
+                    pool.join()
+    finally:
+        _SHARED.clear()
+
+    return [row for rows in results for row in rows]
+
+
+def _attach_shared(name, stepp_combinations):
+    """
+    Attach a worker process to the shared catalogue
+    and its sorted catalogues, it's defined at module
+    level to be used as initializer of worker processes.
+    :param name: name of the SharedCatalogue
+    :param stepp_combinations: Stepp combinations (see stepp_grid)
+    """
+
+    shared = SharedCatalogue.attach(name)
+    sorted_catalogs = {}
+    for array_name, array in shared.arrays.items():
+        if array_name.startswith(SORTED_PREFIX):
+            window_opt, key = array_name[len(SORTED_PREFIX):].split('/', 1)
+            sorted_catalogs.setdefault(window_opt, {})[key] = array
+
+    _SHARED.update(catalog_matrix=shared.catalog_matrix,
+                   sorted_catalogs=sorted_catalogs,
+                   stepp_combinations=stepp_combinations)
+
+
+def _evaluate_task(task):
+    """
+    Decluster the shared catalogue and compute its
+    completeness tables, one row is returned for every
+    step of every completeness table. It's defined at
+    module level to be used by worker processes.
+    :param task: tuple (job, params)
+    """
+
+    job, params = task
+    catalog_matrix = _SHARED['catalog_matrix']
+
+    if job == 'GardnerKnopoff':
+        vcl, flag_vector = gardner_knopoff_sorted(
+            _SHARED['sorted_catalogs'][params['time_dist_windows']],
+            params['foreshock_time_window'])
+        mainshocks = catalog_matrix[np.nonzero(flag_vector == 0)[0], :]
+    elif job == 'Afteran':
+        vcl, mainshocks, _ = afteran_decluster(catalog_matrix,
+            params['time_dist_windows'], params['time_window'])
+    else:
+        vcl = np.zeros(len(catalog_matrix), dtype=int)
+        mainshocks = catalog_matrix
+
+    base = {'declustering': job or 'None',
+            'events': len(catalog_matrix),
+            'mainshocks': len(mainshocks),
+            'clusters': np.size(np.unique(vcl), 0) - 1 if job else 0}
+    base.update(('%s.%s' % (job, name), value)
+                for name, value in params.items())
+
+    rows = []
+    year = mainshocks[:, CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX]
+    mw = mainshocks[:, CATALOG_MATRIX_MW_INDEX]
+    cube = CountCube(year, mw)
+    for counts_params, combinations in _SHARED['stepp_combinations']:
+        counts = stepp_counts(year, mw, *counts_params, cube=cube)
+        for stepp_params in combinations:
+            table = stepp_table(counts, stepp_params['sensitivity'],
+                stepp_params['increment_lock'])
+            for completeness_year, completeness_magnitude in table:
+                row = dict(base)
+                row.update(('%s.%s' % (STEPP_JOB, name), value)
+                           for name, value in stepp_params.items())
+                row['completeness_year'] = completeness_year
+                row['completeness_magnitude'] = completeness_magnitude
+                rows.append(row)
+
+    if not _SHARED['stepp_combinations']:
+        rows.append(base)
+    return rows
+
+
+def write_rows(filename, rows):
+    """
+    Write the results in a csv file, one column
+    for every parameter followed by the results
+    :param filename: path of the csv file
+    :param rows: rows returned by evaluate
+    :type rows: list of dicts
+    """
+
+    params = sorted(set(name for row in rows for name in row
+                        if '.' in name))
+    fieldnames = ['declustering'] + params + RESULT_FIELDS
+
+    with open(filename, 'wb') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames)
+        writer.writerow(dict(zip(fieldnames, fieldnames)))
+        writer.writerows(rows)
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide a parallel
+Gardner Knopoff declustering giving the same result
+as the serial algorithm. The catalogue is partitioned
+in spatial tiles: events of a tile are linked, in a
+process pool, to the events inside their windows,
+found in the tile and in a halo around it as wide as
+the largest distance window. Links crossing tiles are
+then joined into groups of interacting events, and
+every group is declustered on its own in the pool.
+"""
+
+import math
+import logging
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from mtoolkit.shared_catalogue import SharedCatalogue
+from mtoolkit.scientific.catalogue_utilities import (catalogue_features,
+                                                     within_distance,
+                                                     EARTH_RADIUS)
+from mtoolkit.scientific.declustering import (TDW_GARDNERKNOPOFF,
+                                              event_windows,
+                                              sort_by_magnitude,
+                                              gardner_knopoff_clusters)
+
+LOGGER = logging.getLogger('mt_logger')
+
+# Side of the tiles in degrees
+DEFAULT_TILE_SIZE = 10.
+
+# Relative margin of the halo, so that rounding never
+# leaves out of the halo an event inside a window
+HALO_MARGIN = 1.001
+
+# Years added to the time windows, so that rounding never
+# leaves out an event inside a window
+TIME_MARGIN = 1e-9
+
+# Groups of events declustered by a task are balanced
+# on this number of tasks per worker
+TASKS_PER_WORKER = 4
+
+# Catalogue and parameters used by the tasks,
+# worker processes attach to a SharedCatalogue
+_SHARED = {}
+
+
+def gardner_knopoff_tiled(catalog_matrix, window_opt=TDW_GARDNERKNOPOFF,
+                          fs_time_prop=0, workers=None,
+                          tile_size=DEFAULT_TILE_SIZE):
+    """
+    Gardner Knopoff algorithm in a process pool, the result
+    is the one of gardner_knopoff_decluster.
+
+    :param catalog_matrix: eq catalog in a matrix format with these columns in
+                            order: `year`, `month`, `day`, `longitude`,
+                            `latitude`, `Mw`
+    :type catalog_matrix: numpy.ndarray
+    :keyword window_opt: method used in calculating distance and time windows
+    :type window_opt: string
+    :keyword fs_time_prop: foreshock time window as a proportion of
+                           aftershock time window
+    :type fs_time_prop: positive float
+    :keyword workers: number of processes, 1 runs the tasks in
+        this process, None uses all the available cores
+    :type workers: int
+    :keyword tile_size: side of the tiles in degrees
+    :type tile_size: float
+    :returns: **vcl vector** indicating cluster number, **vmain_shock catalog**
+              containing non-clustered events, **flagvector** indicating
+              which eq events belong to a cluster
+    :rtype: numpy.ndarray
+    """
+
+    features = catalogue_features(catalog_matrix)
+    neq = len(catalog_matrix)
+    halo = np.max(event_windows(features, window_opt)[0]) * HALO_MARGIN \
+        if neq else 0.
+    tiles = spatial_tiles(features.longitude, features.latitude, tile_size,
+        halo)
+    LOGGER.debug("* Declustering tiles: %d, halo: %.1f km" %
+        (len(tiles), halo))
+
+    if workers == 1:
+        _SHARED.update(catalog_matrix=catalog_matrix, window_opt=window_opt,
+                       fs_time_prop=fs_time_prop)
+        try:
+            links = [_link_tile(tile) for tile in tiles]
+            groups = _interacting_groups(neq, links)
+            results = [_decluster_groups(task)
+                       for task in _balance(groups, 1)]
+        finally:
+            _SHARED.clear()
+    else:
+        with SharedCatalogue.create(catalog_matrix) as shared:
+            pool = Pool(workers, _attach_shared,
+                        (shared.name, window_opt, fs_time_prop))
+            try:
+                links = pool.map(_link_tile, tiles)
+                groups = _interacting_groups(neq, links)
+                results = pool.map(_decluster_groups,
+                    _balance(groups, workers or cpu_count()))
+            finally:
+                pool.close()
+                pool.join()
+
+    vcl, flagvector = _merge(features, results)
+    vmain_shock = catalog_matrix[np.nonzero(flagvector == 0)[0], :]
+
+    return vcl, vmain_shock, flagvector
+
+
+def spatial_tiles(longitude, latitude, tile_size, halo):
+    """
+    Return the events of every tile of a longitude and
+    latitude grid, with the events of its halo: all the
+    events within the halo distance from the tile.
+
+    :param longitude: longitude of the events in degrees
+    :type longitude: numpy.ndarray
+    :param latitude: latitude of the events in degrees
+    :type latitude: numpy.ndarray
+    :param tile_size: side of the tiles in degrees
+    :type tile_size: float
+    :param halo: width of the halo in km
+    :type halo: float
+    :returns: tuples (indexes of the events of the tile, indexes
+        of the events of the tile and of its halo), in catalogue order
+    :rtype: list of tuples
+    """
+
+    rows = np.floor((latitude + 90.) / tile_size).astype(int)
+    columns = np.floor((longitude + 180.) / tile_size).astype(int)
+    keys = rows * (int(math.ceil(360. / tile_size)) + 1) + columns
+
+    angle = halo / EARTH_RADIUS
+    halo_lat = math.degrees(angle)
+
+    tiles = []
+    for key in np.unique(keys):
+        core = np.nonzero(keys == key)[0]
+        row, column = rows[core[0]], columns[core[0]]
+        south = row * tile_size - 90. - halo_lat
+        north = (row + 1) * tile_size - 90. + halo_lat
+        selected = np.logical_and(latitude >= south, latitude <= north)
+
+        # Longitudes of a circle not including a pole are within
+        # asin(sin(radius) / cos(latitude)) from its centre
+        if south > -90. and north < 90.:
+            max_lat = math.radians(max(abs(south), abs(north)))
+            spread = math.sin(angle) / math.cos(max_lat)
+            if spread < 1.:
+                halo_lon = math.degrees(math.asin(spread)) * HALO_MARGIN
+                west = column * tile_size - 180. - halo_lon
+                width = tile_size + 2 * halo_lon
+                if width < 360.:
+                    selected &= np.mod(longitude - west, 360.) <= width
+        tiles.append((core, np.nonzero(selected)[0]))
+    return tiles
+
+
+def _attach_shared(name, window_opt, fs_time_prop):
+    """
+    Attach a worker process to the shared catalogue, it's
+    defined at module level to be used as initializer of
+    worker processes.
+    """
+
+    _SHARED.update(catalog_matrix=SharedCatalogue.attach(name).catalog_matrix,
+                   window_opt=window_opt, fs_time_prop=fs_time_prop)
+
+
+def _link_tile(tile):
+    """
+    Link every event of a tile to the events inside its
+    windows, it's defined at module level to be used by
+    worker processes.
+    :param tile: tuple (events of the tile, events of the
+        tile and of its halo)
+    :returns: events of the tile and of its halo with the
+        smallest event they are linked to
+    :rtype: tuple of numpy.ndarray
+    """
+
+    core, events = tile
+    features = catalogue_features(_SHARED['catalog_matrix'])
+    sw_space, sw_time = event_windows(features, _SHARED['window_opt'])
+    fs_time_prop = _SHARED['fs_time_prop']
+
+    time_order = np.argsort(features.year_dec[events], kind='mergesort')
+    by_time = events[time_order]
+    year_dec = features.year_dec[by_time]
+    longitude = features.longitude_rad[by_time]
+    latitude = features.latitude_rad[by_time]
+    cos_latitude = features.cos_latitude[by_time]
+
+    # Links are joined in positions of by_time
+    parent = np.arange(len(by_time))
+    positions = np.empty(len(by_time), dtype=int)
+    positions[time_order] = np.arange(len(by_time))
+    positions = positions[np.searchsorted(events, core)]
+    for i, event in zip(positions.tolist(), core.tolist()):
+        # Events of gardner_knopoff_sorted time window, the
+        # bounds are widened by TIME_MARGIN against rounding
+        lower = np.searchsorted(year_dec, year_dec[i] -
+            sw_time[event] * fs_time_prop - TIME_MARGIN, 'left')
+        upper = np.searchsorted(year_dec, year_dec[i] + sw_time[event] +
+            TIME_MARGIN, 'right')
+        inside = lower + np.nonzero(within_distance(longitude[lower:upper],
+            latitude[lower:upper], cos_latitude[lower:upper], longitude[i],
+            latitude[i], cos_latitude[i], sw_space[event]))[0]
+        if len(inside) > 1:
+            union(parent, np.repeat(i, len(inside)), inside)
+
+    return by_time, by_time[find(parent, np.arange(len(by_time)))]
+
+
+def _interacting_groups(neq, links):
+    """
+    Return the groups of events linked, directly or by
+    a chain of links, across the tiles. Events without
+    links are not returned, they are never in a cluster.
+    :param neq: number of events of the catalogue
+    :param links: links returned by _link_tile
+    :rtype: list of numpy.ndarray, in catalogue order
+    """
+
+    parent = np.arange(neq)
+    for events, linked in links:
+        union(parent, events, linked)
+    roots = find(parent, np.arange(neq))
+
+    order = np.argsort(roots, kind='mergesort')
+    bounds = np.nonzero(np.diff(roots[order]))[0] + 1
+    return [group for group in np.split(order, bounds) if len(group) > 1]
+
+
+def _balance(groups, workers):
+    """
+    Return the tasks declustering the groups, with
+    similar costs: a group costs the square of its size.
+    """
+
+    ntasks = max(1, min(len(groups), workers * TASKS_PER_WORKER))
+    tasks = [[] for _ in xrange(ntasks)]
+    costs = np.zeros(ntasks)
+    for group in sorted(groups, key=len, reverse=True):
+        cheapest = np.argmin(costs)
+        tasks[cheapest].append(group)
+        costs[cheapest] += len(group) ** 2
+    return [task for task in tasks if task]
+
+
+def _decluster_groups(groups):
+    """
+    Decluster every group on its own, it's defined at module
+    level to be used by worker processes. A group includes all
+    the events interacting with its events, so its events are
+    declustered as in the whole catalogue.
+    :param groups: groups of events, in catalogue order
+    :returns: for every group, the events with their cluster
+        numbers and flags and the events each cluster was
+        identified from
+    :rtype: list of tuples
+    """
+
+    catalog_matrix = _SHARED['catalog_matrix']
+    # The whole catalogue skips its last event
+    last = catalogue_features(catalog_matrix).magnitude_order[-1]
+
+    results = []
+    for group in groups:
+        sorted_catalog = sort_by_magnitude(catalog_matrix,
+            _SHARED['window_opt'], group)
+        vcl, flagvector, mains = gardner_knopoff_clusters(sorted_catalog,
+            _SHARED['fs_time_prop'], process_last=last not in group)
+        events = group[sorted_catalog['order']]
+        results.append((events, vcl, flagvector, events[mains]))
+    return results
+
+
+def _merge(features, results):
+    """
+    Return cluster numbers and flags of the catalogue,
+    clusters are numbered in the order they are identified
+    by the serial algorithm: by descending magnitude of the
+    events they are identified from.
+    """
+
+    neq = len(features.magnitude)
+    vcl = np.zeros(neq, dtype=int)
+    flagvector = np.zeros(neq, dtype=int)
+    groups = [group for result in results for group in result]
+    if not groups:
+        return vcl, flagvector
+
+    rank = np.empty(neq, dtype=int)
+    rank[features.magnitude_order] = np.arange(neq)
+    mains = np.concatenate([group[3] for group in groups])
+    numbers = np.empty(len(mains), dtype=int)
+    numbers[np.argsort(rank[mains])] = np.arange(1, len(mains) + 1)
+
+    start = 0
+    for events, group_vcl, group_flagvector, group_mains in groups:
+        renumber = np.concatenate([[0], numbers[start:start +
+                                                len(group_mains)]])
+        vcl[events] = renumber[group_vcl]
+        flagvector[events] = group_flagvector
+        start += len(group_mains)
+    return vcl, flagvector
+
+
+def find(parent, nodes):
+    """
+    Return the roots of the nodes in a forest where
+    every node has a parent not greater than itself,
+    the paths of the nodes are compressed.
+    :param parent: parent of every node
+    :type parent: numpy.ndarray
+    :param nodes: nodes to be looked up
+    :type nodes: numpy.ndarray
+    :rtype: numpy.ndarray
+    """
+
+    roots = parent[nodes]
+    while True:
+        upper = parent[roots]
+        if np.array_equal(upper, roots):
+            break
+        roots = upper
+    parent[nodes] = roots
+    return roots
+
+
+def union(parent, first, second):
+    """
+    Join the trees of every pair of nodes, the root
+    of a joined tree is the smallest of the roots.
+    :param parent: parent of every node
+    :type parent: numpy.ndarray
+    :param first: first node of every pair
+    :type first: numpy.ndarray
+    :param second: second node of every pair
+    :type second: numpy.ndarray
+    """
+
+    while len(first):
+        first, second = find(parent, first), find(parent, second)
+        joined = first != second
+        first, second = first[joined], second[joined]
+        # When roots are joined to several roots at once
+        # one join is kept, the others are repeated
+        parent[np.maximum(first, second)] = np.minimum(first, second)
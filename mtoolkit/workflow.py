@@ -23,30 +23,20 @@ order. The order is determined by the queue of jobs.
 """
 
 import abc
+import logging
+from itertools import izip
 
 import yaml
 
-from mtoolkit.jobs import (gardner_knopoff, afteran,
-                            stepp, recurrence,
-                            read_eq_catalog, read_source_model,
-                            create_default_source_model,
-                            create_catalog_matrix,
-                            create_default_values,
-                            create_selected_eq_vector,
-                            store_preprocessed_catalog,
-                            store_completeness_table,
-                            retrieve_completeness_table,
-                            maximum_magnitude)
+from mtoolkit.registry import JOBS, KERNELS
 
-from mtoolkit.scientific.completeness import (stepp_analysis,
-                                                selected_eq_flag_vector)
+from mtoolkit.scheduler import DagScheduler
 
-from mtoolkit.scientific.declustering import (gardner_knopoff_decluster,
-                                                afteran_decluster)
+from mtoolkit.source_model import AreaSource
 
-from mtoolkit.scientific.recurrence import recurrence_analysis
+from mtoolkit.instrumentation import JobMetrics
 
-from mtoolkit.scientific.maximum_magnitude import maximum_magnitude_analysis
+LOGGER = logging.getLogger('mt_logger')
 
 
 class PipeLine(object):
@@ -59,12 +49,16 @@ class PipeLine(object):
         """
         Initialize a PipeLine object having
         attributes: name and jobs, a list
-        of callable objects.
+        of callable objects, and the dependencies
+        of every job: a tuple (inputs, outputs) of
+        the context attributes read and written, None
+        if not declared.
         """
 
         self.jobs = []
         if jobs_list != None:
             self.jobs = jobs_list
+        self.dependencies = [None] * len(self.jobs)
 
     def __eq__(self, other):
         """Equal operator for pipeline"""
@@ -76,10 +70,15 @@ class PipeLine(object):
 
         return not self.__eq__(other)
 
-    def add_job(self, a_job):
-        """Append a new job the to queue"""
+    def add_job(self, a_job, dependency=None):
+        """
+        Append a new job the to queue
+        :keyword dependency: tuple (inputs, outputs)
+            of context attributes read and written
+        """
 
         self.jobs.append(a_job)
+        self.dependencies.append(dependency)
 
     def run(self, context):
         """
@@ -90,10 +89,20 @@ class PipeLine(object):
         If logging is triggered by cmdline
         each job is decorated by adding
         logging statements.
+        When the context holds a scheduler
+        independent jobs run concurrently.
         """
 
-        for job in self.jobs:
-            job(context)
+        scheduler = getattr(context, 'scheduler', None)
+        if scheduler is None:
+            for job in self.jobs:
+                job(context)
+        else:
+            # Jobs appended directly to the list
+            # have undeclared dependencies
+            dependencies = self.dependencies + [None] * (
+                len(self.jobs) - len(self.dependencies))
+            scheduler.run(self.jobs, dependencies, context)
 
 
 class PipeLineBuilder(object):
@@ -106,20 +115,12 @@ class PipeLineBuilder(object):
     __metaclass__ = abc.ABCMeta
 
     def __init__(self):
-        self.map_job_callable = {'GardnerKnopoff': gardner_knopoff,
-                                 'Afteran': afteran,
-                                 'Stepp': stepp,
-                                 'Recurrence': recurrence,
-                                 'Create_eq_vector':
-                                   create_selected_eq_vector,
-                                 'Store_eq_catalog':
-                                   store_preprocessed_catalog,
-                                 'Store_completeness_table':
-                                   store_completeness_table,
-                                 'Retrieve_completeness_table':
-                                   retrieve_completeness_table,
-                                 'MaximumMagnitude':
-                                   maximum_magnitude}
+        # Jobs are imported only when a pipeline
+        # actually contains them
+        self.map_job_callable = JOBS.callable_map()
+        # Job names mapped to the registered job
+        # which replaces them (see override_jobs)
+        self.map_job_spec = {}
 
     @abc.abstractmethod
     def build(self, config):
@@ -131,6 +132,30 @@ class PipeLineBuilder(object):
         steps
         """
 
+    def override_jobs(self, config):
+        """
+        Replace builtin jobs with the implementations
+        declared in the jobs section of the config
+        """
+
+        for name, implementation in (config.get('jobs') or {}).items():
+            self.map_job_callable[name] = JOBS.implementation(
+                name, implementation)
+            if ':' not in implementation:
+                self.map_job_spec[name] = implementation
+
+    def job_dependency(self, job):
+        """
+        Return the context attributes read and written
+        by a job as declared in its spec, None if
+        they are not declared
+        """
+
+        spec = JOBS.spec(self.map_job_spec.get(job, job))
+        if spec is None or not (spec.inputs or spec.outputs):
+            return None
+        return spec.inputs, spec.outputs
+
     def append_jobs(self, pipeline, jobs):
         """
         Add jobs to the pipeline by looking
@@ -139,9 +164,10 @@ class PipeLineBuilder(object):
         """
 
         for job in jobs:
-            if job in self.map_job_callable:
-                pipeline.add_job(self.map_job_callable[job])
-            else:
+            try:
+                pipeline.add_job(self.map_job_callable[job],
+                    self.job_dependency(job))
+            except KeyError:
                 raise RuntimeError('Invalid job: %s' % job)
 
         return pipeline
@@ -155,18 +181,33 @@ class PreprocessingBuilder(PipeLineBuilder):
 
     PREPROCESSING_JOBS_KEY = 'preprocessing_jobs'
     PPROCESSING_RESULT_KEY = 'pprocessing_result_file'
+    HOMOGENISATION_KEY = 'Homogenisation'
+    DEDUPLICATION_KEY = 'Deduplication'
 
     def build(self, config):
 
+        self.override_jobs(config)
+
         # Checks if source model is defined
         if config['source_model_file']:
-            source_model_creation = read_source_model
+            source_model_creation = 'Read_source_model'
         else:
-            source_model_creation = create_default_source_model
+            source_model_creation = 'Create_default_source_model'
 
         # Add compulsory jobs to the pipeline'])
-        pipeline = PipeLine([read_eq_catalog, source_model_creation,
-                    create_catalog_matrix, create_default_values])
+        pipeline = self.append_jobs(PipeLine(), ['Read_eq_catalog',
+                    source_model_creation])
+
+        # Magnitudes are homogenised, so that duplicates
+        # are compared by Mw, before the catalog matrix is
+        # created from Mw
+        if config.get(PreprocessingBuilder.HOMOGENISATION_KEY):
+            self.append_jobs(pipeline, ['Homogenisation'])
+        if config.get(PreprocessingBuilder.DEDUPLICATION_KEY):
+            self.append_jobs(pipeline, ['Deduplication'])
+
+        self.append_jobs(pipeline, ['Create_catalog_matrix',
+                    'Create_default_values'])
 
         # Add preprocessing jobs
         if config[PreprocessingBuilder.PREPROCESSING_JOBS_KEY]:
@@ -175,14 +216,11 @@ class PreprocessingBuilder(PipeLineBuilder):
 
             # Add store eq catalog jobs if result file is defined
             if config[PreprocessingBuilder.PPROCESSING_RESULT_KEY]:
-                pipeline.add_job(self.map_job_callable['Create_eq_vector'])
-                pipeline.add_job(self.map_job_callable['Store_eq_catalog'])
-                pipeline.add_job(
-                    self.map_job_callable['Store_completeness_table'])
+                self.append_jobs(pipeline, ['Create_eq_vector',
+                    'Store_eq_catalog', 'Store_completeness_table'])
         else:
             if config['completeness_table_file']:
-                pipeline.add_job(
-                    self.map_job_callable['Retrieve_completeness_table'])
+                self.append_jobs(pipeline, ['Retrieve_completeness_table'])
 
         return pipeline
 
@@ -195,12 +233,22 @@ class ProcessingBuilder(PipeLineBuilder):
 
     PROCESSING_JOBS_CONFIG_KEY = 'processing_jobs'
 
+    # Jobs reading values computed by other jobs, which
+    # must come earlier in the sequence of processing jobs
+    REQUIRED_JOBS = {'SmoothedSeismicity': ['Recurrence']}
+
     def build(self, config):
+        self.override_jobs(config)
         pipeline = PipeLine()
 
-        if config[ProcessingBuilder.PROCESSING_JOBS_CONFIG_KEY]:
-            self.append_jobs(pipeline,
-                    config[ProcessingBuilder.PROCESSING_JOBS_CONFIG_KEY])
+        jobs = config[ProcessingBuilder.PROCESSING_JOBS_CONFIG_KEY]
+        if jobs:
+            for position, job in enumerate(jobs):
+                for required in ProcessingBuilder.REQUIRED_JOBS.get(job, []):
+                    if required not in jobs[:position]:
+                        raise RuntimeError('Processing job %s requires %s '
+                            'before it' % (job, required))
+            self.append_jobs(pipeline, jobs)
 
         return pipeline
 
@@ -214,17 +262,19 @@ class Context(object):
 
     def __init__(self, config_filename=None):
         self.config = dict()
-        self.map_sc = {'gardner_knopoff': gardner_knopoff_decluster,
-                        'afteran': afteran_decluster,
-                        'stepp': stepp_analysis,
-                        'recurrence': recurrence_analysis,
-                        'select_eq_vector': selected_eq_flag_vector,
-                        'maximum_magnitude': maximum_magnitude_analysis}
-
         if config_filename:
             config_file = open(config_filename, 'r')
             self.config = yaml.load(config_file)
 
+        # Scientific functions are imported only when
+        # a job uses them, the kernels section of the
+        # config replaces builtin implementations
+        self.map_sc = KERNELS.callable_map(self.config.get('kernels'))
+
+        self.metrics = JobMetrics()
+        self.profiler = None
+        self.scheduler = None
+        self.checkpoint = None
         self.eq_catalog = None
         self.sm_definitions = None
         self.catalog_matrix = None
@@ -245,13 +295,128 @@ class Workflow(object):
 
     def start(self, context, catalog_filter):
         """
-        Execute the main workflow
+        Execute the main workflow, at the end
+        a summary of the measurements taken on
+        jobs is logged and optionally stored in the
+        metrics file.
+        When pipeline_workers is defined in the config
+        independent jobs run concurrently. When the context
+        holds a checkpoint the preprocessing state and every
+        completed source model are stored, and restored
+        by a resumed run. Shared catalogues created by the
+        jobs are removed when the workflow ends, the ones
+        created before it are kept.
+        """
+        context.cur_sm = None
+        # Imported here, like jobs, to keep the import light
+        from mtoolkit.shared_catalogue import owned_segments, close_segments
+        # Segments created by the caller may still be in use
+        existing_segments = owned_segments()
+        workers = context.config.get('pipeline_workers')
+        if workers and workers > 1 and context.scheduler is None:
+            context.scheduler = DagScheduler(workers)
+
+        try:
+            self._run_preprocessing(context)
+            if context.config['apply_processing_jobs']:
+                for index, (sm, filtered_eq) in self._sources(context,
+                        catalog_filter):
+
+                    context.cur_sm = sm
+                    context.current_filtered_eq = filtered_eq
+                    self.processing_pipeline.run(context)
+                    if context.checkpoint is not None:
+                        context.checkpoint.store_source(index, context.cur_sm)
+        finally:
+            if context.scheduler is not None:
+                context.scheduler.close()
+                context.scheduler = None
+            close_segments(owned_segments() - existing_segments)
+
+            LOGGER.info(''.center(80, '-'))
+            LOGGER.info(context.metrics.summary())
+
+            # Written for failed runs too, up to the failed job
+            if context.config.get('metrics_file'):
+                context.metrics.write(context.config['metrics_file'])
+
+    def _run_preprocessing(self, context):
         """
+        Run the preprocessing pipeline, unless its
+        state is restored from the checkpoint
+        """
+
+        checkpoint = context.checkpoint
+        if checkpoint is not None and checkpoint.load_preprocessing(context):
+            LOGGER.info("Preprocessing state restored from %s" %
+                checkpoint.run_dir)
+            return
+
         self.preprocessing_pipeline.run(context)
-        if context.config['apply_processing_jobs']:
-            for sm, filtered_eq in catalog_filter.filter_eqs(
-                    context.sm_definitions, context.working_catalog):
+        if checkpoint is not None:
+            checkpoint.store_preprocessing(context)
+
+    def _sources(self, context, catalog_filter):
+        """
+        Return the source models to be processed with
+        their index and filtered eq events, the source models
+        completed in a previous run are restored from the
+        checkpoint
+        """
+
+        indexes = _area_source_indexes(context.sm_definitions)
+        if context.checkpoint is not None:
+            indexes = self._pending_sources(context, indexes)
+
+        return izip(indexes, catalog_filter.filter_eqs(
+            [context.sm_definitions[index] for index in indexes],
+            context.working_catalog))
 
-                context.cur_sm = sm
-                context.current_filtered_eq = filtered_eq
-                self.processing_pipeline.run(context)
+    def _pending_sources(self, context, indexes):
+        """
+        Return the indexes of the source models still to be
+        processed, restoring the completed ones
+        :param indexes: indexes of the source models to be processed
+        :type indexes: list of int
+        """
+
+        pending = []
+        for index in indexes:
+            source = context.checkpoint.load_source(index)
+            if source is None:
+                pending.append(index)
+            else:
+                context.sm_definitions[index] = source
+
+        if len(pending) < len(indexes):
+            LOGGER.info("Source models restored from %s: %d, pending: %d" %
+                (context.checkpoint.run_dir,
+                 len(indexes) - len(pending), len(pending)))
+        return pending
+
+
+def _area_source_indexes(sm_definitions):
+    """
+    Return the indexes of the area sources in the source
+    model definitions, the catalogue is filtered with the
+    polygon of the source so the other source types
+    are not processed
+    :param sm_definitions: source model definitions
+    :type sm_definitions: list of source model objects
+    :rtype: list of int
+    """
+
+    indexes = []
+    skipped = {}
+    for index, source in enumerate(sm_definitions):
+        if isinstance(source, AreaSource):
+            indexes.append(index)
+        else:
+            source_type = type(source).__name__
+            skipped[source_type] = skipped.get(source_type, 0) + 1
+
+    if skipped:
+        LOGGER.warning("Source models without an area boundary are not "
+            "processed: %s" % ', '.join('%s: %d' % item
+                for item in sorted(skipped.items())))
+    return indexes
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide objects
+capable of storing parsed source models in a compact
+binary snapshot, so that an unchanged nrml file
+doesn't need to be parsed and validated again.
+"""
+
+import os
+import hashlib
+import cPickle
+
+import numpy as np
+
+from nrml import nrml_xml
+
+from mtoolkit.source_model import AreaSource
+from mtoolkit.source_model import PointSource
+from mtoolkit.source_model import SimpleFaultSource
+from mtoolkit.source_model import POINT
+from mtoolkit.source_model import AREA_BOUNDARY
+from mtoolkit.source_model import TRUNCATED_GUTEN_RICHTER
+from mtoolkit.source_model import RUPTURE_RATE_MODEL
+from mtoolkit.source_model import MAGNITUDE
+from mtoolkit.source_model import RUPTURE_DEPTH_DISTRIB
+from mtoolkit.source_model import EVENLY_DISCRETIZED_MFD
+from mtoolkit.source_model import SIMPLE_FAULT_GEOMETRY
+
+# Bump when the snapshot layout changes
+SNAPSHOT_FORMAT_VERSION = 2
+
+HASH_BLOCK_SIZE = 1 << 20
+
+# Errors raised by snapshots which can't be loaded
+SNAPSHOT_ERRORS = (EOFError, cPickle.UnpicklingError, AttributeError,
+                   ImportError, IndexError, KeyError, TypeError, ValueError)
+
+
+class SourceModelCache(object):
+    """
+    SourceModelCache stores the source models parsed
+    from a nrml file in a binary snapshot. Snapshots
+    are keyed on the content of the nrml file and
+    on the nrml schema version, a snapshot is never
+    used if any of them changes.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Constructor
+        :param cache_dir: directory where snapshots are stored
+        :type cache_dir: string
+        """
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.cache_dir = cache_dir
+
+    def snapshot_path(self, filename):
+        """
+        Return the path of the snapshot
+        associated to the nrml file
+        :param filename: nrml input filename
+        :type filename: string
+        """
+
+        return os.path.join(self.cache_dir,
+            '%s.snapshot' % snapshot_key(filename))
+
+    def load(self, filename):
+        """
+        Return the source models stored in the
+        snapshot of the nrml file, None if no
+        valid snapshot is found.
+        :param filename: nrml input filename
+        :type filename: string
+        :returns: source model objects
+        :rtype: list of py:class:: AreaSource, PointSource
+            or SimpleFaultSource, or None
+        """
+
+        path = self.snapshot_path(filename)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'rb') as snapshot_file:
+                snapshot = cPickle.load(snapshot_file)
+            if snapshot.get('format') != SNAPSHOT_FORMAT_VERSION:
+                return None
+            return _unpack_sources(snapshot)
+        except SNAPSHOT_ERRORS:
+            # A truncated snapshot (i.e. an interrupted run) or
+            # one written by an older layout of the classes (or
+            # modules) it refers to is treated as a cache miss
+            return None
+
+    def store(self, filename, sources):
+        """
+        Store source models in the snapshot
+        associated to the nrml file
+        :param filename: nrml input filename
+        :type filename: string
+        :param sources: source model objects
+        :type sources: sequence of source model objects
+        """
+
+        path = self.snapshot_path(filename)
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as snapshot_file:
+            cPickle.dump(_pack_sources(sources), snapshot_file,
+                cPickle.HIGHEST_PROTOCOL)
+        # Rename is atomic, concurrent readers never
+        # see a partially written snapshot
+        os.rename(tmp_path, path)
+
+
+def snapshot_key(filename):
+    """
+    Return the key identifying the snapshot of a nrml
+    file, computed from the file content and the
+    nrml schema version.
+    :param filename: nrml input filename
+    :type filename: string
+    :rtype: string
+    """
+
+    digest = hashlib.sha1()
+    digest.update('%s:%s:' % (nrml_xml.NRML_NS, SNAPSHOT_FORMAT_VERSION))
+    with open(filename, 'rb') as nrml_file:
+        block = nrml_file.read(HASH_BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = nrml_file.read(HASH_BLOCK_SIZE)
+    return digest.hexdigest()
+
+
+def _pack_sources(sources):
+    """
+    Create the snapshot of a sequence of source models,
+    polygon vertices of every area source are stored in
+    a single contiguous float array. Point and simple
+    fault sources are stored with their position in
+    the sequence.
+    """
+
+    attributes = []
+    offsets = [0]
+    vertices = []
+    other_sources = []
+    for index, source in enumerate(sources):
+        if isinstance(source, PointSource):
+            other_sources.append((index, 'point', _pack_point_source(source)))
+            continue
+        if isinstance(source, SimpleFaultSource):
+            other_sources.append((index, 'simple_fault',
+                _pack_simple_fault_source(source)))
+            continue
+
+        tgr = source.rupture_rate_model.truncated_gutenberg_richter
+        rdd = source.rupture_depth_dist
+        attributes.append((source.nrml_id,
+            source.source_model_id,
+            source.area_source_id,
+            source.name,
+            source.tectonic_region,
+            source.area_boundary.srs_name,
+            tuple(tgr),
+            tuple(source.rupture_rate_model[1:]),
+            (rdd.magnitude.type_mag, list(rdd.magnitude.values)),
+            list(rdd.depth),
+            source.hypocentral_depth))
+        vertices.append(source.vertices)
+        offsets.append(offsets[-1] + len(source.vertices))
+
+    return {'format': SNAPSHOT_FORMAT_VERSION,
+            'attributes': attributes,
+            'offsets': np.array(offsets, dtype=np.int64),
+            'vertices': np.concatenate(vertices).reshape((-1, 2))
+                if vertices else np.zeros((0, 2)),
+            'other_sources': other_sources}
+
+
+def _pack_point_source(point_source):
+    """
+    Return the attributes of a point source as plain
+    tuples, namedtuples of the source model module
+    can't be pickled
+    """
+
+    tgr = point_source.rupture_rate_model.truncated_gutenberg_richter
+    rdd = point_source.rupture_depth_dist
+    return (point_source.nrml_id,
+        point_source.source_model_id,
+        point_source.point_source_id,
+        point_source.name,
+        point_source.tectonic_region,
+        point_source.srs_name,
+        tuple(point_source.location),
+        tuple(tgr),
+        tuple(point_source.rupture_rate_model[1:]),
+        (rdd.magnitude.type_mag, list(rdd.magnitude.values)),
+        list(rdd.depth),
+        point_source.hypocentral_depth)
+
+
+def _pack_simple_fault_source(simple_fault_source):
+    """
+    Return the attributes of a simple fault source as
+    plain tuples
+    """
+
+    mfd = simple_fault_source.mfd
+    if isinstance(mfd, TRUNCATED_GUTEN_RICHTER):
+        mfd = ('truncated_gutenberg_richter', tuple(mfd))
+    else:
+        mfd = ('evenly_discretized', tuple(mfd))
+
+    return (simple_fault_source.nrml_id,
+        simple_fault_source.source_model_id,
+        simple_fault_source.simple_fault_source_id,
+        simple_fault_source.name,
+        simple_fault_source.tectonic_region,
+        simple_fault_source.rake,
+        mfd,
+        tuple(simple_fault_source.geometry))
+
+
+def _unpack_sources(snapshot):
+    """
+    Create source models from a snapshot
+    """
+
+    sources = []
+    offsets = snapshot['offsets']
+    vertices = snapshot['vertices']
+    for i, attributes in enumerate(snapshot['attributes']):
+        (nrml_id, source_model_id, area_source_id, name, tectonic_region,
+            srs_name, tgr, rrm, magnitude, depth, hypocentral_depth) = \
+            attributes
+
+        area_source = AreaSource()
+        area_source.nrml_id = nrml_id
+        area_source.source_model_id = source_model_id
+        area_source.area_source_id = area_source_id
+        area_source.name = name
+        area_source.tectonic_region = tectonic_region
+        # Every source keeps a view on the shared vertices array
+        area_source.area_boundary = AREA_BOUNDARY(srs_name,
+            vertices[offsets[i]:offsets[i + 1]])
+        area_source.rupture_rate_model = RUPTURE_RATE_MODEL(
+            TRUNCATED_GUTEN_RICHTER(*tgr), *rrm)
+        area_source.rupture_depth_dist = RUPTURE_DEPTH_DISTRIB(
+            MAGNITUDE(*magnitude), depth)
+        area_source.hypocentral_depth = hypocentral_depth
+        sources.append(area_source)
+
+    # Positions are increasing, every source is inserted
+    # after the ones preceding it in the nrml file
+    unpack = {'point': _unpack_point_source,
+              'simple_fault': _unpack_simple_fault_source}
+    for index, kind, attributes in snapshot['other_sources']:
+        sources.insert(index, unpack[kind](attributes))
+
+    return sources
+
+
+def _unpack_point_source(attributes):
+    """
+    Create a point source from its snapshot attributes
+    """
+
+    (nrml_id, source_model_id, point_source_id, name, tectonic_region,
+        srs_name, location, tgr, rrm, magnitude, depth,
+        hypocentral_depth) = attributes
+
+    point_source = PointSource()
+    point_source.nrml_id = nrml_id
+    point_source.source_model_id = source_model_id
+    point_source.point_source_id = point_source_id
+    point_source.name = name
+    point_source.tectonic_region = tectonic_region
+    point_source.srs_name = srs_name
+    point_source.location = POINT(*location)
+    point_source.rupture_rate_model = RUPTURE_RATE_MODEL(
+        TRUNCATED_GUTEN_RICHTER(*tgr), *rrm)
+    point_source.rupture_depth_dist = RUPTURE_DEPTH_DISTRIB(
+        MAGNITUDE(*magnitude), depth)
+    point_source.hypocentral_depth = hypocentral_depth
+    return point_source
+
+
+def _unpack_simple_fault_source(attributes):
+    """
+    Create a simple fault source from its snapshot attributes
+    """
+
+    (nrml_id, source_model_id, simple_fault_source_id, name,
+        tectonic_region, rake, (mfd_kind, mfd), geometry) = attributes
+
+    simple_fault_source = SimpleFaultSource()
+    simple_fault_source.nrml_id = nrml_id
+    simple_fault_source.source_model_id = source_model_id
+    simple_fault_source.simple_fault_source_id = simple_fault_source_id
+    simple_fault_source.name = name
+    simple_fault_source.tectonic_region = tectonic_region
+    simple_fault_source.rake = rake
+    if mfd_kind == 'truncated_gutenberg_richter':
+        simple_fault_source.mfd = TRUNCATED_GUTEN_RICHTER(*mfd)
+    else:
+        simple_fault_source.mfd = EVENLY_DISCRETIZED_MFD(*mfd)
+    simple_fault_source.geometry = SIMPLE_FAULT_GEOMETRY(*geometry)
+    return simple_fault_source
@@ -83,6 +83,9 @@ SIMPLE_FAULT_SOURCE = "%ssimpleFaultSource" % NRML
 RAKE = "%srake" % NRML
 DIP = "%sdip" % NRML
 SIMPLE_FAULT_GEOMETRY = "%ssimpleFaultGeometry" % NRML
+FAULT_TRACE = "%sfaultTrace" % NRML
+LINE_STRING = "%sLineString" % GML
+SRS_DIMENSION = "srsDimension"
 UPPER_SEISMOGENIC_DEPTH = "%supperSeismogenicDepth" % NRML
 LOWER_SEISMOGENIC_DEPTH = "%slowerSeismogenicDepth" % NRML
 
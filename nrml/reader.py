@@ -22,27 +22,33 @@ capable of parsing specific flavours
 of the NRML data format.
 """
 
+import numpy as np
 from lxml import etree
 
 from nrml import nrml_xml
 
 from mtoolkit.source_model import AreaSource
+from mtoolkit.source_model import PointSource
+from mtoolkit.source_model import SimpleFaultSource
 from mtoolkit.source_model import POINT
 from mtoolkit.source_model import AREA_BOUNDARY
 from mtoolkit.source_model import TRUNCATED_GUTEN_RICHTER
+from mtoolkit.source_model import EVENLY_DISCRETIZED_MFD
 from mtoolkit.source_model import RUPTURE_RATE_MODEL
 from mtoolkit.source_model import MAGNITUDE
 from mtoolkit.source_model import RUPTURE_DEPTH_DISTRIB
-
-XML_NODE = 1
+from mtoolkit.source_model import SIMPLE_FAULT_GEOMETRY
 
 
 class NRMLReader(object):
     """
     NRMLReader object allows to parse source model
     in a nrml file in an iterative way. NRMLReader
-    generates area source objects for each area
-    source element in the parsed document.
+    generates a source object (area, point or simple
+    fault source) for each source element in the
+    parsed document. Elements are released as soon as
+    they are parsed, so memory doesn't grow with the
+    number of sources in the document.
     """
 
     def __init__(self, filename, schema):
@@ -57,22 +63,44 @@ class NRMLReader(object):
         self.filename = filename
         self.schema = etree.XMLSchema(etree.parse(schema))
 
-        self.tag_action = {nrml_xml.AREA_SOURCE: _parse_area_source}
+        self.tag_action = {
+            nrml_xml.AREA_SOURCE: _parse_area_source,
+            nrml_xml.SIMPLE_POINT_SOURCE: _parse_point_source,
+            nrml_xml.SIMPLE_FAULT_SOURCE: _parse_simple_fault_source}
 
     def read(self):
         """
-        Generator method, yields AreaSource
-        object for every area source element
+        Generator method, yields a source
+        object for every source element
         in the nrml input file.
         :returns: source model object
-        :rtype: py:class:: AreaSource
+        :rtype: py:class:: AreaSource, PointSource or SimpleFaultSource
         """
 
+        # Only the end of sources and of source models are listened
+        # to, the end of a source model releases its last source
+        tags = list(self.tag_action) + [nrml_xml.SOURCE_MODEL]
+
         with open(self.filename, 'rb') as nrml_file:
-            for source_model in etree.iterparse(nrml_file, schema=self.schema):
-                tag = source_model[XML_NODE].tag
-                if tag in self.tag_action:
-                    yield self.tag_action[tag](source_model[XML_NODE])
+            for _, elem in etree.iterparse(nrml_file, tag=tags,
+                    schema=self.schema):
+                if elem.tag in self.tag_action:
+                    yield self.tag_action[elem.tag](elem)
+                release_element(elem)
+
+
+def release_element(elem):
+    """
+    Release a parsed element together with the
+    siblings parsed before it, which otherwise
+    would stay attached to the tree
+    """
+
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
 
 
 def _parse_area_source(as_elem):
@@ -88,11 +116,7 @@ def _parse_area_source(as_elem):
 
     area_source = AreaSource()
 
-    area_source.nrml_id = as_elem.getparent().getparent().get(
-            nrml_xml.GML_ID)
-
-    area_source.source_model_id = as_elem.getparent().get(
-            nrml_xml.GML_ID)
+    area_source.nrml_id, area_source.source_model_id = _parse_ids(as_elem)
 
     area_source.area_source_id = as_elem.get(
         nrml_xml.GML_ID)
@@ -115,11 +139,144 @@ def _parse_area_source(as_elem):
     area_source.hypocentral_depth = float(as_elem.find(
         nrml_xml.HYPOCENTRAL_DEPTH).text)
 
-    as_elem.clear()
-
     return area_source
 
 
+def _parse_point_source(ps_elem):
+    """
+    Creates a PointSource object by
+    extracting data contained in a
+    point source element.
+    :param ps_elem: point source element
+    :type ps_elem: lxml.etree._Element
+    :returns: point source object
+    :rtype: py:class::PointSource
+    """
+
+    point_source = PointSource()
+
+    point_source.nrml_id, point_source.source_model_id = _parse_ids(ps_elem)
+
+    point_source.point_source_id = ps_elem.get(nrml_xml.GML_ID)
+
+    point_source.name = ps_elem.find(nrml_xml.GML_NAME).text
+
+    point_source.tectonic_region = ps_elem.find(
+        nrml_xml.TECTONIC_REGION).text
+
+    point_elem = ps_elem.find('%s/%s' % (nrml_xml.LOCATION, nrml_xml.POINT))
+    point_source.srs_name = point_elem.get(nrml_xml.SRS_NAME)
+    lon, lat = point_elem.find(nrml_xml.POS).text.split()[:2]
+    point_source.location = POINT(float(lon), float(lat))
+
+    point_source.rupture_rate_model = _parse_rupture_rate_model(
+        ps_elem.find(nrml_xml.RUPTURE_RATE_MODEL))
+
+    point_source.rupture_depth_dist = _parse_rupture_depth_distrib(
+        ps_elem.find(nrml_xml.RUPTURE_DEPTH_DISTRIB))
+
+    point_source.hypocentral_depth = float(ps_elem.find(
+        nrml_xml.HYPOCENTRAL_DEPTH).text)
+
+    return point_source
+
+
+def _parse_simple_fault_source(sfs_elem):
+    """
+    Creates a SimpleFaultSource object by
+    extracting data contained in a simple
+    fault source element.
+    :param sfs_elem: simple fault source element
+    :type sfs_elem: lxml.etree._Element
+    :returns: simple fault source object
+    :rtype: py:class::SimpleFaultSource
+    """
+
+    simple_fault_source = SimpleFaultSource()
+
+    simple_fault_source.nrml_id, simple_fault_source.source_model_id = \
+        _parse_ids(sfs_elem)
+
+    simple_fault_source.simple_fault_source_id = sfs_elem.get(
+        nrml_xml.GML_ID)
+
+    simple_fault_source.name = sfs_elem.find(nrml_xml.GML_NAME).text
+
+    simple_fault_source.tectonic_region = sfs_elem.find(
+        nrml_xml.TECTONIC_REGION).text
+
+    simple_fault_source.rake = float(sfs_elem.find(nrml_xml.RAKE).text)
+
+    simple_fault_source.mfd = _parse_mfd(sfs_elem)
+
+    simple_fault_source.geometry = _parse_simple_fault_geometry(
+        sfs_elem.find(nrml_xml.SIMPLE_FAULT_GEOMETRY))
+
+    return simple_fault_source
+
+
+def _parse_ids(source_elem):
+    """
+    Return the ids of the document and of the
+    source model a source element belongs to
+    :rtype: tuple (nrml id, source model id)
+    """
+
+    source_model_elem = source_elem.getparent()
+    return (source_model_elem.getparent().get(nrml_xml.GML_ID),
+            source_model_elem.get(nrml_xml.GML_ID))
+
+
+def _parse_mfd(parent_elem):
+    """
+    Creates the magnitude frequency distribution
+    (truncated Gutenberg Richter or evenly discretized)
+    contained in an element.
+    :param parent_elem: element containing the distribution
+    :type parent_elem: lxml.etree._Element
+    :returns: magnitude frequency distribution object
+    :rtype: py:class::TruncatedGutenRichter or
+            py:class::EvenlyDiscretizedIncrementalMFD
+    """
+
+    tgr_elem = parent_elem.find(nrml_xml.TRUNCATED_GUTEN_RICHTER)
+    if tgr_elem is not None:
+        return _parse_truncated_gutenberg_richter(tgr_elem)
+
+    mfd_elem = parent_elem.find(nrml_xml.EVENLY_DISCRETIZED_INC_MFD)
+    return EVENLY_DISCRETIZED_MFD(
+        float(mfd_elem.get(nrml_xml.BIN_SIZE)),
+        float(mfd_elem.get(nrml_xml.MIN_VAL)),
+        [float(value) for value in mfd_elem.text.split()],
+        mfd_elem.get(nrml_xml.TYPE))
+
+
+def _parse_simple_fault_geometry(sfg_elem):
+    """
+    Creates a SimpleFaultGeometry object by extracting
+    data contained in a simple fault geometry element.
+    :param sfg_elem: simple fault geometry element
+    :type sfg_elem: lxml.etree._Element
+    :returns: simple fault geometry object
+    :rtype: py:class::SimpleFaultGeometry
+    """
+
+    line_string_elem = sfg_elem.find('%s/%s' % (nrml_xml.FAULT_TRACE,
+        nrml_xml.LINE_STRING))
+    pos_list_elem = line_string_elem.find(nrml_xml.POS_LIST)
+    dimension = int(pos_list_elem.get(nrml_xml.SRS_DIMENSION, 2))
+    coordinates = [float(value) for value in pos_list_elem.text.split()]
+
+    return SIMPLE_FAULT_GEOMETRY(
+        sfg_elem.get(nrml_xml.GML_ID),
+        line_string_elem.get(nrml_xml.SRS_NAME),
+        tuple(tuple(coordinates[i:i + dimension])
+              for i in xrange(0, len(coordinates), dimension)),
+        float(sfg_elem.find(nrml_xml.DIP).text),
+        float(sfg_elem.find(nrml_xml.UPPER_SEISMOGENIC_DEPTH).text),
+        float(sfg_elem.find(nrml_xml.LOWER_SEISMOGENIC_DEPTH).text))
+
+
 def _parse_area_boundary(area_boundary_elem):
     """
     Creates an AreaBounday object by extracting
@@ -133,10 +290,11 @@ def _parse_area_boundary(area_boundary_elem):
     srs_name = area_boundary_elem.find('.//%s' %
         nrml_xml.LINEAR_RING).get(nrml_xml.LINEAR_RING_NAME)
 
-    pos_list_values = area_boundary_elem.find(
-        './/%s' % nrml_xml.POS_LIST).text.split()
-    pos_list = [POINT(float(pos_list_values[i]), float(pos_list_values[i + 1]))
-            for i in xrange(0, len(pos_list_values), 2)]
+    # Vertices go straight into a (n, 2) array, AreaSource
+    # stores them in this form
+    pos_list = np.array(area_boundary_elem.find(
+        './/%s' % nrml_xml.POS_LIST).text.split(),
+        dtype=np.float64).reshape((-1, 2))
 
     area_boundary_elem.clear()
 
@@ -156,28 +314,41 @@ def _parse_rupture_rate_model(rupture_rate_model_elem):
     truncatd_gutenberg_rich_elem = rupture_rate_model_elem.find(
             nrml_xml.TRUNCATED_GUTEN_RICHTER)
 
-    truncated_gutenberg_richter = TRUNCATED_GUTEN_RICHTER(
-        float(truncatd_gutenberg_rich_elem.find(
-            nrml_xml.A_VALUE_CUMULATIVE).text),
-        float(truncatd_gutenberg_rich_elem.find(
-            nrml_xml.B_VALUE).text),
-        float(truncatd_gutenberg_rich_elem.find(
-            nrml_xml.MIN_MAGNITUDE).text),
-        float(truncatd_gutenberg_rich_elem.find(
-            nrml_xml.MAX_MAGNITUDE).text),
-        truncatd_gutenberg_rich_elem.get(nrml_xml.TYPE))
+    truncated_gutenberg_richter = _parse_truncated_gutenberg_richter(
+        truncatd_gutenberg_rich_elem)
 
     rupture_rate_model = RUPTURE_RATE_MODEL(truncated_gutenberg_richter,
         float(rupture_rate_model_elem.find(nrml_xml.STRIKE).text),
         float(rupture_rate_model_elem.find(nrml_xml.DIP).text),
         float(rupture_rate_model_elem.find(nrml_xml.RAKE).text))
 
-    truncatd_gutenberg_rich_elem.clear()
     rupture_rate_model_elem.clear()
 
     return rupture_rate_model
 
 
+def _parse_truncated_gutenberg_richter(tgr_elem):
+    """
+    Creates a TruncatedGutenRichter object by extracting
+    data contained in a truncated gutenberg richter element.
+    :param tgr_elem: truncated gutenberg richter element
+    :type tgr_elem: lxml.etree._Element
+    :returns: truncated gutenberg richter object
+    :rtype: py:class::TruncatedGutenRichter
+    """
+
+    truncated_gutenberg_richter = TRUNCATED_GUTEN_RICHTER(
+        float(tgr_elem.find(nrml_xml.A_VALUE_CUMULATIVE).text),
+        float(tgr_elem.find(nrml_xml.B_VALUE).text),
+        float(tgr_elem.find(nrml_xml.MIN_MAGNITUDE).text),
+        float(tgr_elem.find(nrml_xml.MAX_MAGNITUDE).text),
+        tgr_elem.get(nrml_xml.TYPE))
+
+    tgr_elem.clear()
+
+    return truncated_gutenberg_richter
+
+
 def _parse_rupture_depth_distrib(rdd_elem):
     """
     Creates a RuptureDepthDistrib object by extracting
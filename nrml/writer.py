@@ -27,12 +27,17 @@ from lxml import etree
 
 from nrml import nrml_xml
 
+from mtoolkit.source_model import PointSource
+from mtoolkit.source_model import SimpleFaultSource
+from mtoolkit.source_model import TRUNCATED_GUTEN_RICHTER
+
 
 class AreaSourceWriter(object):
     """
     AreaSourceWriter object allows to serialize a
     sequence of AreaSource objects in the nrml
-    data format.
+    data format. Point and simple fault sources
+    read with the area sources are serialized too.
     """
 
     def __init__(self, filename):
@@ -101,11 +106,27 @@ def _write_body(root_elem, area_sources):
     """
 
     source_model_elem = root_elem.find(nrml_xml.SOURCE_MODEL)
-    for area_source in area_sources:
-        source_model_elem.append(_area_source_elem(area_source))
+    for source in area_sources:
+        source_model_elem.append(source_elem(source))
     return root_elem
 
 
+def source_elem(source):
+    """
+    Create the element of a source model object,
+    it can be written on its own by writers
+    streaming large source models
+    :param source: source model object
+    :type source: py:class:: AreaSource, PointSource or SimpleFaultSource
+    """
+
+    if isinstance(source, PointSource):
+        return _point_source_elem(source)
+    if isinstance(source, SimpleFaultSource):
+        return _simple_fault_source_elem(source)
+    return _area_source_elem(source)
+
+
 def _area_source_elem(area_source):
     """
     Create area source element by reading
@@ -141,6 +162,84 @@ def _area_source_elem(area_source):
     return area_source_elem
 
 
+def _point_source_elem(point_source):
+    """
+    Create point source element by reading
+    data from the point source object.
+    :param point_source: point source object
+    :type point_source: py:class:: PointSource
+    """
+
+    point_source_elem = etree.Element(nrml_xml.SIMPLE_POINT_SOURCE)
+    point_source_elem.attrib[nrml_xml.GML_ID] = point_source.point_source_id
+
+    name_elem = etree.SubElement(
+        point_source_elem, nrml_xml.GML_NAME)
+    name_elem.text = point_source.name
+
+    tectonic_region_elem = etree.SubElement(
+        point_source_elem, nrml_xml.TECTONIC_REGION)
+    tectonic_region_elem.text = point_source.tectonic_region
+
+    location_elem = etree.SubElement(
+        point_source_elem, nrml_xml.LOCATION)
+    point_elem = etree.SubElement(location_elem, nrml_xml.POINT)
+    point_elem.attrib[nrml_xml.SRS_NAME] = point_source.srs_name
+    pos_elem = etree.SubElement(point_elem, nrml_xml.POS)
+    pos_elem.text = '%r %r' % (point_source.location.lon,
+        point_source.location.lat)
+
+    _write_rupture_rate_model(
+        point_source_elem, point_source.rupture_rate_model)
+
+    _write_rupture_depth_distrib(
+        point_source_elem, point_source.rupture_depth_dist)
+
+    hypocentral_depth_elem = etree.SubElement(
+        point_source_elem, nrml_xml.HYPOCENTRAL_DEPTH)
+    hypocentral_depth_elem.text = repr(
+        point_source.hypocentral_depth)
+
+    return point_source_elem
+
+
+def _simple_fault_source_elem(simple_fault_source):
+    """
+    Create simple fault source element by reading
+    data from the simple fault source object.
+    :param simple_fault_source: simple fault source object
+    :type simple_fault_source: py:class:: SimpleFaultSource
+    """
+
+    simple_fault_source_elem = etree.Element(nrml_xml.SIMPLE_FAULT_SOURCE)
+    simple_fault_source_elem.attrib[nrml_xml.GML_ID] = \
+        simple_fault_source.simple_fault_source_id
+
+    name_elem = etree.SubElement(
+        simple_fault_source_elem, nrml_xml.GML_NAME)
+    name_elem.text = simple_fault_source.name
+
+    tectonic_region_elem = etree.SubElement(
+        simple_fault_source_elem, nrml_xml.TECTONIC_REGION)
+    tectonic_region_elem.text = simple_fault_source.tectonic_region
+
+    rake_elem = etree.SubElement(
+        simple_fault_source_elem, nrml_xml.RAKE)
+    rake_elem.text = repr(simple_fault_source.rake)
+
+    if isinstance(simple_fault_source.mfd, TRUNCATED_GUTEN_RICHTER):
+        _write_truncated_guten_richter(simple_fault_source_elem,
+            simple_fault_source.mfd)
+    else:
+        _write_evenly_discretized_mfd(simple_fault_source_elem,
+            simple_fault_source.mfd)
+
+    _write_simple_fault_geometry(simple_fault_source_elem,
+        simple_fault_source.geometry)
+
+    return simple_fault_source_elem
+
+
 def _write_area_boundary(container_elem, area_boundary):
     """
     Attach an area boundary element
@@ -225,21 +324,21 @@ def _write_truncated_guten_richter(container_elem,
     a_value_elem = etree.SubElement(
         truncatd_gutenberg_rich_elem, nrml_xml.A_VALUE_CUMULATIVE)
     a_value_elem.text = \
-        str(truncated_gutenberg_richter.a_value)
+        repr(truncated_gutenberg_richter.a_value)
     b_value_elem = etree.SubElement(
         truncatd_gutenberg_rich_elem, nrml_xml.B_VALUE)
     b_value_elem.text = \
-        str(truncated_gutenberg_richter.b_value)
+        repr(truncated_gutenberg_richter.b_value)
 
     min_magnitude_elem = etree.SubElement(
         truncatd_gutenberg_rich_elem, nrml_xml.MIN_MAGNITUDE)
     min_magnitude_elem.text = \
-        str(truncated_gutenberg_richter.min_magnitude)
+        repr(truncated_gutenberg_richter.min_magnitude)
 
     max_magnitude_elem = etree.SubElement(
         truncatd_gutenberg_rich_elem, nrml_xml.MAX_MAGNITUDE)
     max_magnitude_elem.text = \
-        str(truncated_gutenberg_richter.max_magnitude)
+        repr(truncated_gutenberg_richter.max_magnitude)
 
 
 def _write_rupture_depth_distrib(container_elem,
@@ -270,3 +369,64 @@ def _write_rupture_depth_distrib(container_elem,
     depth_elem.text = ' '.join(
         (str(value) for value in
             rupture_depth_dist.depth))
+
+
+def _write_evenly_discretized_mfd(container_elem, mfd):
+    """
+    Attach an evenly discretized incremental
+    mfd element to the element container.
+    :param container_elem: element which contains the mfd
+    :type container_elem: lxml.etree._Element
+    :param mfd: evenly discretized incremental mfd object
+    :type mfd: py:class::EvenlyDiscretizedIncrementalMFD
+    """
+
+    mfd_elem = etree.SubElement(
+        container_elem, nrml_xml.EVENLY_DISCRETIZED_INC_MFD)
+    mfd_elem.attrib[nrml_xml.BIN_SIZE] = repr(mfd.bin_size)
+    mfd_elem.attrib[nrml_xml.MIN_VAL] = repr(mfd.min_val)
+    mfd_elem.attrib[nrml_xml.TYPE] = mfd.type_mfd
+    mfd_elem.text = ' '.join(
+        (repr(value) for value in mfd.values))
+
+
+def _write_simple_fault_geometry(container_elem, geometry):
+    """
+    Attach a simple fault geometry element
+    to the element container.
+    :param container_elem: element which contains the geometry
+    :type container_elem: lxml.etree._Element
+    :param geometry: simple fault geometry object
+    :type geometry: py:class::SimpleFaultGeometry
+    """
+
+    geometry_elem = etree.SubElement(
+        container_elem, nrml_xml.SIMPLE_FAULT_GEOMETRY)
+    geometry_elem.attrib[nrml_xml.GML_ID] = geometry.geometry_id
+
+    fault_trace_elem = etree.SubElement(
+        geometry_elem, nrml_xml.FAULT_TRACE)
+    line_string_elem = etree.SubElement(
+        fault_trace_elem, nrml_xml.LINE_STRING)
+    line_string_elem.attrib[nrml_xml.SRS_NAME] = geometry.srs_name
+
+    pos_list_elem = etree.SubElement(
+        line_string_elem, nrml_xml.POS_LIST)
+    # Coordinates with depth need the dimension, the
+    # reader assumes (lon, lat) otherwise
+    dimension = len(geometry.fault_trace[0])
+    if dimension != 2:
+        pos_list_elem.attrib[nrml_xml.SRS_DIMENSION] = str(dimension)
+    pos_list_elem.text = ' '.join(
+        (repr(value) for point in geometry.fault_trace for value in point))
+
+    dip_elem = etree.SubElement(geometry_elem, nrml_xml.DIP)
+    dip_elem.text = repr(geometry.dip)
+
+    upper_depth_elem = etree.SubElement(
+        geometry_elem, nrml_xml.UPPER_SEISMOGENIC_DEPTH)
+    upper_depth_elem.text = repr(geometry.upper_seismogenic_depth)
+
+    lower_depth_elem = etree.SubElement(
+        geometry_elem, nrml_xml.LOWER_SEISMOGENIC_DEPTH)
+    lower_depth_elem.text = repr(geometry.lower_seismogenic_depth)
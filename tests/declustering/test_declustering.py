@@ -20,7 +20,10 @@ import unittest
 import numpy as np
 
 from mtoolkit.scientific.declustering import (TDW_GARDNERKNOPOFF,
-    TDW_GRUENTHAL, TDW_UHRHAMMER, gardner_knopoff_decluster, afteran_decluster)
+    TDW_GRUENTHAL, TDW_UHRHAMMER, gardner_knopoff_decluster,
+    gardner_knopoff_update, afteran_decluster)
+
+from benchmarks.synthetic import synthetic_catalogue, catalogue_matrix
 
 from tests.declustering.data._declustering_test_data import (
     CATALOG_MATRIX_ALL_IN_A_CLUSTER, CATALOG_MATRIX_NO_CLUSTERS)
@@ -122,3 +125,47 @@ class DeclusteringTestCase(unittest.TestCase):
 
         self.evaluate_results_afteran(self.catalog_matrix_no_clusters,
                 expected_vcl, expected_vmain_shock, expected_flag_vector)
+
+    def test_gardner_knopoff_update_equals_whole_catalogue(self):
+        catalog_matrix = catalogue_matrix(synthetic_catalogue(1000,
+            start_year=1990, region=(10.0, 40.0, 11.0, 41.0), seed=7))
+
+        for tdw in self.time_dist_windows_options:
+            for ftw in [0.0, 0.5, 2.0]:
+                exp_vcl, exp_vmain_shock, exp_flag_vector = \
+                    gardner_knopoff_decluster(catalog_matrix, tdw, ftw)
+
+                for nold in [500, 990]:
+                    vcl, _, flag_vector = gardner_knopoff_decluster(
+                        catalog_matrix[:nold], tdw, ftw)
+
+                    vcl, vmain_shock, flag_vector = gardner_knopoff_update(
+                        catalog_matrix, vcl, flag_vector, tdw, ftw)
+
+                    self.assertTrue(np.array_equal(
+                            exp_flag_vector, flag_vector))
+
+                    self.assertTrue(np.array_equal(
+                            exp_vmain_shock, vmain_shock))
+
+                    # Same clusters, possibly numbered differently
+                    self.assertEqual(len(set(zip(exp_vcl, vcl))),
+                            len(set(exp_vcl)))
+                    self.assertEqual(len(set(exp_vcl)), len(set(vcl)))
+
+    def test_gardner_knopoff_update_keeps_earlier_clusters(self):
+        catalog_matrix = np.vstack([self.catalog_matrix_all_cluster,
+                self.catalog_matrix_no_clusters])
+        catalog_matrix = catalog_matrix[np.lexsort((catalog_matrix[:, 2],
+                catalog_matrix[:, 1], catalog_matrix[:, 0]))]
+        nold = len(catalog_matrix) - 1
+        vcl, _, flag_vector = gardner_knopoff_decluster(
+            catalog_matrix[:nold])
+
+        updated_vcl, _, updated_flag_vector = gardner_knopoff_update(
+            catalog_matrix, vcl, flag_vector)
+
+        self.assertEqual(len(catalog_matrix), len(updated_vcl))
+        self.assertTrue(np.array_equal(vcl, updated_vcl[:nold]))
+        self.assertTrue(np.array_equal(flag_vector,
+                updated_flag_vector[:nold]))
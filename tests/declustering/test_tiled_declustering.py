@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import numpy as np
+
+from mtoolkit.scientific.declustering import (TDW_GARDNERKNOPOFF,
+    TDW_GRUENTHAL, TDW_UHRHAMMER, gardner_knopoff_decluster)
+from mtoolkit.scientific.catalogue_utilities import haversine
+from mtoolkit.tiled_declustering import (gardner_knopoff_tiled,
+                                         spatial_tiles, find, union)
+
+from benchmarks.synthetic import synthetic_catalogue, catalogue_matrix
+
+
+class TiledDeclusteringTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog_matrix = catalogue_matrix(synthetic_catalogue(1500,
+            start_year=1990, region=(-180., -90., 180., 90.), seed=5))
+
+    def assert_serial_result(self, catalog_matrix, window_opt, fs_time_prop,
+                             **kwargs):
+        expected = gardner_knopoff_decluster(catalog_matrix, window_opt,
+            fs_time_prop)
+        result = gardner_knopoff_tiled(catalog_matrix, window_opt,
+            fs_time_prop, **kwargs)
+
+        for expected_array, array in zip(expected, result):
+            self.assertTrue(np.array_equal(expected_array, array))
+
+    def test_tiled_equals_serial(self):
+        for window_opt in (TDW_GARDNERKNOPOFF, TDW_GRUENTHAL, TDW_UHRHAMMER):
+            for fs_time_prop in (0, 0.5):
+                self.assert_serial_result(self.catalog_matrix, window_opt,
+                    fs_time_prop, workers=1, tile_size=5.)
+
+    def test_tiled_in_process_pool(self):
+        self.assert_serial_result(self.catalog_matrix, TDW_GARDNERKNOPOFF,
+            0.5, workers=2, tile_size=20.)
+
+    def test_clusters_across_dateline_and_poles(self):
+        # Aftershocks on the other side of the dateline and of
+        # the north pole, in tiles other than their mainshock
+        catalog_matrix = np.array([
+            [2000, 1, 1, 179.9, 10., 7.0, 0.1],
+            [2000, 1, 5, -179.9, 10.2, 5.0, 0.1],
+            [2000, 1, 6, -179.5, 9.8, 4.5, 0.1],
+            [2001, 3, 1, 30., 89.8, 6.5, 0.1],
+            [2001, 3, 2, -150., 89.8, 4.8, 0.1],
+            [2002, 6, 1, 0., 0., 5.0, 0.1]])
+
+        self.assert_serial_result(catalog_matrix, TDW_GARDNERKNOPOFF, 0,
+            workers=1, tile_size=1.)
+        _, _, flagvector = gardner_knopoff_tiled(catalog_matrix,
+            workers=1, tile_size=1.)
+        self.assertEqual([0, 1, 1, 0, 1, 0], flagvector.tolist())
+
+    def test_halo_includes_events_within_distance(self):
+        longitude = self.catalog_matrix[:, 3]
+        latitude = self.catalog_matrix[:, 4]
+        halo = 500.
+
+        tiles = spatial_tiles(longitude, latitude, 10., halo)
+
+        self.assertEqual(range(len(longitude)),
+            sorted(np.concatenate([core for core, _ in tiles]).tolist()))
+        for core, events in tiles:
+            for event in core[:20]:
+                distance = haversine(longitude, latitude,
+                    longitude[event], latitude[event])
+                nearby = np.nonzero(distance.ravel() <= halo)[0]
+                self.assertTrue(np.all(np.in1d(nearby, events)))
+
+    def test_union_find(self):
+        parent = np.arange(6)
+
+        union(parent, np.array([5, 1, 3]), np.array([3, 4, 0]))
+
+        self.assertEqual([0, 1, 2, 0, 1, 0],
+            find(parent, np.arange(6)).tolist())
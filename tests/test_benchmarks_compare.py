@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.compare import compare, failed, report, main
+from benchmarks.scaling import RESULTS_FORMAT_VERSION, write_results
+
+
+def create_results(revision, measurements):
+    results = []
+    for name, events, wall_time in measurements:
+        if wall_time is None:
+            results.append({'benchmark': name, 'events': events,
+                            'status': 'error', 'error': 'TypeError: '})
+        else:
+            results.append({'benchmark': name, 'events': events,
+                            'status': 'ok', 'wall_time': wall_time,
+                            'cpu_time': wall_time})
+    return {'format': RESULTS_FORMAT_VERSION, 'revision': revision,
+            'timestamp': '2012-05-09T10:00:00', 'results': results}
+
+
+class BenchmarkCompareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.baseline = create_results('abc', [
+            ('stepp_analysis', 1000, 1.0),
+            ('recurrence_analysis', 1000, 0.001),
+            ('afteran_decluster', 1000, 2.0),
+            ('gardner_knopoff_decluster', 1000, None)])
+
+    def test_unchanged_run_passes(self):
+        rows = compare(self.baseline, self.baseline)
+
+        self.assertFalse(failed(rows))
+        self.assertEqual(['ok', 'error', 'ok', 'ok'],
+            [row[-1] for row in rows])
+
+    def test_slowdown_beyond_threshold_fails(self):
+        current = create_results('def', [
+            ('stepp_analysis', 1000, 1.5),
+            ('recurrence_analysis', 1000, 0.003),
+            ('afteran_decluster', 1000, 1.0),
+            ('gardner_knopoff_decluster', 1000, None)])
+
+        rows = dict(((row[0], row[1]), row) for row in
+            compare(self.baseline, current, threshold=0.25))
+
+        self.assertEqual('REGRESSION', rows['stepp_analysis', 1000][-1])
+        self.assertAlmostEqual(1.5, rows['stepp_analysis', 1000][4])
+        # Below the absolute noise floor
+        self.assertEqual('ok', rows['recurrence_analysis', 1000][-1])
+        self.assertEqual('improvement', rows['afteran_decluster', 1000][-1])
+        self.assertTrue(failed(rows.values()))
+        self.assertTrue('Performance gate FAILED: stepp_analysis' in
+            report(rows.values(), self.baseline, current))
+
+    def test_slowdown_within_threshold_passes(self):
+        current = create_results('def', [('stepp_analysis', 1000, 1.2)])
+
+        rows = compare(self.baseline, current, threshold=0.25)
+
+        self.assertFalse(failed(rows))
+        self.assertEqual(['missing', 'missing', 'missing', 'ok'],
+            [row[-1] for row in rows])
+
+    def test_broken_benchmark_fails(self):
+        current = create_results('def', [('stepp_analysis', 1000, None),
+            ('stepp_analysis', 5000, 3.0)])
+
+        rows = dict(((row[0], row[1]), row) for row in
+            compare(self.baseline, current))
+
+        self.assertEqual('BROKEN', rows['stepp_analysis', 1000][-1])
+        self.assertEqual('new', rows['stepp_analysis', 5000][-1])
+        self.assertTrue(failed(rows.values()))
+
+    def test_exit_status(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            baseline_file = os.path.join(tmp_dir, 'baseline.json')
+            results_file = os.path.join(tmp_dir, 'results.json')
+            write_results(baseline_file, self.baseline)
+
+            write_results(results_file, self.baseline)
+            self.assertEqual(0, main(['--baseline', baseline_file,
+                '--results', results_file]))
+
+            write_results(results_file, create_results('def',
+                [('afteran_decluster', 1000, 4.0)]))
+            self.assertEqual(1, main(['--baseline', baseline_file,
+                '--results', results_file]))
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import gc
+import unittest
+
+import numpy as np
+
+from mtoolkit.scientific import catalogue_utilities
+from mtoolkit.scientific.catalogue_utilities import (decimal_year,
+                                                     decimal_time,
+                                                     catalogue_features,
+                                                     haversine,
+                                                     haversine_blocks,
+                                                     haversine_one_to_many,
+                                                     within_distance,
+                                                     CountCube)
+from mtoolkit.scientific.completeness import stepp_counts
+from mtoolkit.scientific.recurrence import (recurrence_table,
+                                            weichert_prep)
+
+
+class DecimalTimeTestCase(unittest.TestCase):
+
+    def test_leap_years(self):
+        year = np.array([2000., 2001., 1900., 2004.])
+        month = np.array([3., 3., 3., 12.])
+        day = np.array([1., 1., 1., 31.])
+
+        self.assertTrue(np.allclose(
+            [2000. + 60. / 366., 2001. + 59. / 365., 1900. + 59. / 365.,
+             2004. + 365. / 366.], decimal_time(year, month, day)))
+
+    def test_time_of_day(self):
+        year_dec = decimal_time(np.array([2001.]), np.array([1.]),
+            np.array([2.]), np.array([12.]), np.array([30.]),
+            np.array([36.]))
+
+        self.assertTrue(np.allclose([2001. + (1. + 45036. / 86400.) / 365.],
+            year_dec))
+
+    def test_matches_decimal_year_without_leap_days(self):
+        year = np.array([1999., 2001., 2003.])
+        month = np.array([1., 6., 12.])
+        day = np.array([1., 15., 31.])
+
+        self.assertTrue(np.allclose(decimal_year(year, month, day),
+            decimal_time(year, month, day)))
+
+
+class CatalogueFeaturesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog_matrix = np.array([[2000., 1., 1., 10., 45., 5.0],
+                                        [2000., 6., 1., 11., 46., 6.0],
+                                        [2001., 1., 1., 12., 47., 5.0]])
+
+    def test_features_are_shared(self):
+        features = catalogue_features(self.catalog_matrix)
+
+        self.assertTrue(features is catalogue_features(self.catalog_matrix))
+        self.assertTrue(features.year_dec is features.year_dec)
+        self.assertFalse(features is
+            catalogue_features(self.catalog_matrix.copy()))
+
+    def test_magnitude_order_is_stable(self):
+        features = catalogue_features(self.catalog_matrix)
+
+        self.assertEqual([1, 2, 0], list(features.magnitude_order))
+        self.assertTrue(np.allclose(np.cos(np.radians([45., 46., 47.])),
+            features.cos_latitude))
+
+    def test_features_are_dropped_with_the_catalogue(self):
+        features = catalogue_features(self.catalog_matrix)
+        key = id(self.catalog_matrix)
+        self.assertTrue(key in catalogue_utilities._FEATURES)
+
+        del self.catalog_matrix
+        gc.collect()
+
+        self.assertFalse(key in catalogue_utilities._FEATURES)
+        self.assertTrue(features.catalog_matrix is None)
+
+
+class HaversineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(7)
+        self.lon = rng.uniform(-180., 180., 50)
+        self.lat = rng.uniform(-90., 90., 50)
+
+    def test_haversine_known_distance(self):
+        # A degree of the equator
+        self.assertTrue(np.allclose([[111.19893]],
+            haversine(0., 0., 1., 0.), atol=1e-4))
+
+    def test_blocks_match_whole_matrix(self):
+        distance = haversine(self.lon, self.lat, self.lon[:7], self.lat[:7])
+
+        blocks = list(haversine_blocks(self.lon, self.lat, self.lon[:7],
+            self.lat[:7], block_size=100))
+
+        self.assertEqual([0, 2, 4, 6], [start for start, _ in blocks])
+        self.assertTrue(np.allclose(distance,
+            np.hstack([block for _, block in blocks])))
+        self.assertTrue(np.allclose(0., np.diag(distance[:7])))
+
+    def test_one_to_many(self):
+        lon, lat = np.radians(self.lon), np.radians(self.lat)
+
+        distance = haversine_one_to_many(lon, lat, np.cos(lat), lon[3],
+            lat[3], np.cos(lat[3]))
+
+        self.assertEqual((50,), np.shape(distance))
+        self.assertTrue(np.allclose(
+            haversine(self.lon, self.lat, self.lon[3], self.lat[3])[:, 0],
+            distance))
+
+    def test_within_distance(self):
+        lon, lat = np.radians(self.lon), np.radians(self.lat)
+        distance = haversine(self.lon, self.lat, self.lon[0],
+            self.lat[0])[:, 0]
+
+        for threshold in [0., 2000., 8000., 15000., 30000.]:
+            self.assertTrue(np.array_equal(distance <= threshold,
+                within_distance(lon, lat, np.cos(lat), lon[0], lat[0],
+                    np.cos(lat[0]), threshold)))
+
+
+class CountCubeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(11)
+        self.year = rng.randint(1960, 2000, 300).astype(float)
+        self.mag = np.around(rng.exponential(0.5, 300) + 3., 1)
+        self.cube = CountCube(self.year, self.mag)
+
+    def test_counts_match_columns(self):
+        cube = self.cube
+        year_start = cube.year_index([1970., 1985.5])[:, np.newaxis]
+        mag_start = cube.magnitude_index(3.5)
+        mag_stop = cube.magnitude_index(4.0, 'right')
+
+        expected = [np.sum(np.logical_and.reduce([self.year >= year,
+                                                  self.mag >= 3.5,
+                                                  self.mag <= 4.0]))
+                    for year in [1970., 1985.5]]
+
+        self.assertEqual(expected, list(cube.count(year_start,
+            cube.shape[0], mag_start, mag_stop)[:, 0]))
+
+    def test_extent(self):
+        cube = self.cube
+        selected = np.logical_and(self.year >= 1990., self.mag >= 3.6)
+
+        self.assertEqual((np.min(self.year[selected]),
+                          np.max(self.year[selected]),
+                          np.min(self.mag[selected]),
+                          np.max(self.mag[selected])),
+            cube.extent(cube.year_index(1990.), cube.magnitude_index(3.6)))
+        self.assertRaises(ValueError, cube.extent, 0,
+            cube.magnitude_index(100.))
+
+    def test_shared_cube(self):
+        ctime = np.array([1990., 1975.])
+        cmag = np.array([3.2, 3.8])
+
+        for shared, single in [
+                (stepp_counts(None, None, 0.2, 5, self.cube)['number_obs'],
+                 stepp_counts(self.year, self.mag, 0.2, 5)['number_obs']),
+                (recurrence_table(None, 0.1, None, self.cube),
+                 recurrence_table(self.mag, 0.1, self.year)),
+                (weichert_prep(None, None, ctime, cmag, 0.1, 1,
+                    self.cube)[2],
+                 weichert_prep(self.year, self.mag, ctime, cmag, 0.1, 1)[2])]:
+            self.assertTrue(np.array_equal(single, shared))
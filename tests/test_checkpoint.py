@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock
+
+from mtoolkit.checkpoint import RunCheckpoint
+from mtoolkit.workflow import Context
+
+from tests.helper import create_workflow, run
+from tests.test_scheduler import create_config
+
+
+class Interruption(Exception):
+    pass
+
+
+def interrupt_at(source_number):
+    """Return a job interrupting the run at the given source"""
+
+    processed = []
+
+    def job(context):
+        processed.append(context.cur_sm)
+        if len(processed) == source_number:
+            raise Interruption()
+    return job
+
+
+class RunCheckpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+        self.config = create_config()
+
+    def tearDown(self):
+        shutil.rmtree(self.run_dir)
+
+    def _context(self, resume=False):
+        context = Context()
+        context.config = self.config
+        context.checkpoint = RunCheckpoint(self.run_dir, self.config, resume)
+        return context
+
+    def test_resume_skips_completed_work(self):
+        expected = Context()
+        expected.config = self.config
+        run(create_workflow(self.config), expected)
+
+        interrupted = self._context()
+        workflow = create_workflow(self.config)
+        workflow.processing_pipeline.add_job(interrupt_at(2))
+        self.assertRaises(Interruption, run, workflow, interrupted)
+
+        resumed = self._context(resume=True)
+        workflow = create_workflow(self.config)
+        workflow.preprocessing_pipeline = Mock()
+        processed = []
+        workflow.processing_pipeline.add_job(
+            lambda context: processed.append(context.cur_sm.name))
+        run(workflow, resumed)
+
+        self.assertFalse(workflow.preprocessing_pipeline.run.called)
+        self.assertEqual([expected.sm_definitions[1].name], processed)
+        self.assertEqual(len(expected.sm_definitions),
+            len(resumed.sm_definitions))
+        for expected_sm, resumed_sm in zip(expected.sm_definitions,
+                resumed.sm_definitions):
+            self.assertEqual(expected_sm, resumed_sm)
+            self.assertEqual(expected_sm.rupture_rate_model,
+                resumed_sm.rupture_rate_model)
+            self.assertEqual(expected_sm.max_mag_sigma,
+                resumed_sm.max_mag_sigma)
+
+    def test_new_run_discards_progress(self):
+        context = self._context()
+        run(create_workflow(self.config), context)
+        self.assertEqual(2, len(os.listdir(context.checkpoint.sources_dir)))
+
+        checkpoint = RunCheckpoint(self.run_dir, self.config)
+
+        self.assertEqual([], os.listdir(checkpoint.sources_dir))
+        self.assertFalse(checkpoint.load_preprocessing(Context()))
+
+    def test_resume_requires_checkpoint(self):
+        self.assertRaises(RuntimeError, RunCheckpoint, self.run_dir,
+            self.config, True)
+
+    def test_resume_requires_same_config(self):
+        RunCheckpoint(self.run_dir, self.config)
+        self.config['Stepp']['sensitivity'] = 0.2
+
+        self.assertRaises(RuntimeError, RunCheckpoint, self.run_dir,
+            self.config, True)
+
+    def test_resume_requires_same_input_files(self):
+        catalogue = os.path.join(self.run_dir, 'catalogue.csv')
+        shutil.copy(self.config['eq_catalog_file'], catalogue)
+        self.config['eq_catalog_file'] = catalogue
+        RunCheckpoint(self.run_dir, self.config)
+        # Unchanged input files are resumed
+        RunCheckpoint(self.run_dir, self.config, True)
+
+        # The catalogue is replaced at the same path
+        with open(catalogue, 'a') as catalogue_file:
+            catalogue_file.write('\n')
+
+        self.assertRaises(RuntimeError, RunCheckpoint, self.run_dir,
+            self.config, True)
+
+    def test_truncated_checkpoint_is_ignored(self):
+        checkpoint = RunCheckpoint(self.run_dir, self.config)
+        with open(checkpoint._source_path(0), 'wb') as source_file:
+            source_file.write('\x80\x02')
+
+        self.assertTrue(checkpoint.load_source(0) is None)
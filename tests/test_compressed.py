@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import bz2
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from mtoolkit.compressed import (BackgroundReader, open_input,
+                                 uncompressed_name)
+from mtoolkit.eqcatalog import EqEntryReader
+
+from nrml.nrml_xml import get_data_path, DATA_DIR
+
+
+class BackgroundReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.catalogue_file = get_data_path('ISC_small_data.csv', DATA_DIR)
+        with open(self.catalogue_file) as catalogue:
+            self.data = catalogue.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _compress(self, opener, extension):
+        filename = os.path.join(self.work_dir, 'catalogue.csv' + extension)
+        compressed = opener(filename, 'wb')
+        compressed.write(self.data)
+        compressed.close()
+        return filename
+
+    def test_uncompressed_name(self):
+        self.assertEqual('isc/catalogue.csv',
+            uncompressed_name('isc/catalogue.csv.GZ'))
+        self.assertEqual('isc/catalogue.xml',
+            uncompressed_name('isc/catalogue.xml.xz'))
+        self.assertEqual('isc/catalogue.csv',
+            uncompressed_name('isc/catalogue.csv'))
+
+    def test_read_compressed_files(self):
+        for opener, extension in [(gzip.open, '.gz'), (bz2.BZ2File, '.bz2')]:
+            with open_input(self._compress(opener, extension)) as catalogue:
+                self.assertTrue(isinstance(catalogue, BackgroundReader))
+                self.assertEqual(self.data, catalogue.read())
+
+    def test_read_by_lines_across_chunks(self):
+        filename = self._compress(gzip.open, '.gz')
+
+        with BackgroundReader(filename, gzip.open, chunk_size=7,
+                              queue_size=2) as catalogue:
+            header = catalogue.readline()
+            start = catalogue.read(5)
+            lines = list(catalogue)
+
+        self.assertEqual(self.data.splitlines(True),
+            [header, start + lines[0]] + lines[1:])
+
+    def test_eq_entries_match_uncompressed_file(self):
+        with open(self.catalogue_file) as catalogue:
+            expected = EqEntryReader(catalogue).read_eq_catalog()
+
+        with open_input(self._compress(bz2.BZ2File, '.bz2')) as catalogue:
+            self.assertEqual(expected,
+                EqEntryReader(catalogue).read_eq_catalog())
+
+    def test_close_stops_reading_thread(self):
+        catalogue = BackgroundReader(self._compress(gzip.open, '.gz'),
+            gzip.open, chunk_size=7, queue_size=1)
+        catalogue.readline()
+        catalogue.close()
+
+        self.assertFalse(catalogue._thread.is_alive())
+
+    def test_decompression_error_is_raised(self):
+        filename = os.path.join(self.work_dir, 'catalogue.csv.gz')
+        with open(filename, 'wb') as corrupted:
+            corrupted.write('not compressed')
+
+        with open_input(filename) as catalogue:
+            self.assertRaises(IOError, catalogue.read)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import numpy as np
+
+from mtoolkit.scientific.deduplication import find_duplicates
+
+
+class DeduplicationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Events 1 and 3 are reports of event 0, event
+        # 2 is close in time to event 0 but far from it
+        self.columns = {
+            'Agency': np.array(['ISC', 'GCMT', 'NEIC', 'NEIC', 'ISC'],
+                               dtype=object),
+            'year': np.array([2000., 2000., 2000., 2000., 2000.]),
+            'month': np.array([1., 1., 1., 1., 1.]),
+            'day': np.array([1., 1., 1., 1., 1.]),
+            'hour': np.array([0., 0., 0., 0., 0.]),
+            'minute': np.array([0., 0., 0., 0., 0.]),
+            'second': np.array([10., 30., 10., 5., np.nan]),
+            'longitude': np.array([179.95, -179.95, 10., 179.9, 179.95]),
+            'latitude': np.array([10., 10., 10., 10.1, 10.]),
+            'Mw': np.array([6.0, 6.2, 6.0, 5.0, 6.0])}
+
+    def test_preferred_agency_is_kept(self):
+        duplicate_of = find_duplicates(self.columns, 30., 50.,
+            agencies=['GCMT', 'ISC'])
+
+        self.assertEqual([1, -1, -1, 1, 1], duplicate_of.tolist())
+
+    def test_first_event_is_kept_between_agencies_not_listed(self):
+        duplicate_of = find_duplicates(self.columns, 30., 50.)
+
+        self.assertEqual([-1, 0, -1, 0, 1], duplicate_of.tolist())
+
+    def test_tolerances(self):
+        duplicate_of = find_duplicates(self.columns, 10., 50., 0.5,
+            agencies=['GCMT', 'ISC'])
+
+        # Event 1 is 20 seconds after the others, event 3
+        # has a different magnitude, event 4 is a report of
+        # the same agency as event 0
+        self.assertEqual([-1, -1, -1, -1, -1], duplicate_of.tolist())
+
+    def test_invalid_tolerance_raise_exception(self):
+        self.assertRaises(RuntimeError, find_duplicates, self.columns, 0.,
+            50.)
@@ -16,12 +16,16 @@
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
 
+import os
 import unittest
 import filecmp
 from StringIO import StringIO
 
+import numpy as np
+
 from mtoolkit.eqcatalog import (EqEntryReader, EqEntryWriter,
-                                MalformedCatalogError, EqEntryValidationError)
+                                MalformedCatalogError, EqEntryValidationError,
+                                EqCatalogColumns, is_binary_catalogue)
 
 from nrml.nrml_xml import get_data_path, DATA_DIR
 
@@ -250,3 +254,40 @@ class EqEntryWriterTestCase(unittest.TestCase):
 
         self.assertTrue(filecmp.cmp(self.expected_csv,
             self.pprocessing_result_filename))
+
+    def test_write_columns_as_rows(self):
+        eq_catalog = EqCatalogColumns.from_entries(
+            [self.first_data_row, self.second_data_row])
+        self.writer.write_columns(eq_catalog)
+
+        self.assertTrue(filecmp.cmp(self.expected_csv,
+            self.pprocessing_result_filename))
+
+    def test_write_selected_columns(self):
+        with open(get_data_path('ISC_small_data.csv', DATA_DIR)) as catalogue:
+            eq_entries = EqEntryReader(catalogue).read_eq_catalog()
+        eq_entries[0]['Agency'] = 'A,"B"'
+        eq_entries[1]['hour'] = ''
+        indexes = np.array([0, 1, 4, 7])
+
+        self.writer.write_rows([eq_entries[index] for index in indexes])
+        with open(self.pprocessing_result_filename) as rows_file:
+            expected = rows_file.read()
+
+        self.writer.write_columns(EqCatalogColumns.from_entries(eq_entries),
+            indexes)
+        with open(self.pprocessing_result_filename) as columns_file:
+            self.assertEqual(expected, columns_file.read())
+
+    def test_write_binary(self):
+        binary_filename = get_data_path('out.npz', DATA_DIR)
+        self.addCleanup(os.remove, binary_filename)
+        eq_entries = [self.first_data_row, self.second_data_row]
+        writer = EqEntryWriter(binary_filename)
+
+        writer.write_binary(EqCatalogColumns.from_entries(eq_entries),
+            np.array([1]))
+
+        self.assertTrue(is_binary_catalogue(binary_filename))
+        self.assertEqual([self.second_data_row],
+            list(EqCatalogColumns.load(binary_filename)))
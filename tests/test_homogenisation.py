@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import numpy as np
+
+from mtoolkit.scientific.homogenisation import homogenise_magnitudes
+
+NAN = np.nan
+
+
+class HomogenisationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = {
+            'Agency': np.array(['ISC', 'NEIC', 'ISC', 'EMSC', 'ISC'],
+                               dtype=object),
+            'Mw': np.array([5.0, NAN, NAN, NAN, NAN]),
+            'sigmaMw': np.array([0.1, NAN, NAN, NAN, NAN]),
+            'Ms': np.array([4.0, 5.0, 7.0, NAN, NAN]),
+            'sigmaMs': np.array([0.1, NAN, 0.2, NAN, NAN]),
+            'mb': np.array([NAN, 5.5, 5.0, 4.0, NAN]),
+            'sigmamb': np.array([NAN, 0.1, 0.1, 0.2, NAN]),
+            'ML': np.array([NAN, NAN, NAN, NAN, 3.0]),
+            'sigmaML': np.array([NAN, NAN, NAN, NAN, 0.3])}
+        self.ms_conversion = {'magnitude': 'Ms', 'segments': [
+            {'max_magnitude': 6.2, 'slope': 0.67, 'intercept': 2.07,
+             'sigma': 0.17},
+            {'min_magnitude': 6.2, 'slope': 0.99, 'intercept': 0.08,
+             'sigma': 0.2}]}
+        self.mb_conversion = {'magnitude': 'mb', 'agencies': ['NEIC', 'EMSC'],
+            'segments': [{'slope': 0.85, 'intercept': 1.03, 'sigma': 0.29}]}
+
+    def test_piecewise_conversion(self):
+        mw, sigma_mw, conversion = homogenise_magnitudes(self.columns,
+            [self.ms_conversion])
+
+        self.assertTrue(np.allclose([5.0, 0.67 * 5.0 + 2.07,
+                                     0.99 * 7.0 + 0.08], mw[:3]))
+        self.assertTrue(np.allclose([0.1, 0.17, np.hypot(0.2, 0.99 * 0.2)],
+            sigma_mw[:3]))
+        self.assertTrue(np.all(np.isnan(mw[3:])))
+        self.assertEqual([-1, 0, 0, -1, -1], conversion.tolist())
+
+    def test_conversions_in_order_of_preference(self):
+        mw, _, conversion = homogenise_magnitudes(self.columns,
+            [self.mb_conversion, self.ms_conversion])
+
+        self.assertEqual([-1, 0, 1, 0, -1], conversion.tolist())
+        self.assertTrue(np.allclose([0.85 * 5.5 + 1.03, 0.99 * 7.0 + 0.08,
+                                     0.85 * 4.0 + 1.03], mw[1:4]))
+
+    def test_conversion_outside_segments(self):
+        self.ms_conversion['segments'] = self.ms_conversion['segments'][1:]
+        mw, _, conversion = homogenise_magnitudes(self.columns,
+            [self.ms_conversion])
+
+        self.assertEqual([-1, -1, 0, -1, -1], conversion.tolist())
+        self.assertTrue(np.isnan(mw[1]))
+
+    def test_invalid_magnitude_raise_exception(self):
+        self.assertRaises(RuntimeError, homogenise_magnitudes, self.columns,
+            [{'magnitude': 'Mj', 'segments': []}])
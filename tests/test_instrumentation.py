@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from mtoolkit.instrumentation import (JobMetrics, count_events,
+                                      CPU_TIME_SCOPE, SUMMARY_NOTES)
+from mtoolkit.workflow import Context
+
+
+def halve_catalog(context):
+    context.working_catalog = context.working_catalog[::2]
+
+
+class JobMetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.context = Context()
+        self.context.working_catalog = np.zeros((10, 7))
+        self.metrics = JobMetrics()
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_measure_records_events(self):
+        record = self.metrics.measure(halve_catalog, self.context)
+
+        self.assertEqual('halve_catalog', record['job'])
+        self.assertEqual(None, record['source'])
+        self.assertEqual(10, record['events_in'])
+        self.assertEqual(5, record['events_out'])
+        self.assertTrue(record['wall_time'] >= 0)
+        self.assertEqual([record], self.metrics.records)
+
+    def test_filtered_events_are_counted_during_processing(self):
+        self.context.cur_sm = object()
+        self.context.current_filtered_eq = np.zeros((3, 7))
+
+        self.assertEqual(3, count_events(self.context))
+
+    def test_write_json_lines(self):
+        self.metrics.measure(halve_catalog, self.context)
+        self.metrics.measure(halve_catalog, self.context)
+        filename = os.path.join(self.output_dir, 'metrics.jsonl')
+        self.metrics.write(filename)
+
+        records = [json.loads(line) for line in open(filename)]
+
+        self.assertEqual(2, len(records))
+        self.assertEqual(3, records[1]['events_out'])
+
+    def test_summary_aggregates_by_job(self):
+        self.metrics.measure(halve_catalog, self.context)
+        self.metrics.measure(halve_catalog, self.context)
+        summary_lines = self.metrics.summary().splitlines()
+
+        self.assertEqual(2 + len(SUMMARY_NOTES), len(summary_lines))
+        self.assertEqual(['halve_catalog', '2'], summary_lines[1].split()[:2])
+
+    @unittest.skipIf(CPU_TIME_SCOPE != 'thread',
+                     'cpu time per thread is unsupported')
+    def test_cpu_time_of_concurrent_jobs_is_not_shared(self):
+        stop = threading.Event()
+
+        def busy():
+            while not stop.is_set():
+                sum(xrange(1000))
+
+        def wait(context):
+            stop.wait(0.3)
+
+        thread = threading.Thread(target=busy)
+        thread.start()
+        try:
+            record = self.metrics.measure(wait, self.context)
+        finally:
+            stop.set()
+            thread.join()
+
+        self.assertEqual('thread', record['cpu_time_scope'])
+        self.assertTrue(record['cpu_time'] < 0.1)
@@ -21,8 +21,20 @@ from mock import Mock
 
 import numpy as np
 
+import os
+
+import sys
+
+import subprocess
+
+import gzip
+
+import shutil
+
 import filecmp
 
+import tempfile
+
 import unittest
 
 from tests.helper import create_context
@@ -34,14 +46,21 @@ from mtoolkit.source_model import (AreaSource, AREA_BOUNDARY, POINT,
                                     RUPTURE_DEPTH_DISTRIB,
                                     default_area_source)
 
+from mtoolkit.scientific.declustering import (gardner_knopoff_decluster,
+                                              gardner_knopoff_update)
+
+from mtoolkit.scientific.catalogue_utilities import catalogue_features
+
 from mtoolkit.jobs import (read_eq_catalog, read_source_model,
+                           create_catalog_matrix,
                            gardner_knopoff, afteran, stepp,
                            store_preprocessed_catalog,
                            store_completeness_table,
                            retrieve_completeness_table,
                            recurrence,
                            create_default_source_model,
-                           maximum_magnitude)
+                           maximum_magnitude, homogenisation,
+                           deduplication, smoothed_seismicity)
 
 from nrml.nrml_xml import get_data_path, DATA_DIR
 
@@ -76,6 +95,76 @@ class JobsTestCase(unittest.TestCase):
         self.assertEqual(expected_first_eq_entry,
                 self.context_jobs.eq_catalog[0])
 
+    def test_read_quakeml_eq_catalog(self):
+        self.context_jobs.config['eq_catalog_file'] = get_data_path(
+            'quakeml_catalogue.xml', DATA_DIR)
+        read_eq_catalog(self.context_jobs)
+        create_catalog_matrix(self.context_jobs)
+
+        self.assertEqual(3, len(self.context_jobs.eq_catalog))
+        self.assertEqual([1, 2, 4], [eq_entry['eventID'] for eq_entry
+                                     in self.context_jobs.eq_catalog])
+        self.assertTrue(np.allclose(
+            [[2000, 1, 2, 7.282, 44.368, 1.71, 0.355],
+             [2000, 1, 5, 11.988, 44.318, 3.89, 0.199],
+             [2000, 1, 6, 11.837, 38.343, 3.98, 0.0]],
+            self.context_jobs.catalog_matrix))
+
+    def test_homogenisation(self):
+        self.context_jobs.config['eq_catalog_file'] = get_data_path(
+            'homogenisation_catalogue.csv', DATA_DIR)
+        self.context_jobs.config['Homogenisation'] = {'conversions': [
+            {'magnitude': 'Ms', 'segments': [
+                {'max_magnitude': 6.2, 'slope': 0.67, 'intercept': 2.07,
+                 'sigma': 0.17}]},
+            {'magnitude': 'mb', 'segments': [
+                {'slope': 0.85, 'intercept': 1.03, 'sigma': 0.29}]},
+            {'magnitude': 'ML', 'agencies': ['FFG'], 'segments': [
+                {'slope': 1.0, 'intercept': 0.0, 'sigma': 0.2}]}]}
+        read_eq_catalog(self.context_jobs)
+        homogenisation(self.context_jobs)
+        create_catalog_matrix(self.context_jobs)
+
+        # Event 1 has only a ML of an agency without conversions
+        eq_catalog = self.context_jobs.eq_catalog
+        self.assertEqual(range(2, 11), list(eq_catalog.column('eventID')))
+        self.assertTrue(np.allclose([4.26, 2.1, 3.98, 2.54, 1.81, 2.12,
+                                     5.018, 3.52, 1.71],
+            self.context_jobs.catalog_matrix[:, 5]))
+        self.assertTrue(np.allclose([np.hypot(0.29, 0.085), np.hypot(0.2, 0.1),
+                                     0.199],
+            eq_catalog.column('sigmaMw')[[0, 1, 2]]))
+
+    def test_deduplication(self):
+        self.context_jobs.config['eq_catalog_file'] = get_data_path(
+            'duplicates_catalogue.csv', DATA_DIR)
+        self.context_jobs.config['Deduplication'] = {'time_window': 10,
+            'distance_window': 20, 'magnitude_window': 0.3,
+            'agencies': ['BBB']}
+        read_eq_catalog(self.context_jobs)
+        deduplication(self.context_jobs)
+
+        # Events 2 and 8 are reported by BBB too, event
+        # 13 is a second report of the same agency
+        self.assertEqual([1, 3, 4, 5, 6, 7, 9, 10, 11, 12, 13],
+            list(self.context_jobs.eq_catalog.column('eventID')))
+
+    def test_read_compressed_eq_catalog(self):
+        read_eq_catalog(self.context_jobs)
+        expected = self.context_jobs.eq_catalog
+
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        compressed_file = os.path.join(work_dir, 'ISC_small_data.csv.gz')
+        with open(self.context_jobs.config['eq_catalog_file']) as catalogue:
+            compressed = gzip.open(compressed_file, 'wb')
+            compressed.write(catalogue.read())
+            compressed.close()
+        self.context_jobs.config['eq_catalog_file'] = compressed_file
+        read_eq_catalog(self.context_jobs)
+
+        self.assertEqual(list(expected), list(self.context_jobs.eq_catalog))
+
     def test_read_smodel(self):
         asource = AreaSource()
         asource.nrml_id = "n1"
@@ -108,6 +197,33 @@ class JobsTestCase(unittest.TestCase):
         self.assertEqual(asource,
                 self.context_jobs.sm_definitions[0])
 
+    def test_read_smodel_split_across_files(self):
+        area_source = get_data_path('area_source_model.xml', DATA_DIR)
+        area_sources = get_data_path('area_sources.xml', DATA_DIR)
+        self.context_jobs.config['source_model_file'] = [area_sources,
+            area_source]
+        read_source_model(self.context_jobs)
+
+        self.assertEqual(3, len(self.context_jobs.sm_definitions))
+        self.assertEqual('sm1',
+            self.context_jobs.sm_definitions[0].source_model_id)
+
+    def test_read_smodel_glob_pattern(self):
+        self.context_jobs.config['source_model_file'] = get_data_path(
+            'area_source*.xml', DATA_DIR)
+        read_source_model(self.context_jobs)
+
+        self.assertEqual(5, len(self.context_jobs.sm_definitions))
+
+    def test_read_smodel_keeps_every_source_type(self):
+        self.context_jobs.config['source_model_file'] = get_data_path(
+            'point_and_fault_sources.xml', DATA_DIR)
+        read_source_model(self.context_jobs)
+
+        self.assertEqual(['AreaSource', 'PointSource', 'SimpleFaultSource',
+            'SimpleFaultSource'], [type(sm).__name__
+            for sm in self.context_jobs.sm_definitions])
+
     def test_create_default_source_model(self):
         default_as = [default_area_source()]
         create_default_source_model(self.context_jobs)
@@ -123,6 +239,100 @@ class JobsTestCase(unittest.TestCase):
 
         mocked_func.assert_called_with(None, 'GardnerKnopoff', 0.5)
 
+    def test_gardner_knopoff_in_tiles(self):
+        mocked_func = Mock(return_value=([], [], []))
+        self.context_jobs.map_sc['gardner_knopoff_tiled'] = mocked_func
+        self.context_jobs.config['declustering_workers'] = 2
+        gardner_knopoff(self.context_jobs)
+
+        mocked_func.assert_called_with(None, 'GardnerKnopoff', 0.5,
+            workers=2)
+
+        self.context_jobs.config['declustering_tile_size'] = 5.
+        gardner_knopoff(self.context_jobs)
+
+        mocked_func.assert_called_with(self.context_jobs.working_catalog,
+            'GardnerKnopoff', 0.5, workers=2, tile_size=5.)
+
+    def test_import_of_jobs_is_light(self):
+        modules = subprocess.check_output([sys.executable, '-c',
+            'import sys, mtoolkit.jobs; print " ".join(sys.modules)'])
+
+        for module in ['lxml', 'scipy', 'mtoolkit.tiled_declustering',
+                       'mtoolkit.scientific.declustering']:
+            self.assertFalse(module in modules.split(), module)
+
+    def test_gardner_knopoff_incremental(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.context_jobs.config['declustering_cache_file'] = os.path.join(
+            cache_dir, 'declustering_cache.npz')
+        read_eq_catalog(self.context_jobs)
+        create_catalog_matrix(self.context_jobs)
+        catalog_matrix = self.context_jobs.catalog_matrix
+        full_run = Mock(side_effect=gardner_knopoff_decluster)
+        update = Mock(side_effect=gardner_knopoff_update)
+        self.context_jobs.map_sc['gardner_knopoff'] = full_run
+        self.context_jobs.map_sc['gardner_knopoff_update'] = update
+
+        # The cached events keep their origin time
+        self.context_jobs.working_catalog = catalog_matrix[:8]
+        catalogue_features(self.context_jobs.working_catalog,
+            *[np.nan_to_num(self.context_jobs.eq_catalog.column(column))[:8]
+              for column in ['hour', 'minute', 'second']])
+        gardner_knopoff(self.context_jobs)
+        self.context_jobs.working_catalog = catalog_matrix
+        gardner_knopoff(self.context_jobs)
+
+        self.assertEqual(1, full_run.call_count)
+        self.assertEqual(1, update.call_count)
+        _, expected_vmain_shock, expected_flag_vector = \
+            gardner_knopoff_decluster(catalog_matrix, 'GardnerKnopoff', 0.5)
+        self.assertTrue(np.array_equal(expected_flag_vector,
+            self.context_jobs.flag_vector))
+        self.assertTrue(np.array_equal(expected_vmain_shock,
+            self.context_jobs.working_catalog))
+
+        # A catalogue which doesn't extend the cached one
+        # is declustered again as a whole
+        self.context_jobs.working_catalog = catalog_matrix[1:]
+        gardner_knopoff(self.context_jobs)
+
+        self.assertEqual(2, full_run.call_count)
+        self.assertEqual(1, update.call_count)
+
+    def test_gardner_knopoff_cache_checks_the_time_of_events(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.context_jobs.config['declustering_cache_file'] = os.path.join(
+            cache_dir, 'declustering_cache.npz')
+        read_eq_catalog(self.context_jobs)
+        create_catalog_matrix(self.context_jobs)
+        catalog_matrix = self.context_jobs.catalog_matrix
+        full_run = Mock(side_effect=gardner_knopoff_decluster)
+        update = Mock(side_effect=gardner_knopoff_update)
+        self.context_jobs.map_sc['gardner_knopoff'] = full_run
+        self.context_jobs.map_sc['gardner_knopoff_update'] = update
+        hour = np.zeros(len(catalog_matrix))
+
+        for _ in xrange(2):
+            self.context_jobs.working_catalog = catalog_matrix.copy()
+            catalogue_features(self.context_jobs.working_catalog, hour)
+            gardner_knopoff(self.context_jobs)
+
+        self.assertEqual(1, full_run.call_count)
+        self.assertEqual(1, update.call_count)
+
+        # Same catalogue matrix, a different origin
+        # time of an event already declustered
+        hour[0] = 12.
+        self.context_jobs.working_catalog = catalog_matrix.copy()
+        catalogue_features(self.context_jobs.working_catalog, hour)
+        gardner_knopoff(self.context_jobs)
+
+        self.assertEqual(2, full_run.call_count)
+        self.assertEqual(1, update.call_count)
+
     def test_parameters_afteran(self):
         mocked_func = Mock(return_value=([], [], []))
         self.context_jobs.map_sc['afteran'] = mocked_func
@@ -170,6 +380,26 @@ class JobsTestCase(unittest.TestCase):
         self.assertTrue(filecmp.cmp(self.expected_preprocessed_catalogue,
                 self.context_jobs.config['pprocessing_result_file']))
 
+    def test_store_catalog_in_binary_format(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        self.context_jobs.config['pprocessing_result_file'] = os.path.join(
+            work_dir, 'preprocessed_catalogue.npz')
+        self.context_jobs.selected_eq_vector = np.array(
+            [0, 0, 0, 1, 1, 0, 1, 0, 1, 0])
+        read_eq_catalog(self.context_jobs)
+        self.context_jobs.catalog_matrix = self.context_jobs.eq_catalog
+        expected = [eq_entry for eq_entry, selected in
+                    zip(self.context_jobs.eq_catalog,
+                        self.context_jobs.selected_eq_vector) if not selected]
+        store_preprocessed_catalog(self.context_jobs)
+
+        self.context_jobs.config['eq_catalog_file'] = \
+            self.context_jobs.config['pprocessing_result_file']
+        read_eq_catalog(self.context_jobs)
+
+        self.assertEqual(expected, list(self.context_jobs.eq_catalog))
+
     def test_store_completeness_table(self):
         self.context_jobs.completeness_table = np.array([
             [1991., 4.], [1991., 4.2], [1961., 4.4],
@@ -197,6 +427,43 @@ class JobsTestCase(unittest.TestCase):
         self.assertTrue(np.array_equal(expected_table,
             self.context_jobs.completeness_table))
 
+    def test_smoothed_seismicity(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        self.context_jobs.config['SmoothedSeismicity'] = {'cell_size': 0.1,
+            'bandwidth': 10., 'output_file': os.path.join(work_dir,
+                                                          'smoothed.csv')}
+        cur_sm = default_area_source()
+        cur_sm.area_source_id = 'src_1'
+        cur_sm.area_boundary = AREA_BOUNDARY('urn:ogc:def:crs:EPSG::4326',
+            [10., 44., 12., 44., 12., 46., 10., 46.])
+        cur_sm.rupture_rate_model = cur_sm.rupture_rate_model._replace(
+            truncated_gutenberg_richter=TRUNCATED_GUTEN_RICHTER(
+                2., 1., 4., 7., 'Mw'))
+        self.context_jobs.cur_sm = cur_sm
+        self.context_jobs.completeness_table = np.array([[1990., 4.],
+                                                         [1960., 5.]])
+        # Events 2 and 3 are below the completeness
+        self.context_jobs.current_filtered_eq = np.array([
+            [2000, 1, 1, 11., 45., 4.5, 0.1],
+            [1950, 1, 1, 10.5, 44.5, 4.5, 0.1],
+            [2000, 1, 1, 10.5, 44.5, 3.5, 0.1]])
+        smoothed_seismicity(self.context_jobs)
+
+        cells = self.context_jobs.smoothed_seismicity
+        self.assertAlmostEqual(2., cells[:, 2].sum())
+        self.assertTrue(np.allclose(np.log10(cells[:, 2]) + 4.,
+                                    cells[:, 3]))
+        self.assertTrue(np.all((cells[:, 0] > 10.) & (cells[:, 0] < 12.) &
+                               (cells[:, 1] > 44.) & (cells[:, 1] < 46.)))
+        self.assertTrue(np.allclose([11.05, 45.05],
+                                    cells[np.argmax(cells[:, 2]), :2]))
+
+        stored = np.genfromtxt(os.path.join(work_dir, 'smoothed_src_1.csv'),
+            delimiter=',', names=True)
+        self.assertEqual(len(cells), len(stored))
+        self.assertTrue(np.allclose(cells[:, 2], stored['rate']))
+
     def test_param_maximum_magnitude(self):
         self.context_jobs.current_filtered_eq = np.array(
             [[1, 2, 3, 4, 5, 6, 7]])
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import pstats
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import yaml
+
+from mtoolkit.profiling import JobProfiler, DEFAULT_TOP_FUNCTIONS
+from mtoolkit.workflow import Context
+from mtoolkit.jobs import logged_job
+from mtoolkit.console import build_cmd_parser
+
+
+@logged_job
+def square_job(context):
+    context.number = context.number ** 2
+
+
+class JobProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.context = Context()
+        self.context.number = 2
+        self.context.profiler = JobProfiler(self.output_dir, 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_jobs_run_under_profiler(self):
+        square_job(self.context)
+        square_job(self.context)
+
+        self.assertEqual(16, self.context.number)
+        self.assertEqual(['square_job'], self.context.profiler.job_order)
+
+    def test_write_profiles_and_report(self):
+        square_job(self.context)
+        report_path = self.context.profiler.write()
+        profile_path = os.path.join(self.output_dir, 'square_job.prof')
+
+        self.assertTrue(os.path.exists(profile_path))
+        self.assertTrue(pstats.Stats(profile_path).total_calls > 0)
+        self.assertTrue('square_job' in open(report_path).read())
+
+    def test_profile_option(self):
+        parser = build_cmd_parser()
+
+        args = parser.parse_args(['-i', 'config.yml', '--profile'])
+        self.assertEqual('profile', args.profile_dir)
+
+        args = parser.parse_args(['-i', 'config.yml'])
+        self.assertEqual(None, args.profile_dir)
+        self.assertEqual(DEFAULT_TOP_FUNCTIONS, args.profile_top)
+
+    def test_profile_of_a_failed_run_is_written(self):
+        config_file = os.path.join(self.output_dir, 'config.yml')
+        with open(config_file, 'w') as config:
+            yaml.dump({'eq_catalog_file': os.path.join(self.output_dir,
+                                                       'missing.csv'),
+                       'source_model_file': None,
+                       'pprocessing_result_file': None,
+                       'completeness_table_file': None,
+                       'result_file': None,
+                       'apply_processing_jobs': False,
+                       'preprocessing_jobs': None,
+                       'processing_jobs': None}, config)
+        profile_dir = os.path.join(self.output_dir, 'profile')
+        main = os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), 'main.py')
+
+        with open(os.devnull, 'w') as devnull:
+            status = subprocess.call([sys.executable, main, '-i',
+                config_file, '--profile', profile_dir], stderr=devnull,
+                stdout=devnull)
+
+        self.assertNotEqual(0, status)
+        self.assertTrue(os.path.exists(os.path.join(profile_dir,
+                                                    'read_eq_catalog.prof')))
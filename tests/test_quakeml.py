@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import unittest
+from StringIO import StringIO
+
+import numpy as np
+
+from mtoolkit.eqcatalog import EqEntryReader, EqCatalogColumns
+from mtoolkit.quakeml import QuakeMLReader, is_quakeml
+
+from nrml.nrml_xml import get_data_path, DATA_DIR
+
+
+def quakeml(events):
+    return StringIO('<quakeml xmlns="http://quakeml.org/xmlns/quakeml/1.1">'
+        '<eventParameters>%s</eventParameters></quakeml>' % events)
+
+
+class QuakeMLReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.catalogue_file = get_data_path('quakeml_catalogue.xml',
+            DATA_DIR)
+
+        with open(get_data_path('ISC_small_data.csv', DATA_DIR)) as csv_file:
+            self.first_csv_entry = EqEntryReader(csv_file).read().next()
+
+    def test_is_quakeml(self):
+        self.assertTrue(is_quakeml('isc/Catalogue.XML'))
+        self.assertTrue(is_quakeml('isc/catalogue.quakeml'))
+        self.assertFalse(is_quakeml('isc/catalogue.csv'))
+
+    def test_event_matches_csv_entry(self):
+        reader = QuakeMLReader(self.catalogue_file)
+
+        self.assertEqual(self.first_csv_entry, reader.read().next())
+
+    def test_preferred_origin_and_magnitude(self):
+        eq_entries = list(QuakeMLReader(self.catalogue_file).read())
+
+        self.assertEqual(20000105132157, eq_entries[1]['Identifier'])
+        self.assertEqual('AAA', eq_entries[1]['Agency'])
+        self.assertEqual((44.318, 11.988, 7.9),
+            (eq_entries[1]['latitude'], eq_entries[1]['longitude'],
+             eq_entries[1]['depth']))
+        self.assertEqual((3.89, 0.199), (eq_entries[1]['Mw'],
+            eq_entries[1]['sigmaMw']))
+        self.assertEqual(3.8, eq_entries[1]['mb'])
+
+    def test_events_without_mw_are_skipped(self):
+        reader = QuakeMLReader(self.catalogue_file)
+        eq_entries = list(reader.read())
+
+        self.assertEqual([1, 2, 4], [eq_entry['eventID']
+                                     for eq_entry in eq_entries])
+        self.assertEqual(1, reader.skipped)
+        self.assertEqual(0.0, eq_entries[2]['sigmaMw'])
+
+    def test_events_without_mw_are_read_when_not_required(self):
+        reader = QuakeMLReader(self.catalogue_file, require_mw=False)
+        eq_entries = list(reader.read())
+
+        self.assertEqual([1, 2, 3, 4], [eq_entry['eventID']
+                                        for eq_entry in eq_entries])
+        self.assertEqual('', eq_entries[2]['Mw'])
+        self.assertEqual(0, reader.skipped)
+
+    def test_event_without_public_id(self):
+        eq_entry = QuakeMLReader(quakeml('<event><origin>'
+            '<time><value>-250-03-01T00:00:00</value></time>'
+            '<latitude><value>40</value></latitude>'
+            '<longitude><value>15</value></longitude>'
+            '<depth><value>5000</value></depth></origin>'
+            '<magnitude><mag><value>6</value></mag><type>Mw</type>'
+            '</magnitude></event>')).read().next()
+
+        self.assertEqual((1, 1), (eq_entry['eventID'],
+            eq_entry['Identifier']))
+        self.assertEqual((-250, 3, 1), (eq_entry['year'], eq_entry['month'],
+            eq_entry['day']))
+        self.assertEqual('', eq_entry['Agency'])
+
+    def test_read_eq_catalog_by_columns(self):
+        reader = QuakeMLReader(self.catalogue_file)
+        eq_catalog = reader.read_eq_catalog()
+
+        self.assertTrue(isinstance(eq_catalog, EqCatalogColumns))
+        self.assertEqual(list(reader.read()), list(eq_catalog))
+        self.assertTrue(np.allclose([1.71, 3.89, 3.98],
+            eq_catalog.column('Mw')))
+        self.assertTrue(np.isnan(eq_catalog.column('Ms')).all())
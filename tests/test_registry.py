@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import sys
+import subprocess
+import unittest
+from mock import Mock, patch
+
+from mtoolkit.registry import (LazyCallableMap, Registry, Spec, JOBS,
+                               KERNELS, resolve)
+from mtoolkit.jobs import stepp, afteran
+from mtoolkit.scientific.completeness import stepp_analysis
+from mtoolkit.scientific.declustering import afteran_decluster
+from mtoolkit.workflow import (Context, PreprocessingBuilder,
+                                ProcessingBuilder)
+
+from nrml.nrml_xml import get_data_path, DATA_DIR
+
+
+class LazyCallableMapTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.callables = LazyCallableMap({
+            'stepp': 'mtoolkit.scientific.completeness:stepp_analysis',
+            'max': max})
+
+    def test_reference_is_resolved_on_lookup(self):
+        self.assertTrue('stepp' in self.callables)
+        self.assertFalse(self.callables.is_loaded('stepp'))
+        self.assertEqual(stepp_analysis, self.callables['stepp'])
+        self.assertTrue(self.callables.is_loaded('stepp'))
+        self.assertEqual(max, self.callables['max'])
+        self.assertEqual(['max', 'stepp'], sorted(self.callables))
+
+    def test_callables_can_be_replaced(self):
+        self.callables['stepp'] = min
+        self.assertEqual(min, self.callables['stepp'])
+
+        del self.callables['max']
+        self.assertEqual(1, len(self.callables))
+
+    def test_invalid_references(self):
+        self.assertRaises(KeyError, self.callables.__getitem__, 'afteran')
+        self.assertRaises(RuntimeError, resolve,
+            'mtoolkit.scientific.completeness')
+        self.assertRaises(RuntimeError, resolve,
+            'mtoolkit.scientific.completeness:not_defined')
+        self.assertRaises(ImportError, resolve, 'mtoolkit.not_defined:f')
+
+    def test_scientific_functions_are_loaded_when_scheduled(self):
+        context = Context(get_data_path('config_preprocessing.yml',
+            DATA_DIR))
+        PreprocessingBuilder().build(context.config)
+
+        self.assertFalse(any(context.map_sc.is_loaded(name)
+            for name in context.map_sc))
+
+    def test_workflow_import_does_not_load_heavy_modules(self):
+        probe = ("import sys; import mtoolkit.workflow; "
+            "print [m for m in ('scipy', 'shapely', 'lxml', 'nhlib') "
+            "if m in sys.modules]")
+
+        self.assertEqual('[]', subprocess.check_output(
+            [sys.executable, '-c', probe]).strip())
+
+
+def create_entry_point(name, plugin):
+    entry_point = Mock()
+    entry_point.name = name
+    entry_point.load.return_value = plugin
+    return entry_point
+
+
+class RegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fast_stepp = Mock()
+        self.entry_points = [
+            create_entry_point('FastStepp', Spec(None, self.fast_stepp,
+                inputs=['working_catalog'],
+                outputs=['completeness_table'], cost='n')),
+            create_entry_point('Plain', self.fast_stepp)]
+        self.registry = Registry('mtoolkit.test', [
+            Spec('Stepp', 'mtoolkit.jobs:stepp', cost='n'),
+            Spec('Afteran', afteran, cost='n^2')])
+
+    def test_builtin_specs(self):
+        self.assertEqual(['Stepp', 'Afteran'], self.registry.names())
+        self.assertEqual('n^2', self.registry.spec('Afteran').cost)
+        self.assertEqual(stepp, self.registry.spec('Stepp').load())
+        self.assertEqual(None, self.registry.spec('FastStepp'))
+
+        # Every builtin job declares its inputs and outputs
+        for name in JOBS.names():
+            self.assertTrue(JOBS.spec(name).inputs or
+                JOBS.spec(name).outputs)
+            self.assertTrue(JOBS.spec(name).cost)
+        self.assertEqual(('completeness_table',),
+            JOBS.spec('Stepp').outputs)
+        self.assertEqual(afteran_decluster, KERNELS.spec('afteran').load())
+
+    def test_plugins_are_loaded_when_requested(self):
+        with patch('mtoolkit.registry._entry_points',
+                Mock(return_value=self.entry_points)):
+            self.assertEqual(['Stepp', 'Afteran', 'FastStepp', 'Plain'],
+                self.registry.names(plugins=True))
+            callables = self.registry.callable_map()
+            self.assertFalse(self.entry_points[0].load.called)
+
+            self.assertEqual(self.fast_stepp, callables['FastStepp'])
+            self.assertTrue(self.entry_points[0].load.called)
+            self.assertFalse(self.entry_points[1].load.called)
+
+            spec = self.registry.spec('FastStepp')
+            self.assertEqual('FastStepp', spec.name)
+            self.assertEqual(('completeness_table',), spec.outputs)
+            self.assertEqual(self.fast_stepp,
+                self.registry.spec('Plain').load())
+            self.assertRaises(KeyError, callables.__getitem__, 'Unknown')
+
+    def test_builtin_jobs_are_overridden(self):
+        with patch('mtoolkit.registry._entry_points',
+                Mock(return_value=self.entry_points)):
+            callables = self.registry.callable_map({
+                'Stepp': 'FastStepp',
+                'Afteran': 'mtoolkit.jobs:gardner_knopoff'})
+
+            self.assertEqual(self.fast_stepp, callables['Stepp'])
+            self.assertEqual('gardner_knopoff',
+                callables['Afteran'].__name__)
+            self.assertRaises(RuntimeError, self.registry.callable_map,
+                {'Stepp': 'NotRegistered'})
+            self.assertRaises(RuntimeError, self.registry.callable_map,
+                {'Stepp': 42})
+
+    def test_config_overrides(self):
+        context = Context()
+        context.config = {'source_model_file': None,
+            'preprocessing_jobs': ['Stepp'],
+            'pprocessing_result_file': None,
+            'processing_jobs': ['Recurrence'],
+            'jobs': {'Stepp': 'mtoolkit.jobs:afteran',
+                     'Recurrence': 'Stepp'}}
+
+        preprocessing = PreprocessingBuilder().build(context.config)
+        processing = ProcessingBuilder().build(context.config)
+
+        self.assertEqual(afteran, preprocessing.jobs[-1])
+        self.assertEqual(stepp, processing.jobs[0])
+
+    def test_kernels_config_overrides(self):
+        with patch('mtoolkit.workflow.yaml.load', Mock(return_value={
+                'kernels': {'stepp':
+                    'mtoolkit.scientific.declustering:afteran_decluster'}})):
+            context = Context(__file__)
+
+        self.assertEqual(afteran_decluster, context.map_sc['stepp'])
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import unittest
+
+from mtoolkit.scheduler import build_dag, DagScheduler
+from mtoolkit.workflow import Context, PreprocessingBuilder
+
+from tests.helper import create_workflow, run
+
+
+def create_config(pipeline_workers=None):
+    return {'eq_catalog_file': 'tests/data/completeness_input_test.csv',
+            'source_model_file': 'tests/data/area_source_model_processing.xml',
+            'result_file': None,
+            'apply_processing_jobs': True,
+            'pprocessing_result_file': None,
+            'completeness_table_file': None,
+            'pipeline_workers': pipeline_workers,
+            'preprocessing_jobs': ['Afteran', 'Stepp'],
+            'processing_jobs': ['Recurrence', 'MaximumMagnitude'],
+            'Afteran': {'time_dist_windows': 'Uhrhammer',
+                        'time_window': 60.0},
+            'Stepp': {'time_window': 5, 'magnitude_windows': 0.2,
+                      'sensitivity': 0.1, 'increment_lock': True},
+            'Recurrence': {'magnitude_window': 0.2,
+                           'recurrence_algorithm': 'Weichert',
+                           'reference_magnitude': 0.0,
+                           'time_window': 0.2},
+            'MaximumMagnitude': {'maxim_mag_algorithm': 'Kijko_Npg',
+                                 'iteration_tolerance': 1.0E-5,
+                                 'maximum_iterations': 1000,
+                                 'neq': 100,
+                                 'number_samples': 51,
+                                 'number_bootstraps': 100}}
+
+
+class BuildDagTestCase(unittest.TestCase):
+
+    def test_dependencies(self):
+        dependencies = [((), ('catalog',)),
+                        ((), ('sources',)),
+                        (('catalog',), ('table',)),
+                        (('catalog',), ('vector',)),
+                        ((), ('catalog',)),
+                        (('table',), ())]
+
+        # Read after write, write after read, write after write
+        self.assertEqual([set(), set(), set([0]), set([0]),
+            set([0, 2, 3]), set([2])], build_dag(dependencies))
+
+    def test_undeclared_dependencies_are_barriers(self):
+        dependencies = [((), ('a',)), ((), ('b',)), None, ((), ('c',))]
+
+        self.assertEqual([set(), set(), set([0, 1]), set([2])],
+            build_dag(dependencies))
+
+    def test_builtin_pipeline(self):
+        pipeline = PreprocessingBuilder().build(create_config())
+        predecessors = build_dag(pipeline.dependencies)
+
+        # The catalogue and the source model are read concurrently
+        self.assertEqual(set(), predecessors[0])
+        self.assertEqual(set(), predecessors[1])
+        # Stepp runs on the declustered catalogue
+        self.assertTrue(4 in predecessors[5])
+
+
+class DagSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = DagScheduler(2)
+        self.context = Context()
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def test_independent_jobs_overlap(self):
+        first_started = threading.Event()
+        second_started = threading.Event()
+
+        def first(context):
+            first_started.set()
+            context.first = second_started.wait(5)
+
+        def second(context):
+            second_started.set()
+            context.second = first_started.wait(5)
+
+        def third(context):
+            context.third = context.first and context.second
+
+        self.scheduler.run([first, second, third],
+            [((), ('first',)), ((), ('second',)),
+             (('first', 'second'), ('third',))], self.context)
+
+        self.assertTrue(self.context.third)
+
+    def test_dependent_jobs_run_in_order(self):
+        executed = []
+
+        def job(name):
+            def append(context):
+                executed.append(name)
+            return append
+
+        self.scheduler.run([job(1), job(2), job(3)],
+            [((), ('a',)), (('a',), ('a',)), None], self.context)
+
+        self.assertEqual([1, 2, 3], executed)
+
+    def test_job_errors_are_raised(self):
+        executed = []
+
+        def failing(context):
+            raise ValueError('failing job')
+
+        def following(context):
+            executed.append(True)
+
+        self.assertRaises(ValueError, self.scheduler.run,
+            [failing, following], [((), ('a',)), (('a',), ())],
+            self.context)
+        self.assertEqual([], executed)
+
+
+class ConcurrentWorkflowTestCase(unittest.TestCase):
+
+    def test_results_equal_sequential_run(self):
+        sequential = Context()
+        sequential.config = create_config()
+        concurrent = Context()
+        concurrent.config = create_config(pipeline_workers=4)
+
+        run(create_workflow(sequential.config), sequential)
+        run(create_workflow(concurrent.config), concurrent)
+
+        self.assertTrue(concurrent.scheduler is None)
+        self.assertEqual(len(sequential.sm_definitions),
+            len(concurrent.sm_definitions))
+        for expected, actual in zip(sequential.sm_definitions,
+                concurrent.sm_definitions):
+            self.assertEqual(expected.rupture_rate_model,
+                actual.rupture_rate_model)
+            self.assertEqual(expected.recurrence_sigb,
+                actual.recurrence_sigb)
+            self.assertEqual(expected.max_mag_sigma, actual.max_mag_sigma)
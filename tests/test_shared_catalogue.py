@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+from multiprocessing import Pool
+
+import numpy as np
+
+from mtoolkit.shared_catalogue import (SharedCatalogue, close_segments,
+                                       remove_stale_segments, SEGMENT_PREFIX)
+from mtoolkit.scientific.catalogue_utilities import catalogue_features
+
+
+def catalogue_sum(name):
+    shared = SharedCatalogue.attach(name)
+    try:
+        return float(shared.catalog_matrix.sum())
+    finally:
+        shared.close()
+
+
+class SharedCatalogueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog_matrix = np.array([[1990, 1, 1, 10., 40., 5.0, 0.1],
+                                        [1991, 6, 2, 11., 41., 6.0, 0.1],
+                                        [1992, 12, 31, 12., 42., 4.5, 0.1]])
+        catalogue_features(self.catalog_matrix, np.array([0, 12, 23]),
+            np.array([0, 30, 59]), np.array([0., 0., 59.]))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _create(self, arrays=None):
+        return SharedCatalogue.create(self.catalog_matrix, arrays,
+            directory=self.directory)
+
+    def test_attached_arrays_are_read_only_views(self):
+        extra = np.arange(5)
+        with self._create({'extra': extra}) as shared:
+            attached = SharedCatalogue.attach(shared.name)
+
+            self.assertTrue(isinstance(attached.catalog_matrix, np.memmap))
+            self.assertFalse(attached.catalog_matrix.flags.writeable)
+            self.assertTrue(np.array_equal(self.catalog_matrix,
+                attached.catalog_matrix))
+            self.assertTrue(np.array_equal(extra, attached['extra']))
+            attached.close()
+
+    def test_features_are_shared(self):
+        features = catalogue_features(self.catalog_matrix)
+
+        with self._create() as shared:
+            attached = SharedCatalogue.attach(shared.name)
+            attached_features = catalogue_features(attached.catalog_matrix)
+
+            self.assertTrue(np.array_equal(features.year_dec,
+                attached_features.year_dec))
+            self.assertTrue(np.array_equal(features.magnitude_order,
+                attached_features.magnitude_order))
+
+    def test_worker_processes_attach_by_name(self):
+        with self._create() as shared:
+            pool = Pool(2)
+            try:
+                sums = pool.map(catalogue_sum, [shared.name] * 2)
+            finally:
+                pool.close()
+                pool.join()
+
+        self.assertEqual([self.catalog_matrix.sum()] * 2, sums)
+
+    def test_owner_removes_segment(self):
+        shared = self._create()
+        attached = SharedCatalogue.attach(shared.name)
+
+        attached.close()
+        self.assertTrue(os.path.exists(shared.name))
+        shared.close()
+        self.assertFalse(os.path.exists(shared.name))
+
+    def test_close_segments(self):
+        shared = self._create()
+
+        close_segments()
+
+        self.assertFalse(os.path.exists(shared.name))
+
+    def test_close_given_segments(self):
+        kept = self._create()
+        removed = self._create()
+        self.addCleanup(kept.close)
+
+        close_segments([removed.name])
+
+        self.assertTrue(os.path.exists(kept.name))
+        self.assertFalse(os.path.exists(removed.name))
+
+    def test_stale_segments_are_removed(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        stale = os.path.join(self.directory, '%s%d-abc' % (SEGMENT_PREFIX,
+            process.pid))
+        os.mkdir(stale)
+
+        with self._create() as shared:
+            remove_stale_segments(self.directory)
+
+            self.assertFalse(os.path.exists(stale))
+            self.assertTrue(os.path.exists(shared.name))
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import numpy as np
+
+from mtoolkit.scientific.smoothed_seismicity import (smoothed_seismicity,
+                                                     adaptive_bandwidths,
+                                                     inside_polygon,
+                                                     KM_PER_DEGREE)
+
+
+class SmoothedSeismicityTestCase(unittest.TestCase):
+
+    def test_gaussian_kernel(self):
+        longitude, latitude, counts = smoothed_seismicity([10.02, 10.02],
+            [45.02, 45.02], (5, 40, 15, 50), 0.05, 20.)
+
+        self.assertEqual((200, 200), counts.shape)
+        self.assertAlmostEqual(2., counts.sum(), 3)
+        row, column = np.unravel_index(counts.argmax(), counts.shape)
+        self.assertAlmostEqual(10.025, longitude[column])
+        self.assertAlmostEqual(45.025, latitude[row])
+        self.assertTrue(np.allclose(counts[:, column - 10],
+                                    counts[:, column + 10]))
+
+        # Along the latitude the kernel is close to a gaussian of
+        # the bandwidth
+        sigma = 20. / KM_PER_DEGREE
+        expected = np.exp(-(latitude - latitude[row]) ** 2 / (2 * sigma ** 2))
+        self.assertTrue(np.allclose(expected * counts[row, column],
+            counts[:, column], atol=2e-2 * counts[row, column]))
+
+        # and it's wider in degrees along the longitude
+        self.assertTrue(counts[row, column + 10] > counts[row + 10, column])
+
+    def test_grid_is_aligned_to_cells(self):
+        longitude, latitude, counts = smoothed_seismicity([], [],
+            (5.03, 40.01, 5.28, 40.19), 0.1, 20.)
+
+        self.assertTrue(np.allclose([5.05, 5.15, 5.25], longitude))
+        self.assertTrue(np.allclose([40.05, 40.15], latitude))
+        self.assertEqual(0., counts.sum())
+
+    def test_events_outside_the_region_are_smoothed_in(self):
+        _, _, counts = smoothed_seismicity([9.9], [45.], (10, 44, 12, 46),
+            0.1, 20.)
+
+        self.assertTrue(0.2 < counts.sum() < 0.5)
+
+    def test_global_grid_wraps_at_the_dateline(self):
+        longitude, _, counts = smoothed_seismicity([179.99], [0.],
+            (-180, -10, 180, 10), 0.1, 50.)
+
+        self.assertEqual(3600, len(longitude))
+        self.assertAlmostEqual(1., counts.sum(), 3)
+        self.assertAlmostEqual(counts[:, -1].sum(), counts[:, 0].sum(), 2)
+
+    def test_global_grid_wraps_exactly(self):
+        # 49 columns, not a length of a fast FFT, the
+        # first one is centred on the dateline
+        longitude, _, counts = smoothed_seismicity([179.9], [0.],
+            (-180, -40, 180, 40), 360. / 49, 500.)
+
+        self.assertEqual(49, len(longitude))
+        self.assertAlmostEqual(-180., longitude[0])
+        self.assertAlmostEqual(1., counts.sum(), 3)
+        self.assertAlmostEqual(counts[:, -1].sum(), counts[:, 1].sum(), 2)
+
+    def test_global_grid_requires_cells_dividing_360(self):
+        for cell_size in (0.7, 1.1):
+            self.assertRaises(RuntimeError, smoothed_seismicity, [179.9],
+                [0.], (-180, -90, 180, 90), cell_size, 50.)
+
+    def test_adaptive_bandwidths(self):
+        # Neighbours are 0.1 degrees apart, the last event 1 degree
+        longitude = np.array([10., 10.1, 10.2, 11.2])
+        latitude = np.zeros(4)
+
+        bandwidths = adaptive_bandwidths(longitude, latitude, 1)
+
+        self.assertTrue(np.allclose(
+            [0.1, 0.1, 0.1, 1.] * np.array(KM_PER_DEGREE), bandwidths,
+            rtol=1e-6))
+        self.assertTrue(np.all(adaptive_bandwidths(longitude[:2],
+            latitude[:2], 2) > 10000.))
+
+    def test_adaptive_kernel(self):
+        rand = np.random.RandomState(37)
+        longitude = np.append(rand.normal(10., 0.1, 200), 12.)
+        latitude = np.append(rand.normal(45., 0.1, 200), 45.)
+
+        _, _, gaussian = smoothed_seismicity(longitude, latitude,
+            (6, 41, 16, 49), 0.05, 2.)
+        _, _, adaptive = smoothed_seismicity(longitude, latitude,
+            (6, 41, 16, 49), 0.05, 2., 'Adaptive')
+
+        self.assertAlmostEqual(201., adaptive.sum(), 1)
+        # The isolated event is smoothed far more
+        self.assertTrue(adaptive[80, 120] < gaussian[80, 120] / 10.)
+
+    def test_cells_outside_the_polygon_are_discarded(self):
+        vertices = np.array([[10., 44.], [11., 44.], [10.5, 45.]])
+        longitude, latitude, counts = smoothed_seismicity([10.5], [44.5],
+            (9, 43, 12, 46), 0.1, 30., vertices=vertices)
+
+        cell_longitude, cell_latitude = np.meshgrid(longitude, latitude)
+        inside = inside_polygon(cell_longitude, cell_latitude, vertices)
+        self.assertTrue(np.all(counts[~inside] == 0.))
+        self.assertTrue(np.all(counts[inside] > 0.))
+
+    def test_inside_polygon(self):
+        vertices = np.array([[0., 0.], [2., 0.], [2., 2.], [1., 1.],
+                             [0., 2.]])
+
+        self.assertEqual([True, False, True, False],
+            inside_polygon(np.array([0.25, 1., 1.5, 3.]),
+                           np.array([1.5, 1.5, 0.5, 1.]), vertices).tolist())
+
+    def test_invalid_kernel(self):
+        self.assertRaises(RuntimeError, smoothed_seismicity, [0.], [0.],
+            (0, 0, 1, 1), 0.1, 10., 'Triangular')
+        self.assertRaises(RuntimeError, smoothed_seismicity, [0.], [0.],
+            (0, 0, 1, 1), 0.1, 0.)
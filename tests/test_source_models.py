@@ -18,22 +18,33 @@
 
 import unittest
 import os
+import cPickle
+import shutil
+import tempfile
 from lxml import etree
+import numpy as np
 
 from nrml.nrml_xml import get_data_path, DATA_DIR, SCHEMA_DIR
 
-from nrml.reader import NRMLReader
+from nrml.reader import NRMLReader, release_element
 
 from nrml.writer import AreaSourceWriter
 
+from nrml.cache import (SourceModelCache, snapshot_key,
+                        SNAPSHOT_FORMAT_VERSION)
+
 from mtoolkit.source_model import (AreaSource, POINT, AREA_BOUNDARY,
                                     TRUNCATED_GUTEN_RICHTER)
 
 from mtoolkit.source_model import (MAGNITUDE, RUPTURE_RATE_MODEL,
-                                    RUPTURE_DEPTH_DISTRIB)
+                                    RUPTURE_DEPTH_DISTRIB, PointSource,
+                                    SimpleFaultSource, SIMPLE_FAULT_GEOMETRY,
+                                    EVENLY_DISCRETIZED_MFD)
 
 AREA_SOURCE = get_data_path('area_source_model.xml', DATA_DIR)
 AREA_SOURCES = get_data_path('area_sources.xml', DATA_DIR)
+POINT_AND_FAULT_SOURCES = get_data_path('point_and_fault_sources.xml',
+    DATA_DIR)
 INCORRECT_NRML = get_data_path('incorrect_area_source_model.xml', DATA_DIR)
 SCHEMA = get_data_path('nrml.xsd', SCHEMA_DIR)
 
@@ -78,6 +89,45 @@ def create_area_source():
     return asource
 
 
+class AreaSourceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.area_source = create_area_source()
+
+    def test_area_source_has_no_dict(self):
+        self.assertFalse(hasattr(self.area_source, '__dict__'))
+
+    def test_vertices_are_stored_in_an_array(self):
+        expected_vertices = np.array([[-122.5, 37.5], [-121.5, 37.5],
+            [-121.5, 38.5], [-122.5, 38.5]])
+
+        self.assertTrue(np.array_equal(expected_vertices,
+            self.area_source.vertices))
+        self.assertEqual((-122.5, 37.5, -121.5, 38.5),
+            self.area_source.bounding_box)
+
+    def test_area_boundary_provides_points(self):
+        area_boundary = self.area_source.area_boundary
+
+        self.assertEqual("urn:ogc:def:crs:EPSG::4326",
+            area_boundary.srs_name)
+        self.assertEqual(POINT(-121.5, 38.5), area_boundary.pos_list[2])
+
+    def test_new_boundary_resets_polygon(self):
+        self.assertEqual(1.0, self.area_source.polygon.area)
+
+        self.area_source.area_boundary = AREA_BOUNDARY('fake',
+            [POINT(0, 0), POINT(0, 2), POINT(2, 2), POINT(2, 0)])
+
+        self.assertEqual(4.0, self.area_source.polygon.area)
+
+    def test_area_source_pickling(self):
+        self.assertTrue(self.area_source.prepared_polygon)
+        pickled = cPickle.dumps(self.area_source, cPickle.HIGHEST_PROTOCOL)
+
+        self.assertEqual(self.area_source, cPickle.loads(pickled))
+
+
 class NRMLReaderTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -98,6 +148,43 @@ class NRMLReaderTestCase(unittest.TestCase):
             pass
         self.assertEqual(num_expected_area_sources, num_area_sources)
 
+    def test_read_point_and_fault_sources(self):
+        sources = list(NRMLReader(POINT_AND_FAULT_SOURCES, SCHEMA).read())
+
+        self.assertEqual([AreaSource, PointSource, SimpleFaultSource,
+                          SimpleFaultSource], [type(sm) for sm in sources])
+
+        point_source = sources[1]
+        self.assertEqual(('n1', 'sm1', 'src04'), (point_source.nrml_id,
+            point_source.source_model_id, point_source.point_source_id))
+        self.assertEqual(POINT(-122.0, 38.0), point_source.location)
+        self.assertEqual('epsg:4326', point_source.srs_name)
+        self.assertEqual(sources[0].rupture_rate_model,
+            point_source.rupture_rate_model)
+        self.assertEqual(5000.0, point_source.hypocentral_depth)
+
+        fault_source = sources[2]
+        self.assertEqual('ALCS001', fault_source.simple_fault_source_id)
+        self.assertEqual(90.0, fault_source.rake)
+        self.assertEqual(TRUNCATED_GUTEN_RICHTER(3.6786313049897035, 1.0,
+            5.0, 7.0, 'Mw'), fault_source.mfd)
+        self.assertEqual(SIMPLE_FAULT_GEOMETRY('sfg_0',
+            'urn:ogc:def:crs:EPSG::4326',
+            ((19.5417, 40.0925), (19.4654, 40.1496), (19.3891, 40.2067)),
+            37.5, 1.0, 12.0), fault_source.geometry)
+
+        self.assertEqual(EVENLY_DISCRETIZED_MFD(0.1, 5.0,
+            [0.0010614989, 8.8291627E-4, 7.3437777E-4], 'Mw'),
+            sources[3].mfd)
+
+    def test_parsed_elements_are_released(self):
+        root = etree.fromstring('<a><b/><c>text</c><d><e/></d></a>')
+
+        release_element(root[2])
+
+        self.assertEqual(['d'], [child.tag for child in root])
+        self.assertEqual(0, len(root[0]))
+
 
 class AreaSourceWriterTestCase(unittest.TestCase):
 
@@ -122,3 +209,63 @@ class AreaSourceWriterTestCase(unittest.TestCase):
         xml_schema = etree.XMLSchema(etree.parse(SCHEMA))
 
         self.assertTrue(xml_schema.validate(xml_doc))
+
+    def test_serialize_point_and_fault_sources(self):
+        sources = list(NRMLReader(POINT_AND_FAULT_SOURCES, SCHEMA).read())
+        self.as_writer.serialize(sources)
+
+        self.assertEqual(sources,
+            list(NRMLReader(OUTPUT_NRML, SCHEMA).read()))
+
+
+class SourceModelCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = SourceModelCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_missing_snapshot_returns_none(self):
+        self.assertEqual(None, self.cache.load(AREA_SOURCES))
+
+    def test_stored_sources_are_loaded(self):
+        area_sources = [sm for sm in NRMLReader(AREA_SOURCES, SCHEMA).read()]
+        self.cache.store(AREA_SOURCES, area_sources)
+
+        self.assertEqual(area_sources, self.cache.load(AREA_SOURCES))
+
+    def test_stored_point_and_fault_sources_are_loaded(self):
+        sources = list(NRMLReader(POINT_AND_FAULT_SOURCES, SCHEMA).read())
+        self.cache.store(POINT_AND_FAULT_SOURCES, sources)
+
+        self.assertEqual(sources, self.cache.load(POINT_AND_FAULT_SOURCES))
+
+    def test_snapshot_key_depends_on_content(self):
+        self.assertNotEqual(snapshot_key(AREA_SOURCE),
+            snapshot_key(INCORRECT_NRML))
+
+    def test_truncated_snapshot_returns_none(self):
+        self.cache.store(AREA_SOURCE, [create_area_source()])
+        with open(self.cache.snapshot_path(AREA_SOURCE), 'wb') as snapshot:
+            snapshot.write('')
+
+        self.assertEqual(None, self.cache.load(AREA_SOURCE))
+
+    def test_snapshot_of_an_older_layout_returns_none(self):
+        self.cache.store(AREA_SOURCE, [create_area_source()])
+        # A snapshot referring to a class which doesn't exist anymore
+        with open(self.cache.snapshot_path(AREA_SOURCE), 'wb') as snapshot:
+            snapshot.write("cmtoolkit.source_model\nRemovedClass\np0\n.")
+
+        self.assertEqual(None, self.cache.load(AREA_SOURCE))
+
+    def test_snapshot_with_other_attributes_returns_none(self):
+        self.cache.store(AREA_SOURCE, [create_area_source()])
+        with open(self.cache.snapshot_path(AREA_SOURCE), 'wb') as snapshot:
+            cPickle.dump({'format': SNAPSHOT_FORMAT_VERSION,
+                'attributes': [('n1', 'sm1')], 'offsets': [0, 0],
+                'vertices': []}, snapshot)
+
+        self.assertEqual(None, self.cache.load(AREA_SOURCE))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from mtoolkit.sweep import (parameter_grid, sweep_tasks, stepp_grid,
+                            run_sweep)
+from mtoolkit.workflow import Context
+from mtoolkit.scientific.declustering import gardner_knopoff_decluster
+from mtoolkit.scientific.completeness import stepp_analysis
+
+
+def create_config(output_file, workers=1):
+    return {'eq_catalog_file': 'tests/data/completeness_input_test.csv',
+            'GardnerKnopoff': {'time_dist_windows': 'GardnerKnopoff',
+                               'foreshock_time_window': 0},
+            'Stepp': {'time_window': 5, 'magnitude_windows': 0.2,
+                      'sensitivity': 0.1, 'increment_lock': True},
+            'sweep': {'output_file': output_file,
+                      'workers': workers,
+                      'GardnerKnopoff': {
+                          'foreshock_time_window': [0, 0.5]},
+                      'Stepp': {'magnitude_windows': [0.1, 0.2],
+                                'sensitivity': [0.1, 0.2]}}}
+
+
+class ParameterGridTestCase(unittest.TestCase):
+
+    def test_grid_combinations(self):
+        grid = parameter_grid({'a': [1, 2], 'b': [3, 3, 4]}, {'c': 5})
+
+        self.assertEqual([{'a': 1, 'b': 3, 'c': 5},
+                          {'a': 1, 'b': 4, 'c': 5},
+                          {'a': 2, 'b': 3, 'c': 5},
+                          {'a': 2, 'b': 4, 'c': 5}], grid)
+
+    def test_grid_overrides_defaults(self):
+        self.assertEqual([{'a': 1}, {'a': 2}],
+            parameter_grid({'a': [1, 2]}, {'a': 3}))
+
+    def test_sweep_tasks(self):
+        config = create_config(None)
+
+        self.assertEqual(
+            [('GardnerKnopoff', {'time_dist_windows': 'GardnerKnopoff',
+                                 'foreshock_time_window': 0}),
+             ('GardnerKnopoff', {'time_dist_windows': 'GardnerKnopoff',
+                                 'foreshock_time_window': 0.5})],
+            sweep_tasks(config))
+
+        del config['sweep']['GardnerKnopoff']
+        self.assertEqual([(None, {})], sweep_tasks(config))
+
+    def test_stepp_grid_groups_counts(self):
+        groups = stepp_grid(create_config(None))
+
+        self.assertEqual([(0.1, 5), (0.2, 5)],
+            [counts_params for counts_params, _ in groups])
+        self.assertEqual([[0.1, 0.2], [0.1, 0.2]],
+            [[params['sensitivity'] for params in combinations]
+             for _, combinations in groups])
+
+
+class SweepTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.output_file = os.path.join(self.work_dir, 'sweep.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _run(self, workers):
+        context = Context()
+        context.config = create_config(self.output_file, workers)
+        return run_sweep(context)
+
+    def test_sweep_matches_single_runs(self):
+        context = Context()
+        context.config = create_config(self.output_file)
+        rows = run_sweep(context)
+        catalog_matrix = context.catalog_matrix
+
+        for foreshock_time_window in [0, 0.5]:
+            _, vmain_shock, _ = gardner_knopoff_decluster(catalog_matrix,
+                'GardnerKnopoff', foreshock_time_window)
+            for magnitude_windows in [0.1, 0.2]:
+                for sensitivity in [0.1, 0.2]:
+                    expected = stepp_analysis(vmain_shock[:, 0],
+                        vmain_shock[:, 5], magnitude_windows, 5,
+                        sensitivity, True)
+                    table = [(row['completeness_year'],
+                              row['completeness_magnitude'])
+                             for row in rows if
+                             row['GardnerKnopoff.foreshock_time_window'] ==
+                                foreshock_time_window and
+                             row['Stepp.magnitude_windows'] ==
+                                magnitude_windows and
+                             row['Stepp.sensitivity'] == sensitivity]
+
+                    self.assertTrue(np.allclose(expected, table))
+
+    def test_parallel_sweep_matches_serial(self):
+        serial = self._run(workers=1)
+        parallel = self._run(workers=2)
+
+        self.assertEqual(serial, parallel)
+
+    def test_results_file(self):
+        rows = self._run(workers=1)
+
+        with open(self.output_file) as results:
+            header = csv.reader(results).next()
+            written = list(csv.reader(results))
+
+        self.assertEqual(len(rows), len(written))
+        self.assertEqual(['declustering',
+                          'GardnerKnopoff.foreshock_time_window',
+                          'GardnerKnopoff.time_dist_windows',
+                          'Stepp.increment_lock',
+                          'Stepp.magnitude_windows',
+                          'Stepp.sensitivity',
+                          'Stepp.time_window',
+                          'events', 'mainshocks', 'clusters',
+                          'completeness_year', 'completeness_magnitude'],
+            header)
+
+    def test_missing_output_file(self):
+        context = Context()
+        context.config = create_config(None)
+
+        self.assertRaises(RuntimeError, run_sweep, context)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from lxml import etree
+
+from benchmarks.synthetic import (synthetic_catalogue, catalogue_matrix,
+    write_catalogue, synthetic_area_sources, write_area_sources)
+
+from benchmarks.scaling import run_benchmarks
+
+from mtoolkit.eqcatalog import EqEntryReader
+from mtoolkit.scientific.catalogue_utilities import decimal_year
+
+from nrml.nrml_xml import get_data_path, SCHEMA_DIR
+from nrml.reader import NRMLReader
+
+SCHEMA = get_data_path('nrml.xsd', SCHEMA_DIR)
+
+
+class SyntheticCatalogueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_catalogue_is_sorted_and_reproducible(self):
+        columns = synthetic_catalogue(500, seed=3)
+        matrix = catalogue_matrix(columns)
+
+        self.assertEqual((500, 7), matrix.shape)
+        self.assertTrue(np.all(np.diff(decimal_year(
+            matrix[:, 0], matrix[:, 1], matrix[:, 2])) >= 0))
+        self.assertTrue(np.all(columns['Mw'] >= 3.0))
+        self.assertTrue(np.all(columns['Mw'] <= 8.0))
+        self.assertTrue(np.array_equal(matrix,
+            catalogue_matrix(synthetic_catalogue(500, seed=3))))
+
+    def test_written_catalogue_is_valid(self):
+        filename = os.path.join(self.tmp_dir, 'catalogue.csv')
+        columns = synthetic_catalogue(300, seed=5)
+        write_catalogue(filename, columns, chunk_size=70)
+
+        with open(filename) as catalogue_file:
+            entries = list(EqEntryReader(catalogue_file).read())
+
+        self.assertEqual(300, len(entries))
+        self.assertEqual(range(1, 301),
+            [entry['eventID'] for entry in entries])
+        self.assertAlmostEqual(columns['longitude'][42],
+            entries[42]['longitude'], places=4)
+        self.assertEqual(columns['Mw'][42], entries[42]['Mw'])
+
+    def test_written_area_sources_are_valid(self):
+        filename = os.path.join(self.tmp_dir, 'source_model.xml')
+        area_sources = synthetic_area_sources(3, 2)
+        write_area_sources(filename, area_sources)
+
+        xml_schema = etree.XMLSchema(etree.parse(SCHEMA))
+        self.assertTrue(xml_schema.validate(etree.parse(filename)))
+
+        read_sources = list(NRMLReader(filename, SCHEMA).read())
+        self.assertEqual(6, len(read_sources))
+        self.assertEqual((10.0, 35.0, 30.0, 45.0), tuple(np.around(
+            [min(src.bounding_box[i] for src in read_sources)
+                for i in (0, 1)] +
+            [max(src.bounding_box[i] for src in read_sources)
+                for i in (2, 3)], 6)))
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks([200, 400],
+            ['stepp_analysis', 'SourceModelCatalogFilter'],
+            work_dir=self.tmp_dir)
+
+        self.assertEqual(4, len(results['results']))
+        self.assertEqual([200, 200, 400, 400],
+            [result['events'] for result in results['results']])
+        for result in results['results']:
+            self.assertEqual('ok', result['status'])
+            self.assertTrue(result['wall_time'] >= 0)
@@ -16,21 +16,31 @@
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
 
+import os
+import shutil
+import tempfile
 import unittest
 from mock import Mock, MagicMock
 
+import numpy as np
+
 from mtoolkit.workflow import (PipeLine, PreprocessingBuilder,
                                 ProcessingBuilder, Context)
 
 from mtoolkit.workflow import Workflow
 
+from mtoolkit.shared_catalogue import SharedCatalogue
+
+from mtoolkit.source_model import AreaSource, PointSource, SimpleFaultSource
+
 from mtoolkit.jobs import (read_eq_catalog, create_catalog_matrix,
                             gardner_knopoff, stepp, recurrence,
                             read_source_model, create_default_source_model,
                             create_default_values, create_selected_eq_vector,
                             store_preprocessed_catalog,
                             store_completeness_table,
-                            retrieve_completeness_table)
+                            retrieve_completeness_table, homogenisation,
+                            deduplication)
 
 from nrml.nrml_xml import get_data_path, DATA_DIR
 
@@ -179,6 +189,56 @@ class PipeLineBuilderTestCase(unittest.TestCase):
         self.assertEqual(expected_preprocessing_pipeline,
             pprocessing_built_pipeline)
 
+    def test_build_pipeline_with_homogenisation(self):
+        self.context_preprocessing.config['preprocessing_jobs'] = None
+        self.context_preprocessing.config['Homogenisation'] = {
+            'conversions': []}
+        expected_preprocessing_pipeline = PipeLine()
+        expected_preprocessing_pipeline.add_job(read_eq_catalog)
+        expected_preprocessing_pipeline.add_job(read_source_model)
+        expected_preprocessing_pipeline.add_job(homogenisation)
+        expected_preprocessing_pipeline.add_job(create_catalog_matrix)
+        expected_preprocessing_pipeline.add_job(create_default_values)
+        expected_preprocessing_pipeline.add_job(
+            retrieve_completeness_table)
+
+        pprocessing_built_pipeline = self.preprocessing_builder.build(
+            self.context_preprocessing.config)
+
+        self.assertEqual(expected_preprocessing_pipeline,
+            pprocessing_built_pipeline)
+
+    def test_build_pipeline_with_deduplication(self):
+        self.context_preprocessing.config['preprocessing_jobs'] = None
+        self.context_preprocessing.config['Homogenisation'] = {
+            'conversions': []}
+        self.context_preprocessing.config['Deduplication'] = {
+            'time_window': 60, 'distance_window': 50}
+        expected_preprocessing_pipeline = PipeLine()
+        expected_preprocessing_pipeline.add_job(read_eq_catalog)
+        expected_preprocessing_pipeline.add_job(read_source_model)
+        expected_preprocessing_pipeline.add_job(homogenisation)
+        expected_preprocessing_pipeline.add_job(deduplication)
+        expected_preprocessing_pipeline.add_job(create_catalog_matrix)
+        expected_preprocessing_pipeline.add_job(create_default_values)
+        expected_preprocessing_pipeline.add_job(
+            retrieve_completeness_table)
+
+        pprocessing_built_pipeline = self.preprocessing_builder.build(
+            self.context_preprocessing.config)
+
+        self.assertEqual(expected_preprocessing_pipeline,
+            pprocessing_built_pipeline)
+
+    def test_smoothed_seismicity_requires_recurrence(self):
+        config = self.context_processing.config
+        config['processing_jobs'] = ['SmoothedSeismicity', 'Recurrence']
+        self.assertRaises(RuntimeError, self.processing_builder.build,
+            config)
+
+        config['processing_jobs'] = ['Recurrence', 'SmoothedSeismicity']
+        self.assertEqual(2, len(self.processing_builder.build(config).jobs))
+
     def test_non_existent_job_raise_exception(self):
         invalid_job = 'comb a quail\'s hair'
         self.context_preprocessing.config['preprocessing_jobs'] = [invalid_job]
@@ -193,7 +253,7 @@ class PipeLineBuilderTestCase(unittest.TestCase):
     def test_workflow_execute_pipelines(self):
         context = Context()
         context.config['apply_processing_jobs'] = True
-        context.sm_definitions = None
+        context.sm_definitions = [AreaSource(), AreaSource()]
 
         pipeline_preprocessing = PipeLine(None)
         pipeline_preprocessing.run = Mock()
@@ -213,3 +273,64 @@ class PipeLineBuilderTestCase(unittest.TestCase):
         self.assertTrue(sm_filter.filter_eqs.called)
         self.assertTrue(pipeline_processing.run.called)
         self.assertEqual(2, pipeline_processing.run.call_count)
+
+    def test_only_area_sources_are_processed(self):
+        context = Context()
+        context.config['apply_processing_jobs'] = True
+        area_source = AreaSource()
+        context.sm_definitions = [PointSource(), area_source,
+                                  SimpleFaultSource()]
+
+        pipeline_processing = PipeLine(None)
+        pipeline_processing.run = Mock()
+        workflow = Workflow(PipeLine(None), pipeline_processing)
+
+        sm_filter = MagicMock()
+        sm_filter.filter_eqs.return_value.__iter__.return_value = \
+            iter([(area_source, [1])])
+
+        workflow.start(context, sm_filter)
+
+        sm_filter.filter_eqs.assert_called_with([area_source],
+            context.working_catalog)
+        self.assertEqual(1, pipeline_processing.run.call_count)
+        self.assertEqual(3, len(context.sm_definitions))
+
+    def test_metrics_are_written_when_a_job_fails(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        context = Context()
+        context.config['apply_processing_jobs'] = False
+        context.config['metrics_file'] = os.path.join(output_dir,
+                                                      'metrics.jsonl')
+
+        def failing_job(context):
+            raise RuntimeError('failed')
+
+        pipeline_preprocessing = PipeLine(None)
+        pipeline_preprocessing.add_job(failing_job)
+        workflow = Workflow(pipeline_preprocessing, PipeLine(None))
+
+        self.assertRaises(RuntimeError, workflow.start, context, Mock())
+        self.assertTrue(os.path.exists(context.config['metrics_file']))
+
+    def test_segments_created_before_the_workflow_are_kept(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        context = Context()
+        context.config['apply_processing_jobs'] = False
+        existing = SharedCatalogue.create(np.zeros((3, 7)),
+            directory=directory)
+        self.addCleanup(existing.close)
+        created = []
+
+        def sharing_job(context):
+            created.append(SharedCatalogue.create(np.zeros((3, 7)),
+                directory=directory))
+
+        pipeline_preprocessing = PipeLine(None)
+        pipeline_preprocessing.add_job(sharing_job)
+        Workflow(pipeline_preprocessing, PipeLine(None)).start(context, Mock())
+
+        self.assertTrue(os.path.exists(existing.name))
+        self.assertFalse(os.path.exists(created[0].name))